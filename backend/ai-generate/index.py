@@ -4,25 +4,7 @@ import base64
 import boto3
 import requests
 import uuid
-import time
-from typing import Dict, Tuple, Optional
-
-# In-memory rate limiting
-_rate_limit_store: Dict[str, list] = {}
-
-def check_rate_limit(identifier: str, max_req: int = 5, window: int = 300) -> Tuple[bool, Optional[int]]:
-    current = time.time()
-    if identifier not in _rate_limit_store:
-        _rate_limit_store[identifier] = []
-    
-    _rate_limit_store[identifier] = [t for t in _rate_limit_store[identifier] if current - t < window]
-    
-    if len(_rate_limit_store[identifier]) >= max_req:
-        oldest = _rate_limit_store[identifier][0]
-        return False, int(window - (current - oldest))
-    
-    _rate_limit_store[identifier].append(current)
-    return True, None
+from rate_limit_utils import check_rate_limit
 
 def handler(event, context):
     '''
@@ -65,8 +47,8 @@ def handler(event, context):
                 'isBase64Encoded': False
             }
         
-        # Rate limiting - 5 запросов в 5 минут (дорогая операция)
-        allowed, retry_after = check_rate_limit(f'ai:{user_id}', max_req=5, window=300)
+        # Rate limiting - 5 запросов в 5 минут (дорогая операция), у порога сверяется с БД
+        allowed, retry_after = check_rate_limit(f'ai:{user_id}', max_requests=5, window_seconds=300, mode='hybrid')
         
         if not allowed:
             return {
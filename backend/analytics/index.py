@@ -4,18 +4,71 @@ Backend функция для аналитики просмотров визит
 """
 
 import json
-import os
-from typing import Dict, Any
-import psycopg2
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from db_pool import get_connection, release_connection
+from view_buffer import flush_if_due, record_view
+from hll import HyperLogLog
+from query_batch import bytea_from_json, fetch_batch
+from datetime import date, datetime, timedelta
+
+# Длина периода, если передан только конец диапазона
+PERIOD_DEFAULT_DAYS = 30
+
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def period_query(card_id: str, period_from: Optional[date], period_to: Optional[date]) -> Tuple[str, tuple]:
+    """
+    Дневные агрегаты за период для fetch_batch; без периода - заглушка без строк
+    Границы по умолчанию считаются в БД от CURRENT_DATE, на том же снимке, что и хвост
+    """
+    if not (period_from or period_to):
+        return 'SELECT NULL WHERE FALSE', ()
+    return ("""
+        SELECT p.period_from, p.period_to, COALESCE(SUM(d.views), 0) AS views,
+               array_agg(d.visitor_sketch) FILTER (WHERE d.visitor_sketch IS NOT NULL) AS sketches
+        FROM (
+            SELECT COALESCE(%s::date, COALESCE(%s::date, CURRENT_DATE) - %s) AS period_from,
+                   COALESCE(%s::date, CURRENT_DATE) AS period_to
+        ) p
+        LEFT JOIN card_views_daily d ON d.card_id = %s AND d.day BETWEEN p.period_from AND p.period_to
+        GROUP BY p.period_from, p.period_to
+    """, (period_from, period_to, PERIOD_DEFAULT_DAYS - 1, period_to, card_id))
+
+
+def period_stats(period: Dict[str, Any], tail: List[tuple]) -> Dict[str, Any]:
+    """
+    Просмотры и уникальные посетители за период
+    Дневные скетчи сливаются одной операцией, поэтому стоимость O(дней), а не O(просмотров)
+    """
+    period_from = date.fromisoformat(period['period_from'])
+    period_to = date.fromisoformat(period['period_to'])
+    
+    visitors = HyperLogLog.merge_all(bytea_from_json(sketch) for sketch in period['sketches'] or [])
+    tail_in_period = [row for row in tail if row[0] and period_from <= row[0].date() <= period_to]
+    visitors.update(ip for _, ip in tail_in_period if ip)
+    
+    return {
+        'from': str(period_from),
+        'to': str(period_to),
+        'views': int(period['views']) + len(tail_in_period),
+        'unique_visitors': visitors.count()
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Обрабатывает запросы аналитики визиток.
     
     GET /analytics?card_id=123 - получить статистику визитки
+    GET /analytics?card_id=123&from=2024-01-01&to=2024-01-31 - плюс просмотры и уники за период
     POST /analytics - записать просмотр визитки
     """
+    # Просмотры, которые ждут в буфере дольше допустимого, уходят в БД до ответа
+    flush_if_due()
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -31,13 +84,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
-    cur = conn.cursor()
-    
-    try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            card_id = params.get('card_id')
+    # Просмотр попадает в буфер и пишется в БД пачкой, без соединения на запрос
+    if method == 'POST':
+        try:
+            body = json.loads(event.get('body', '{}'))
+            card_id = body.get('card_id')
             
             if not card_id:
                 return {
@@ -47,62 +98,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Получаем статистику просмотров
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_views,
-                    COUNT(DISTINCT viewer_ip) as unique_visitors,
-                    COUNT(DISTINCT DATE(viewed_at)) as days_active
-                FROM card_views 
-                WHERE card_id = %s
-            """, (card_id,))
-            stats = cur.fetchone()
+            # Извлекаем данные о просмотре
+            request_context = event.get('requestContext', {})
+            identity = request_context.get('identity', {})
+            headers = event.get('headers', {})
             
-            # Получаем последние просмотры
-            cur.execute("""
-                SELECT viewer_country, viewer_city, viewed_at, referer
-                FROM card_views 
-                WHERE card_id = %s 
-                ORDER BY viewed_at DESC 
-                LIMIT 10
-            """, (card_id,))
-            recent_views = cur.fetchall()
+            viewer_ip = identity.get('sourceIp', '')
+            user_agent = identity.get('userAgent', '')
+            referer = headers.get('Referer', headers.get('referer', ''))
             
-            # Просмотры по дням (последние 7 дней)
-            cur.execute("""
-                SELECT DATE(viewed_at) as date, COUNT(*) as views
-                FROM card_views 
-                WHERE card_id = %s AND viewed_at >= CURRENT_DATE - INTERVAL '7 days'
-                GROUP BY DATE(viewed_at)
-                ORDER BY date
-            """, (card_id,))
-            daily_views = cur.fetchall()
+            record_view(int(card_id), viewer_ip, user_agent, referer, datetime.now())
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'total_views': stats[0] or 0,
-                    'unique_visitors': stats[1] or 0,
-                    'days_active': stats[2] or 0,
-                    'recent_views': [
-                        {
-                            'country': v[0],
-                            'city': v[1],
-                            'timestamp': v[2].isoformat() if v[2] else None,
-                            'referer': v[3]
-                        } for v in recent_views
-                    ],
-                    'daily_views': [
-                        {'date': str(d[0]), 'views': d[1]} for d in daily_views
-                    ]
-                }),
+                'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
             }
-        
-        elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
-            card_id = body.get('card_id')
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+    
+    conn = get_connection()
+    cur = conn.cursor()
+    
+    try:
+        if method == 'GET':
+            params = event.get('queryStringParameters', {})
+            card_id = params.get('card_id')
             
             if not card_id:
                 return {
@@ -112,34 +139,97 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Извлекаем данные о просмотре
-            request_context = event.get('requestContext', {})
-            identity = request_context.get('identity', {})
-            headers = event.get('headers', {})
+            try:
+                period_from = parse_day(params.get('from'))
+                period_to = parse_day(params.get('to'))
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'from and to must be dates in YYYY-MM-DD format'}),
+                    'isBase64Encoded': False
+                }
             
-            viewer_ip = identity.get('sourceIp', '')
-            user_agent = identity.get('userAgent', '')
-            referer = headers.get('Referer', headers.get('referer', ''))
+            # Итоги, дневные агрегаты, хвост после границы свёртки, последние просмотры
+            # и агрегаты за период - за один запрос к БД и на одном снимке данных: иначе свёртка,
+            # закоммиченная между запросами, посчитала бы строки хвоста дважды
+            state_rows, daily_rows, tail_rows, recent_views, period_rows = fetch_batch(cur, [
+                ("""
+                    SELECT s.last_view_id, CURRENT_DATE AS today, t.views, t.days_active, t.visitor_sketch
+                    FROM card_views_rollup_state s
+                    LEFT JOIN card_view_totals t ON t.card_id = %s
+                    WHERE s.id = 1
+                """, (card_id,)),
+                ("""
+                    SELECT day, views
+                    FROM card_views_daily
+                    WHERE card_id = %s AND day >= CURRENT_DATE - 7
+                """, (card_id,)),
+                ("""
+                    SELECT viewed_at, viewer_ip
+                    FROM card_views
+                    WHERE card_id = %s
+                      AND id > (SELECT last_view_id FROM card_views_rollup_state WHERE id = 1)
+                """, (card_id,)),
+                ("""
+                    SELECT viewer_country, viewer_city, viewed_at, referer
+                    FROM card_views
+                    WHERE card_id = %s
+                    ORDER BY viewed_at DESC
+                    LIMIT 10
+                """, (card_id,)),
+                period_query(card_id, period_from, period_to)
+            ])
+            state = state_rows[0]
+            today = date.fromisoformat(state['today'])
+            week_start = today - timedelta(days=7)
+            daily = {date.fromisoformat(row['day']): row['views'] for row in daily_rows}
+            rolled_days_in_week = set(daily)
+            tail = [
+                (datetime.fromisoformat(row['viewed_at']) if row['viewed_at'] else None, row['viewer_ip'])
+                for row in tail_rows
+            ]
+            rolled_views, rolled_days = state['views'], state['days_active']
             
-            # Записываем просмотр
-            cur.execute("""
-                INSERT INTO card_views (card_id, viewer_ip, referer, user_agent, viewed_at)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (card_id, viewer_ip, referer, user_agent, datetime.now()))
+            visitors = HyperLogLog.from_bytes(bytea_from_json(state['visitor_sketch']))
+            visitors.update(viewer_ip for _, viewer_ip in tail if viewer_ip)
+            tail_days = set()
+            for viewed_at, _ in tail:
+                # Просмотр без даты учитывается в итогах, но ни в одном дне (как в свёртке)
+                day = viewed_at.date() if viewed_at else None
+                if day and day >= week_start:
+                    tail_days.add(day)
+                    daily[day] = daily.get(day, 0) + 1
             
-            # Обновляем счетчик просмотров визитки
-            cur.execute("""
-                UPDATE business_cards 
-                SET view_count = view_count + 1 
-                WHERE id = %s
-            """, (card_id,))
+            period = period_stats(period_rows[0], tail) if period_rows else None
             
-            conn.commit()
+            stats = (
+                (rolled_views or 0) + len(tail),
+                visitors.count(),
+                (rolled_days or 0) + len(tail_days - rolled_days_in_week)
+            )
+            daily_views = sorted(daily.items())
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True}),
+                'body': json.dumps({
+                    'total_views': stats[0] or 0,
+                    'unique_visitors': stats[1] or 0,
+                    'days_active': stats[2] or 0,
+                    'recent_views': [
+                        {
+                            'country': v['viewer_country'],
+                            'city': v['viewer_city'],
+                            'timestamp': v['viewed_at'],
+                            'referer': v['referer']
+                        } for v in recent_views
+                    ],
+                    'daily_views': [
+                        {'date': str(d[0]), 'views': d[1]} for d in daily_views
+                    ],
+                    'period': period
+                }),
                 'isBase64Encoded': False
             }
         
@@ -160,4 +250,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
@@ -3,7 +3,7 @@ import os
 import urllib.request
 import urllib.parse
 import jwt
-import psycopg2
+from db_pool import get_connection, release_connection
 from datetime import datetime, timedelta
 from typing import Dict, Any
 
@@ -136,7 +136,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             # Работа с БД
-            conn = psycopg2.connect(os.environ['DATABASE_URL'])
+            conn = get_connection()
             cur = conn.cursor()
             
             try:
@@ -193,7 +193,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             finally:
                 cur.close()
-                conn.close()
+                release_connection(conn)
         
         else:
             return {
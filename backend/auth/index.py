@@ -4,27 +4,10 @@ import re
 import bcrypt
 import hashlib
 import jwt
-import time
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, Optional
 import psycopg2
-
-# In-memory rate limiting
-_rate_limit_store: Dict[str, list] = {}
-
-def check_rate_limit(identifier: str, max_req: int = 5, window: int = 60) -> Tuple[bool, Optional[int]]:
-    current = time.time()
-    if identifier not in _rate_limit_store:
-        _rate_limit_store[identifier] = []
-    
-    _rate_limit_store[identifier] = [t for t in _rate_limit_store[identifier] if current - t < window]
-    
-    if len(_rate_limit_store[identifier]) >= max_req:
-        oldest = _rate_limit_store[identifier][0]
-        return False, int(window - (current - oldest))
-    
-    _rate_limit_store[identifier].append(current)
-    return True, None
+from db_pool import get_connection, release_connection
+from rate_limit_utils import check_rate_limit
 
 def handler(event, context):
     '''
@@ -55,9 +38,9 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    # Rate limiting по IP (10 запросов за 60 секунд для тестирования)
+    # Rate limiting по IP (10 запросов за 60 секунд для тестирования), общий для всех инстансов
     ip = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-    allowed, retry_after = check_rate_limit(f'auth:{ip}', max_req=10, window=60)
+    allowed, retry_after = check_rate_limit(f'auth:{ip}', max_requests=10, window_seconds=60, mode='strict')
     
     if not allowed:
         return {
@@ -78,7 +61,7 @@ def handler(event, context):
         body = json.loads(event.get('body', '{}'))
         action = body.get('action')
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor()
         
         if action == 'register':
@@ -159,7 +142,7 @@ def handler(event, context):
             jwt_secret = os.environ.get('JWT_SECRET')
             if not jwt_secret:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 500,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -186,7 +169,7 @@ def handler(event, context):
             
             if not email or not password:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 400,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -202,7 +185,7 @@ def handler(event, context):
             
             if not result:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 401,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -232,7 +215,7 @@ def handler(event, context):
             
             if not is_valid:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 401,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -245,7 +228,7 @@ def handler(event, context):
             jwt_secret = os.environ.get('JWT_SECRET')
             if not jwt_secret:
                 cur.close()
-                conn.close()
+                release_connection(conn)
                 return {
                     'statusCode': 500,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -310,5 +293,4 @@ def handler(event, context):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        release_connection(conn)
\ No newline at end of file
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк реестра шаблонов писем: стоимость рендера на одно письмо в пачке на 10k получателей
+
+Сравнивает прежний способ (большая f-строка на каждое письмо, с экранированием полей)
+с предкомпилированным шаблоном email_templates: только рендер HTML и полная сборка
+MIME-письма с HTML и текстовой частью, как перед отправкой. Если установлен Jinja2,
+для сравнения рендерится тот же HTML-шаблон через него (в функции он не входит).
+Запуск: python3 backend/benchmarks/email_templates_bench.py
+"""
+import html
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_templates import _sources, build_message, get_template
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+RECIPIENTS = 10_000
+RUNS = 5
+
+
+def inline_lead_html(lead):
+    """Прежний рендер: f-строка собирается заново для каждого письма"""
+    name = html.escape(lead['name'])
+    email = html.escape(lead['email'])
+    phone = html.escape(lead['phone'])
+    message = html.escape(lead['message'])
+    return f"""
+            <html>
+              <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
+                <div style="max-width: 600px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px;">
+                  <h1 style="color: #FFD700; margin-bottom: 20px;">
+                    <span style="font-size: 32px;">∞7</span> visitka.site
+                  </h1>
+                  <h2 style="color: #333;">Новая заявка с вашей визитки</h2>
+                  <div style="background: #f9f9f9; padding: 20px; border-radius: 5px; margin: 20px 0;">
+                    <p style="margin: 5px 0;"><strong>Имя:</strong> {name}</p>
+                    <p style="margin: 5px 0;"><strong>Email:</strong> {email}</p>
+                    <p style="margin: 5px 0;"><strong>Телефон:</strong> {phone}</p>
+                    <p style="margin: 5px 0;"><strong>Сообщение:</strong> {message}</p>
+                  </div>
+                  <a href="https://visitka.site/dashboard"
+                     style="display: inline-block; margin-top: 20px; padding: 12px 30px;
+                            background: #FFD700; color: black; text-decoration: none;
+                            border-radius: 5px; font-weight: bold;">
+                    Открыть заявки
+                  </a>
+                  <p style="color: #999; font-size: 14px; margin-top: 30px;">
+                    С уважением,<br>
+                    Команда visitka.site
+                  </p>
+                </div>
+              </body>
+            </html>
+            """
+
+
+def measure(func, leads) -> float:
+    """Лучшее время из RUNS прогонов по всей пачке, мкс на письмо"""
+    best = float('inf')
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        for lead in leads:
+            func(lead)
+        best = min(best, time.perf_counter() - began)
+    return best / len(leads) * 1_000_000
+
+
+def main() -> None:
+    leads = [
+        {
+            'name': f'Клиент <{i}>',
+            'email': f'client{i}@example.com',
+            'phone': f'+7 999 {i:07d}',
+            'message': f'Здравствуйте! Интересует визитка & QR-код №{i}'
+        }
+        for i in range(RECIPIENTS)
+    ]
+
+    began = time.perf_counter()
+    template = get_template('lead')
+    compile_ms = (time.perf_counter() - began) * 1000
+
+    inline = measure(inline_lead_html, leads)
+    compiled_html = measure(template.html.render, leads)
+    compiled_parts = measure(lambda lead: (template.html.render(lead), template.text.render(lead)), leads)
+    mime = measure(lambda lead: build_message('lead', lead, 'noreply@visitka.site', lead['email']).as_bytes(), leads)
+    rows = [
+        ('f-строка + html.escape (прежний)', inline),
+        ('шаблон, HTML', compiled_html),
+        ('шаблон, HTML + текст', compiled_parts),
+        ('шаблон + MIME-письмо (as_bytes)', mime),
+    ]
+    if jinja2 is not None:
+        jinja_html = jinja2.Environment(autoescape=True).from_string(_sources['lead'][1])
+        rows.insert(2, ('Jinja2, HTML', measure(jinja_html.render, leads)))
+
+    print(f'Пачка: {RECIPIENTS} писем, лучший из {RUNS} прогонов; компиляция шаблона: {compile_ms:.2f} мс один раз')
+    print(f"{'способ':<40} {'мкс/письмо':>11} {'пачка, мс':>10}")
+    for title, per_message in rows:
+        print(f'{title:<40} {per_message:>11.1f} {per_message * RECIPIENTS / 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Проверка компилятора шаблонов писем на граничных случаях
+
+Пустые ветки if/elif/else и тело for, вложенные блоки, текст с кавычками и фигурными
+скобками, ошибки синтаксиса (только TemplateError, а не исключения Python из exec)
+и рендер всех зарегистрированных писем на пустом контексте.
+Запуск: python3 backend/benchmarks/email_templates_check.py
+"""
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from email_templates import Template, TemplateError, _sources, render_email
+
+# (шаблон, контекст, ожидаемый результат)
+RENDER_CASES: List[Tuple[str, Dict[str, Any], str]] = [
+    ('{% if a %}{% else %}b{% endif %}', {}, 'b'),
+    ('{% if a %}{% else %}b{% endif %}', {'a': 1}, ''),
+    ('{% if a %}a{% elif b %}{% else %}c{% endif %}', {'b': 1}, ''),
+    ('{% if a %}{% elif b %}{% endif %}x', {}, 'x'),
+    ('{% if a %}{% endif %}', {'a': 1}, ''),
+    ('{% for item in items %}{% endfor %}end', {'items': [1, 2]}, 'end'),
+    ('{% for item in items %}{% if item %}{% endif %}{% endfor %}', {'items': [0, 1]}, ''),
+    ('{% for item in items %}{{ item }};{% endfor %}', {'items': ['<a>', 'b']}, '&lt;a&gt;;b;'),
+    ('{% if a %}A{% if b %}B{% else %}{% endif %}{% endif %}!', {'a': 1}, 'A!'),
+    ('{{ user.name }} {{ html|safe }}', {'user': {'name': '"Иван"'}, 'html': '<b>'}, '&quot;Иван&quot; <b>'),
+    ('{b} {{ a }} \'"\\\n', {'a': 1}, '{b} 1 \'"\\\n'),
+    ('', {}, ''),
+]
+
+SYNTAX_ERRORS = [
+    '{% if a %}',
+    '{% for item in items %}',
+    '{% endif %}',
+    '{% else %}',
+    '{% if a %}{% endfor %}',
+    '{% for 1 in items %}{% endfor %}',
+    '{% if a b %}{% endif %}',
+    '{{ a|upper }}',
+    '{{ a + b }}',
+]
+
+
+def main() -> None:
+    failures = []
+
+    for source, context, expected in RENDER_CASES:
+        try:
+            result = Template(source).render(context)
+        except Exception as e:
+            result = f'{type(e).__name__}: {e}'
+        ok = result == expected
+        print(f"{'OK  ' if ok else 'FAIL'} render {source!r}")
+        if not ok:
+            failures.append(f'{source!r}: {result!r} != {expected!r}')
+
+    for source in SYNTAX_ERRORS:
+        try:
+            Template(source)
+            error = 'no error'
+        except TemplateError:
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        print(f"{'OK  ' if error is None else 'FAIL'} error  {source!r}")
+        if error is not None:
+            failures.append(f'{source!r}: {error}')
+
+    for name in sorted(_sources):
+        try:
+            render_email(name, {})
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        print(f"{'OK  ' if error is None else 'FAIL'} email  {name}")
+        if error is not None:
+            failures.append(f'{name}: {error}')
+
+    if failures:
+        sys.exit('Ошибки:\n' + '\n'.join(failures))
+    print('Все проверки шаблонов пройдены')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов функций (индексы из V0012 и V0014)
+
+Заполняет таблицы синтетическими данными, собирает статистику и через EXPLAIN проверяет,
+что каждый запрос читает таблицу по индексу, а не последовательным сканированием.
+Всё выполняется в одной транзакции с откатом, данные в БД не остаются.
+Запуск: DATABASE_URL=postgresql://... python3 backend/benchmarks/explain_indexes.py
+"""
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_pool import get_connection, release_connection
+
+SCHEMA = 't_p18253922_infinite_business_ca'
+USERS = 20_000
+CARDS = 20_000
+VIEWS = 200_000
+LEADS = 50_000
+PAYMENTS = 20_000
+ACTIVE_CARDS = 2_000
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+SEED_SQL = f"""
+INSERT INTO users (email, password_hash, name, created_at)
+SELECT 'explain-' || n || '@example.invalid', 'x', 'User ' || n, NOW() - n * INTERVAL '1 minute'
+FROM generate_series(1, {USERS}) AS n;
+
+CREATE TEMP TABLE explain_users ON COMMIT DROP AS
+SELECT id, row_number() OVER (ORDER BY id) AS n FROM users WHERE email LIKE 'explain-%@example.invalid';
+
+UPDATE users u SET referred_by = r.id
+FROM explain_users eu JOIN explain_users r ON r.n = eu.n % 500 + 1
+WHERE u.id = eu.id AND eu.n % 2 = 0;
+
+INSERT INTO business_cards (user_id, name, short_url, is_public)
+SELECT eu.id, 'Card ' || eu.n, 'xpl' || eu.n, eu.n % 10 <> 0
+FROM explain_users eu WHERE eu.n <= {CARDS};
+
+CREATE TEMP TABLE explain_cards ON COMMIT DROP AS
+SELECT id, row_number() OVER (ORDER BY id) AS n FROM business_cards WHERE short_url LIKE 'xpl%';
+
+INSERT INTO card_views (card_id, viewer_ip, referer, viewed_at)
+SELECT c.id, '10.0.' || (g.i % 256) || '.' || (g.i / 256 % 256), NULL, NOW() - g.i * INTERVAL '1 second'
+FROM generate_series(1, {VIEWS}) AS g(i)
+JOIN explain_cards c ON c.n = g.i % {ACTIVE_CARDS} + 1;
+
+INSERT INTO card_leads (card_id, name, email, is_read, created_at)
+SELECT c.id, 'Lead ' || g.i, 'lead-' || g.i || '@example.invalid', g.i % 10 <> 0, NOW() - g.i * INTERVAL '1 minute'
+FROM generate_series(1, {LEADS}) AS g(i)
+JOIN explain_cards c ON c.n = g.i % {ACTIVE_CARDS} + 1;
+
+INSERT INTO referrals (user_id, referral_code, referred_user_id, reward_granted, created_at)
+SELECT eu.id, 'XPL' || eu.n, r.id, eu.n % 3 = 0, NOW() - eu.n * INTERVAL '1 minute'
+FROM explain_users eu JOIN explain_users r ON r.n = eu.n % 500 + 1;
+
+INSERT INTO payments (user_id, amount, payment_type, payment_provider, provider_payment_id, status)
+SELECT eu.id, 990, 'subscription', 'yookassa', 'xpl-' || eu.n, 'succeeded'
+FROM explain_users eu WHERE eu.n <= {PAYMENTS};
+
+ANALYZE users;
+ANALYZE business_cards;
+ANALYZE card_views;
+ANALYZE card_leads;
+ANALYZE referrals;
+ANALYZE payments;
+"""
+
+# (функция, таблица, запрос как в обработчике, параметры)
+QUERIES: List[Tuple[str, str, str, Tuple]] = [
+    (
+        'analytics: последние просмотры', 'card_views',
+        """
+        SELECT viewer_country, viewer_city, viewed_at, referer
+        FROM card_views
+        WHERE card_id = %s
+        ORDER BY viewed_at DESC
+        LIMIT 10
+        """,
+        ('card',)
+    ),
+    (
+        'analytics: хвост после свёртки', 'card_views',
+        """
+        SELECT viewed_at, viewer_ip
+        FROM card_views
+        WHERE card_id = %s AND id > %s
+        """,
+        ('card', 'last_view_id')
+    ),
+    (
+        'short-urls: визитка по коду', 'business_cards',
+        """
+        SELECT id, name, position, company, phone, email, website, description, logo_url
+        FROM business_cards
+        WHERE short_url = %s AND is_public = true
+        """,
+        ('short_code',)
+    ),
+    (
+        'referral-stats: приглашённые', 'users',
+        """
+        SELECT id, email, created_at
+        FROM users
+        WHERE referred_by = %s
+        ORDER BY created_at DESC
+        """,
+        ('user',)
+    ),
+    (
+        'referrals: код пользователя', 'referrals',
+        'SELECT referral_code FROM referrals WHERE user_id = %s LIMIT 1',
+        ('user',)
+    ),
+    (
+        'referrals: статистика', 'referrals',
+        """
+        SELECT COUNT(*) as total_referrals,
+               COUNT(CASE WHEN reward_granted = true THEN 1 END) as rewarded
+        FROM referrals
+        WHERE user_id = %s AND referred_user_id IS NOT NULL
+        """,
+        ('user',)
+    ),
+    (
+        'referrals: последние приглашённые', 'referrals',
+        """
+        SELECT u.full_name, r.created_at, r.reward_granted
+        FROM referrals r
+        JOIN users u ON r.referred_user_id = u.id
+        WHERE r.user_id = %s
+        ORDER BY r.created_at DESC
+        LIMIT 10
+        """,
+        ('user',)
+    ),
+    (
+        'referrals: владелец кода', 'referrals',
+        'SELECT user_id FROM referrals WHERE referral_code = %s LIMIT 1',
+        ('referral_code',)
+    ),
+    (
+        'leads: страница лидов', 'card_leads',
+        """
+        SELECT * FROM card_leads
+        WHERE card_id = %s
+          AND (created_at, id) < (NOW(), 2147483647)
+        ORDER BY created_at DESC, id DESC
+        LIMIT 51
+        """,
+        ('card',)
+    ),
+    (
+        'leads: страница непрочитанных', 'card_leads',
+        """
+        SELECT * FROM card_leads
+        WHERE card_id = %s AND is_read = FALSE
+        ORDER BY created_at DESC, id DESC
+        LIMIT 51
+        """,
+        ('card',)
+    ),
+    (
+        'payments: платёж провайдера', 'payments',
+        'SELECT id, user_id, status FROM payments WHERE provider_payment_id = %s',
+        ('provider_payment_id',)
+    ),
+]
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def index_names(scans: List[Dict[str, Any]]) -> set:
+    # У Bitmap Heap Scan имя индекса хранится в дочерних Bitmap Index Scan
+    return {
+        node['Index Name']
+        for scan in scans
+        for node in plan_nodes(scan)
+        if 'Index Name' in node
+    }
+
+
+def sample_params(cur) -> Dict[str, Any]:
+    cur.execute("SELECT id FROM explain_cards WHERE n = 1")
+    card_id = cur.fetchone()[0]
+    cur.execute("SELECT id FROM explain_users WHERE n = 1")
+    user_id = cur.fetchone()[0]
+    cur.execute("SELECT MAX(id) - 100 FROM card_views")
+    return {
+        'card': card_id,
+        'last_view_id': cur.fetchone()[0],
+        'short_code': 'xpl1',
+        'user': user_id,
+        'referral_code': 'XPL1',
+        'provider_payment_id': 'xpl-1',
+    }
+
+
+def main() -> None:
+    conn = get_connection()
+    failures = []
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SET LOCAL search_path TO {SCHEMA}, public")
+        cur.execute(SEED_SQL)
+        params = sample_params(cur)
+
+        for label, table, sql, names in QUERIES:
+            cur.execute('EXPLAIN (FORMAT JSON) ' + sql, tuple(params[name] for name in names))
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = [node for node in plan_nodes(plan[0]['Plan']) if node.get('Relation Name') == table]
+            scans = [node for node in nodes if node['Node Type'] in INDEX_SCANS]
+            ok = bool(scans) and all(node['Node Type'] in INDEX_SCANS for node in nodes)
+            used = ', '.join(sorted(index_names(scans))) or 'Seq Scan'
+            print(f"{'OK  ' if ok else 'FAIL'} {label:<36} {table:<15} {used}")
+            if not ok:
+                failures.append(label)
+    finally:
+        conn.rollback()
+        release_connection(conn)
+
+    if failures:
+        sys.exit(f'Без индекса: {", ".join(failures)}')
+    print(f'Все {len(QUERIES)} запросов используют индексы')
+
+
+if __name__ == '__main__':
+    main()
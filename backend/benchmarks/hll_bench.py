@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Точность и скорость HyperLogLog-скетча уникальных посетителей
+
+Проверяет, что оценка укладывается в документированную границу ошибки (3 стандартные
+ошибки, ~7%), и замеряет добавление, слияние и подсчёт.
+Запуск: python3 backend/benchmarks/hll_bench.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from hll import HLL_STANDARD_ERROR, HyperLogLog
+
+CARDINALITIES = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+DAYS = 365
+VISITORS_PER_DAY = 2_000
+ERROR_BOUND = 3 * HLL_STANDARD_ERROR
+
+
+def visitors(start: int, count: int):
+    return [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}:{i}' for i in range(start, start + count)]
+
+
+def check_accuracy() -> None:
+    print(f'Граница ошибки: {ERROR_BOUND:.1%} (стандартная ошибка {HLL_STANDARD_ERROR:.2%})')
+    for cardinality in CARDINALITIES:
+        estimate = HyperLogLog().update(visitors(0, cardinality)).count()
+        error = abs(estimate - cardinality) / cardinality
+        print(f'  {cardinality:>9}: оценка {estimate:>9}, ошибка {error:6.2%}')
+        assert error <= ERROR_BOUND, f'{cardinality}: ошибка {error:.2%} больше {ERROR_BOUND:.2%}'
+
+    # Слияние скетчей по дням с пересечением посетителей должно давать оценку объединения
+    days = [HyperLogLog().update(visitors(day * 500, VISITORS_PER_DAY)).to_bytes() for day in range(30)]
+    exact = 29 * 500 + VISITORS_PER_DAY
+    estimate = HyperLogLog.merge_all(days).count()
+    error = abs(estimate - exact) / exact
+    print(f'  30 дней с пересечением: точно {exact}, оценка {estimate}, ошибка {error:.2%}')
+    assert error <= ERROR_BOUND
+
+
+def timed(label: str, count: int, func) -> None:
+    began = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - began
+    print(f'  {label:<36} {elapsed * 1e6 / count:>8.2f} мкс/оп')
+
+
+def check_speed() -> None:
+    values = visitors(0, 100_000)
+    sketches = [HyperLogLog().update(visitors(day * 100, VISITORS_PER_DAY)).to_bytes() for day in range(DAYS)]
+
+    print('Скорость:')
+    sketch = HyperLogLog()
+    timed('add (по одному)', len(values), lambda: [sketch.add(value) for value in values])
+    timed('update (векторно)', len(values), lambda: HyperLogLog().update(values))
+
+    def merge_pairwise():
+        result = HyperLogLog()
+        for data in sketches:
+            result.merge(HyperLogLog.from_bytes(data))
+
+    timed(f'merge попарно ({DAYS} дней)', DAYS, merge_pairwise)
+    timed(f'merge_all ({DAYS} дней)', DAYS, lambda: HyperLogLog.merge_all(sketches))
+    timed('count', 1000, lambda: [sketch.count() for _ in range(1000)])
+
+
+if __name__ == '__main__':
+    check_accuracy()
+    check_speed()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк отрисовки QR-кодов: рендеров в секунду для каждого формата
+
+Сравнивает прежний способ (qrcode + PIL, make_image и PNG-кодирование Pillow) с qr_render:
+расчёт матрицы отдельно, PNG разных размеров и SVG из готовой матрицы, и полный набор
+файлов визитки (PNG 4, 10, 30 и SVG) из одной матрицы.
+Запуск: python3 backend/benchmarks/qr_render_bench.py
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import qrcode
+
+from qr_render import matrix_to_png, matrix_to_svg, qr_matrix, render_variants
+
+URLS = [f'https://visitka.site/card/{i}' for i in range(200)]
+RUNS = 3
+
+
+def pil_png(url: str, box_size: int = 10) -> bytes:
+    """Прежний рендер: qrcode рисует модули в PIL-изображение, Pillow кодирует PNG"""
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=box_size, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    buffer = io.BytesIO()
+    qr.make_image(fill_color='black', back_color='white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def measure(func, items) -> float:
+    """Лучший из RUNS прогонов, рендеров в секунду"""
+    best = float('inf')
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - began)
+    return len(items) / best
+
+
+def main() -> None:
+    matrices = [qr_matrix(url) for url in URLS]
+    variants = [('png', 4), ('png', 10), ('png', 30), ('svg', 0)]
+
+    results = [
+        ('PIL, PNG 10 (прежний)', measure(pil_png, URLS)),
+        ('PIL, PNG 30', measure(lambda url: pil_png(url, 30), URLS)),
+        ('матрица qrcode', measure(qr_matrix, URLS)),
+        ('из матрицы: PNG 4', measure(lambda m: matrix_to_png(m, 4), matrices)),
+        ('из матрицы: PNG 10', measure(lambda m: matrix_to_png(m, 10), matrices)),
+        ('из матрицы: PNG 30', measure(lambda m: matrix_to_png(m, 30), matrices)),
+        ('из матрицы: SVG', measure(matrix_to_svg, matrices)),
+        ('URL -> PNG 10', measure(lambda url: render_variants(url, 'H', 'black', 'white', variants[1:2]), URLS)),
+        ('URL -> PNG 4/10/30 + SVG', measure(lambda url: render_variants(url, 'H', 'black', 'white', variants), URLS)),
+    ]
+
+    print(f'{len(URLS)} URL, лучший из {RUNS} прогонов; ECC H, поле 4 модуля')
+    print(f"{'рендер':<32} {'в секунду':>10} {'мс':>8}")
+    for title, per_second in results:
+        print(f'{title:<32} {per_second:>10.0f} {1000 / per_second:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
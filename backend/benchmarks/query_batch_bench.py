@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк query_batch: последовательные запросы против одного batch-запроса при сетевой задержке
+
+Между клиентом и Postgres поднимается TCP-прокси, который задерживает каждый пакет
+на DELAY_MS в каждую сторону, как до БД в другой зоне. Запросы - те же, что в GET
+функций analytics, quiz-analytics, leads и referrals.
+Запуск: DATABASE_URL=postgresql://... python3 backend/benchmarks/query_batch_bench.py
+"""
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from query_batch import fetch_batch
+
+DELAY_MS = float(os.environ.get('BENCH_DELAY_MS', '5'))
+RUNS = 30
+
+HANDLERS = {
+    'analytics': [
+        ("""SELECT s.last_view_id, CURRENT_DATE AS today, t.views, t.days_active, t.visitor_sketch
+            FROM card_views_rollup_state s LEFT JOIN card_view_totals t ON t.card_id = %s
+            WHERE s.id = 1""", (1,)),
+        ("SELECT day, views FROM card_views_daily WHERE card_id = %s AND day >= CURRENT_DATE - 7", (1,)),
+        ("""SELECT viewed_at, viewer_ip FROM card_views
+            WHERE card_id = %s AND id > (SELECT last_view_id FROM card_views_rollup_state WHERE id = 1)""", (1,)),
+        ("""SELECT viewer_country, viewer_city, viewed_at, referer FROM card_views
+            WHERE card_id = %s ORDER BY viewed_at DESC LIMIT 10""", (1,)),
+    ],
+    'quiz-analytics': [
+        ("""SELECT video_title, COUNT(*) as total_sessions,
+                   AVG(correct_answers::float / total_questions * 100) as avg_score
+            FROM quiz_sessions GROUP BY video_title ORDER BY total_sessions DESC""", ()),
+        ("""SELECT question_text, COUNT(*) as total_answers FROM quiz_answers
+            GROUP BY question_text ORDER BY total_answers LIMIT 10""", ()),
+        ("SELECT COUNT(*) as total_sessions FROM quiz_sessions", ()),
+    ],
+    'leads': [
+        ("SELECT id FROM business_cards WHERE id = %s AND user_id = %s", (1, 1)),
+        ("SELECT * FROM card_leads WHERE card_id = %s ORDER BY created_at DESC", (1,)),
+        ("SELECT COUNT(*) as unread_count FROM card_leads WHERE card_id = %s AND is_read = FALSE", (1,)),
+    ],
+    'referrals': [
+        ("SELECT referral_code FROM referrals WHERE user_id = %s LIMIT 1", (1,)),
+        ("""SELECT COUNT(*) as total_referrals FROM referrals
+            WHERE user_id = %s AND referred_user_id IS NOT NULL""", (1,)),
+        ("""SELECT u.full_name, r.created_at, r.reward_granted FROM referrals r
+            JOIN users u ON r.referred_user_id = u.id
+            WHERE r.user_id = %s ORDER BY r.created_at DESC LIMIT 10""", (1,)),
+    ],
+}
+
+
+def _pump(source: socket.socket, target: socket.socket) -> None:
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            time.sleep(DELAY_MS / 1000)
+            target.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (source, target):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start_delay_proxy(host: str, port: int) -> int:
+    """TCP-прокси до Postgres с задержкой; возвращает локальный порт"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+
+    def accept_loop():
+        while True:
+            client, _ = server.accept()
+            if host.startswith('/'):
+                upstream = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                upstream.connect(os.path.join(host, f'.s.PGSQL.{port}'))
+            else:
+                upstream = socket.create_connection((host, port))
+            for source, target in ((client, upstream), (upstream, client)):
+                threading.Thread(target=_pump, args=(source, target), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def measure(func) -> float:
+    timings = []
+    for _ in range(RUNS):
+        began = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - began)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    params = parse_dsn(os.environ['DATABASE_URL'])
+    proxy_port = start_delay_proxy(params.get('host') or 'localhost', int(params.get('port') or 5432))
+    params.update(host='127.0.0.1', port=str(proxy_port), sslmode='disable')
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    print(f'Задержка сети: {DELAY_MS:.0f} мс в каждую сторону, медиана из {RUNS} запусков')
+    print(f"{'функция':<16} {'запросов':>8} {'по очереди, мс':>15} {'batch, мс':>10}")
+    for name, queries in HANDLERS.items():
+        def sequential():
+            for sql, query_params in queries:
+                cur.execute(sql, query_params)
+                cur.fetchall()
+
+        before = measure(sequential)
+        after = measure(lambda: fetch_batch(cur, queries))
+        print(f'{name:<16} {len(queries):>8} {before:>15.1f} {after:>10.1f}')
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
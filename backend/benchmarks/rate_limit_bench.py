@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк rate limiter: стоимость вызова и память на миллионе уникальных ключей
+
+Запуск: python3 backend/benchmarks/rate_limit_bench.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rate_limit_utils import RateLimiter
+
+TOTAL_KEYS = 1_000_000
+MAX_KEYS = 100_000
+BATCH = 100_000
+
+
+def fill(limiter: RateLimiter, start: int, now: float) -> float:
+    began = time.perf_counter()
+    for i in range(start, start + BATCH):
+        limiter.hit(f'ip:{i}', max_requests=10, window_seconds=60, now=now)
+    return (time.perf_counter() - began) / BATCH
+
+
+def main() -> None:
+    now = time.time()
+
+    # Стоимость вызова не должна расти с числом увиденных ключей
+    limiter = RateLimiter(max_keys=MAX_KEYS)
+    print(f"{'ключей':>10} {'нс/вызов':>10} {'записей':>10}")
+    for start in range(0, TOTAL_KEYS, BATCH):
+        per_call = fill(limiter, start, now)
+        print(f'{start + BATCH:>10} {per_call * 1e9:>10.0f} {len(limiter):>10}')
+
+    # Память ограничена max_keys, а не числом уникальных идентификаторов
+    limiter = RateLimiter(max_keys=MAX_KEYS)
+    tracemalloc.start()
+    for start in range(0, TOTAL_KEYS, BATCH):
+        fill(limiter, start, now)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'Память после {TOTAL_KEYS} ключей: {current / 1024 / 1024:.1f} МБ, '
+          f'пик {peak / 1024 / 1024:.1f} МБ (лимит {MAX_KEYS} ключей)')
+
+    # Один горячий ключ: сначала разрешено 10 запросов, затем отказ
+    decisions = [limiter.hit('hot', 10, 60, now=now).allowed for _ in range(12)]
+    assert decisions == [True] * 10 + [False] * 2, decisions
+    assert limiter.hit('hot', 10, 60, now=now + 6).allowed
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Проверка прямой загрузки upload-image: presign -> PUT/POST в хранилище -> complete
+
+Поднимает локальный S3 (moto_server из moto[server]) и направляет в него функцию через
+S3_ENDPOINT_URL; если S3_ENDPOINT_URL уже задан (например, MinIO), используется он.
+Пользователь и визитка для проверки создаются в БД и удаляются вместе с записями media_assets.
+
+Ограничение content-length-range исполняет хранилище: MinIO и S3 отклоняют слишком
+большой файл сами, moto политику не проверяет - тогда большой файл должен отклонить
+complete (413 и удаление объекта). С внешним S3_ENDPOINT_URL требуется отказ хранилища.
+Запуск: DATABASE_URL=postgresql://... python3 backend/benchmarks/upload_image_presign_check.py
+"""
+import base64
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+import boto3
+import jwt
+import requests
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from db_pool import get_connection, release_connection
+
+SCHEMA = 't_p18253922_infinite_business_ca'
+# PNG 1x1 и начало JPEG - достаточно для проверки сигнатуры в complete
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 60
+
+failures: List[str] = []
+
+
+def check(label: str, ok: bool, detail: Any = '') -> None:
+    print(f"{'OK  ' if ok else 'FAIL'} {label}{'' if ok else f': {detail}'}")
+    if not ok:
+        failures.append(label)
+
+
+def start_moto() -> subprocess.Popen:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'moto.server', '-p', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    os.environ['S3_ENDPOINT_URL'] = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(os.environ['S3_ENDPOINT_URL'], timeout=1)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit('moto_server не запустился')
+
+
+def load_upload_image():
+    spec = importlib.util.spec_from_file_location('upload_image', os.path.join(BACKEND_DIR, 'upload-image', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def call(module, action: str, user_id: int, body: Dict[str, Any]) -> Dict[str, Any]:
+    token = jwt.encode({'user_id': user_id, 'exp': int(time.time()) + 600}, os.environ['JWT_SECRET'], algorithm='HS256')
+    response = module.handler({
+        'httpMethod': 'POST',
+        'headers': {'X-Auth-Token': token},
+        'queryStringParameters': {'action': action},
+        'body': json.dumps(body)
+    }, None)
+    return {'status': response['statusCode'], **json.loads(response['body'])}
+
+
+def presign(module, user_id: int, content_type: str, size: int, kind: str = 'avatar') -> Dict[str, Any]:
+    response = call(module, 'presign', user_id, {'kind': kind, 'content_type': content_type, 'size': size})
+    if response['status'] != 200:
+        sys.exit(f'presign не выдал URL: {response}')
+    return response
+
+
+def post_upload(upload: Dict[str, Any], data: bytes) -> int:
+    post = upload['post']
+    return requests.post(post['url'], data=post['fields'], files={'file': ('upload', data)}).status_code
+
+
+def object_exists(s3, key: str) -> bool:
+    try:
+        s3.head_object(Bucket='files', Key=key)
+        return True
+    except ClientError:
+        return False
+
+
+def asset_row(file_url: str) -> Optional[tuple]:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT id, card_id, user_id, file_type, file_size FROM {SCHEMA}.media_assets WHERE file_url = %s",
+                (file_url,)
+            )
+            return cur.fetchone()
+    finally:
+        release_connection(conn)
+
+
+def seed_owner() -> tuple:
+    """Два пользователя и визитка первого; возвращает (user_id, other_user_id, card_id)"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            ids = []
+            for _ in range(2):
+                cur.execute(
+                    f"INSERT INTO {SCHEMA}.users (email, password_hash, name) VALUES (%s, 'x', 'Upload check') RETURNING id",
+                    (f'upload-check-{uuid.uuid4()}@example.invalid',)
+                )
+                ids.append(cur.fetchone()[0])
+            cur.execute(
+                f"INSERT INTO {SCHEMA}.business_cards (user_id, name) VALUES (%s, 'Upload check') RETURNING id",
+                (ids[0],)
+            )
+            card_id = cur.fetchone()[0]
+        conn.commit()
+        return ids[0], ids[1], card_id
+    finally:
+        release_connection(conn)
+
+
+def cleanup(user_ids: List[int], card_id: int) -> None:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {SCHEMA}.media_assets WHERE user_id = ANY(%s)", (user_ids,))
+            cur.execute(f"DELETE FROM {SCHEMA}.business_cards WHERE id = %s", (card_id,))
+            cur.execute(f"DELETE FROM {SCHEMA}.users WHERE id = ANY(%s)", (user_ids,))
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+
+def run_checks(upload_image, s3, user_id: int, other_user_id: int, card_id: int, external: bool) -> None:
+    max_bytes = upload_image.UPLOAD_MAX_BYTES
+
+    # PUT по подписанному URL, затем complete и повторный complete
+    upload = presign(upload_image, user_id, 'image/png', len(PNG))
+    status = requests.put(upload['put']['url'], data=PNG, headers=upload['put']['headers']).status_code
+    check('PUT: загрузка по подписанному URL', status == 200, status)
+    done = call(upload_image, 'complete', user_id, {'key': upload['key']})
+    row = asset_row(upload['url'])
+    check('PUT: complete записывает media_assets', done['status'] == 200 and row is not None
+          and row[0] == done.get('id') and row[2:] == (user_id, 'image/png', len(PNG)), (done, row))
+    again = call(upload_image, 'complete', user_id, {'key': upload['key'], 'card_id': card_id})
+    check('PUT: повторный complete возвращает тот же id', again['status'] == 200 and again.get('id') == done.get('id'), again)
+
+    # POST формой с политикой
+    upload = presign(upload_image, user_id, 'image/jpeg', len(JPEG), kind='logo')
+    policy = json.loads(base64.b64decode(upload['post']['fields']['policy']))
+    check('POST: политика с content-length-range', ['content-length-range', 1, max_bytes] in policy['conditions'], policy)
+    status = post_upload(upload, JPEG)
+    check('POST: загрузка формой', status in (200, 201, 204), status)
+    done = call(upload_image, 'complete', user_id, {'key': upload['key'], 'card_id': card_id})
+    row = asset_row(upload['url'])
+    check('POST: complete записывает media_assets с визиткой', done['status'] == 200 and row is not None
+          and row[1:] == (card_id, user_id, 'image/jpeg', len(JPEG)), (done, row))
+
+    # Больше UPLOAD_MAX_BYTES: отказ хранилища по политике или, если оно её не проверяет, complete
+    upload = presign(upload_image, user_id, 'image/png', 1)
+    oversized = PNG + b'\x00' * (max_bytes + 1 - len(PNG))
+    status = post_upload(upload, oversized)
+    if status >= 400:
+        check('POST: больше content-length-range отклонён хранилищем', not object_exists(s3, upload['key']), status)
+    else:
+        if external:
+            check('POST: больше content-length-range отклонён хранилищем', False, f'хранилище приняло файл ({status})')
+        else:
+            print('---- moto не проверяет политику POST, лимит проверяет complete')
+        done = call(upload_image, 'complete', user_id, {'key': upload['key']})
+        check('POST: больше лимита - complete отвечает 413 и удаляет объект',
+              done['status'] == 413 and not object_exists(s3, upload['key']) and asset_row(upload['url']) is None, done)
+
+    # Не изображение: 415 и объект удалён
+    upload = presign(upload_image, user_id, 'image/png', 64)
+    post_upload(upload, b'not an image at all')
+    done = call(upload_image, 'complete', user_id, {'key': upload['key']})
+    check('не изображение: 415 и удаление объекта',
+          done['status'] == 415 and not object_exists(s3, upload['key']) and asset_row(upload['url']) is None, done)
+
+    # Ключ другого пользователя
+    upload = presign(upload_image, user_id, 'image/png', len(PNG))
+    requests.put(upload['put']['url'], data=PNG, headers=upload['put']['headers'])
+    done = call(upload_image, 'complete', other_user_id, {'key': upload['key']})
+    check('ключ другого пользователя: 400', done['status'] == 400 and asset_row(upload['url']) is None, done)
+
+
+def main() -> None:
+    if 'DATABASE_URL' not in os.environ:
+        sys.exit('Нужен DATABASE_URL с применёнными миграциями')
+    os.environ.setdefault('JWT_SECRET', 'upload-image-presign-check-local-secret')
+    os.environ['JWT_REVOCATION_CHECK'] = 'false'
+
+    external = 'S3_ENDPOINT_URL' in os.environ
+    server = None
+    if not external:
+        os.environ.update(AWS_ACCESS_KEY_ID='check', AWS_SECRET_ACCESS_KEY='check')
+        server = start_moto()
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    s3 = boto3.client(
+        's3',
+        endpoint_url=os.environ['S3_ENDPOINT_URL'],
+        config=Config(signature_version='s3v4', s3={'addressing_style': 'path'})
+    )
+    try:
+        s3.create_bucket(Bucket='files')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('BucketAlreadyOwnedByYou', 'BucketAlreadyExists'):
+            raise
+
+    user_id, other_user_id, card_id = seed_owner()
+    try:
+        run_checks(load_upload_image(), s3, user_id, other_user_id, card_id, external)
+    finally:
+        cleanup([user_id, other_user_id], card_id)
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if failures:
+        sys.exit(f'Не прошли: {", ".join(failures)}')
+    print(f"Прямая загрузка работает ({'внешнее хранилище' if external else 'moto_server'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти upload-image: прирост пикового RSS на одну загрузку по размерам изображения
+
+Сравнивает прежний путь (json.loads, base64.b64decode всего изображения, put_object)
+с текущим handler: декодирование кусками в заранее выделенный буфер, а крупнее
+MULTIPART_THRESHOLD - потоковая multipart-загрузка с одним буфером на часть.
+Хранилище заменено приёмником, который только читает тело запроса, поэтому в замер
+попадает память функции, а не сети. Каждый замер - отдельный процесс с фиксированным
+порогом mmap в glibc, чтобы освобождённая память прошлых прогонов не занижала пик;
+пик сбрасывается перед загрузкой через /proc/self/clear_refs (Linux).
+Запуск: python3 backend/benchmarks/upload_image_rss_bench.py
+"""
+import base64
+import gc
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+SIZES_MB = (1, 4, 8, 10)
+
+
+class SinkStorage:
+    """Приёмник вместо S3: принимает тело запроса и запоминает объём"""
+
+    def __init__(self):
+        self.received = 0
+
+    def put_object(self, Body, **kwargs):
+        self.received += len(Body)
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'bench'}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        self.received += len(Body)
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def abort_multipart_upload(self, **kwargs):
+        pass
+
+
+def legacy_upload(event, s3) -> None:
+    """Прежний путь: три копии изображения в памяти одновременно"""
+    body_data = json.loads(event.get('body', '{}'))
+    image_data = base64.b64decode(body_data.get('image', ''))
+    s3.put_object(Bucket='files', Key='avatars/bench.jpg', Body=image_data, ContentType='image/jpeg')
+
+
+def load_upload_image():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    spec = importlib.util.spec_from_file_location('upload_image', os.path.join(BACKEND_DIR, 'upload-image', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def memory_kb(field: str) -> int:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1])
+    return 0
+
+
+def peak_growth_mb(func, event) -> float:
+    """Насколько пиковый RSS во время func превысил RSS до вызова, МБ"""
+    gc.collect()
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+    baseline = memory_kb('VmRSS:')
+    func(event)
+    return (memory_kb('VmHWM:') - baseline) / 1024
+
+
+def make_event(size: int):
+    """Тело запроса собирается по кускам, чтобы его сборка не оставила высокий пик"""
+    chunk = b'\xff\xd8\xff' + os.urandom(3 * 1024 * 1024 - 3)
+    encoded = base64.b64encode(chunk).decode('ascii')
+    full, rest = divmod(size, len(chunk))
+    image = encoded * full + encoded[:rest // 3 * 4]
+    return {'httpMethod': 'POST', 'headers': {}, 'body': f'{{"image": "{image}", "content_type": "image/jpeg"}}'}
+
+
+def child(mode: str, size_mb: int) -> None:
+    upload_image = load_upload_image()
+    sink = SinkStorage()
+    upload_image.s3 = sink
+    upload = (lambda e: legacy_upload(e, sink)) if mode == 'legacy' else (lambda e: upload_image.handler(e, None))
+    event = make_event(size_mb * 1024 * 1024 // 3 * 3)
+    growth = peak_growth_mb(upload, event)
+    assert sink.received == size_mb * 1024 * 1024 // 3 * 3, 'изображение не загружено'
+    print(f'{growth:.1f} {len(event["body"]) / (1024 * 1024):.1f} {upload_image.MULTIPART_THRESHOLD // (1024 * 1024)}')
+
+
+def measure(mode: str, size_mb: int):
+    env = dict(os.environ, MALLOC_MMAP_THRESHOLD_='131072')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, str(size_mb)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[0]), float(output[1]), int(output[2])
+
+
+def main() -> None:
+    if not os.path.exists('/proc/self/clear_refs'):
+        sys.exit('Нужен Linux с /proc/self/clear_refs')
+
+    rows = []
+    for size_mb in SIZES_MB:
+        legacy, body_mb, threshold = measure('legacy', size_mb)
+        current, _, _ = measure('current', size_mb)
+        rows.append((size_mb, body_mb, legacy, current))
+
+    print(f'Прирост пикового RSS на загрузку, МБ (multipart крупнее {threshold} МБ)')
+    print(f"{'размер':>8} {'тело JSON':>10} {'прежний':>9} {'текущий':>9}")
+    for size_mb, body_mb, legacy, current in rows:
+        print(f'{size_mb:>6} МБ {body_mb:>10.1f} {legacy:>9.1f} {current:>9.1f}')
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child(sys.argv[-2], int(sys.argv[-1]))
+    else:
+        main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи просмотров: INSERT + UPDATE на каждый просмотр против буфера с COPY
+
+Только для локальной БД: пишет тестовые просмотры в card_views и удаляет их после замера.
+Запуск: DATABASE_URL=postgresql://... python3 backend/benchmarks/view_ingest_bench.py
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import view_buffer
+from db_pool import get_connection, release_connection
+
+VIEWS = 5000
+CARDS = 20
+BENCH_USER_AGENT = 'view-ingest-bench'
+
+
+def per_view_inserts(card_ids) -> float:
+    """Прежний путь: две записи и коммит на каждый просмотр"""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        began = time.perf_counter()
+        for i in range(VIEWS):
+            card_id = card_ids[i % len(card_ids)]
+            cur.execute(
+                f"INSERT INTO {view_buffer.VIEWS_TABLE} (card_id, viewer_ip, viewer_user_agent, viewed_at) "
+                "VALUES (%s, %s, %s, %s)",
+                (card_id, f'10.0.{i // 256 % 256}.{i % 256}', BENCH_USER_AGENT, datetime.now())
+            )
+            cur.execute(
+                f"UPDATE {view_buffer.CARDS_TABLE} SET view_count = view_count + 1 WHERE id = %s",
+                (card_id,)
+            )
+            conn.commit()
+        return time.perf_counter() - began
+    finally:
+        release_connection(conn)
+
+
+def buffered(card_ids) -> float:
+    began = time.perf_counter()
+    for i in range(VIEWS):
+        view_buffer.record_view(
+            card_ids[i % len(card_ids)], f'10.0.{i // 256 % 256}.{i % 256}', BENCH_USER_AGENT
+        )
+    view_buffer.flush_views()
+    return time.perf_counter() - began
+
+
+def cleanup(card_ids) -> None:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"DELETE FROM {view_buffer.VIEWS_TABLE} WHERE viewer_user_agent = %s",
+            (BENCH_USER_AGENT,)
+        )
+        cur.execute(
+            f"UPDATE {view_buffer.CARDS_TABLE} SET view_count = GREATEST(view_count - %s, 0) WHERE id = ANY(%s)",
+            (2 * VIEWS // len(card_ids), card_ids)
+        )
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+
+def main() -> None:
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id FROM {view_buffer.CARDS_TABLE} ORDER BY id LIMIT %s", (CARDS,))
+        card_ids = [row[0] for row in cur.fetchall()]
+    finally:
+        release_connection(conn)
+
+    if not card_ids:
+        sys.exit('В business_cards нет визиток для замера')
+
+    before = per_view_inserts(card_ids)
+    after = buffered(card_ids)
+    cleanup(card_ids)
+
+    print(f'Просмотров: {VIEWS}, визиток: {len(card_ids)}, размер пачки: {view_buffer.VIEW_BUFFER_MAX_SIZE}')
+    print(f'INSERT + UPDATE на просмотр: {VIEWS / before:>10.0f} просмотров/с')
+    print(f'Буфер + COPY:                {VIEWS / after:>10.0f} просмотров/с')
+    print(f'Ускорение: x{before / after:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import json
-import os
-import psycopg2
-import jwt
+from db_pool import get_connection, release_connection
+from jwt_auth import AuthError, verify_token
 
 def handler(event, context):
     '''
@@ -42,30 +41,13 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    jwt_secret = os.environ.get('JWT_SECRET')
-    if not jwt_secret:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Server configuration error'}),
-            'isBase64Encoded': False
-        }
-    
     try:
-        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
-        user_id = payload.get('user_id')
-    except jwt.ExpiredSignatureError:
+        user_id = verify_token(auth_token).get('user_id')
+    except AuthError as e:
         return {
-            'statusCode': 401,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
-    except jwt.InvalidTokenError:
-        return {
-            'statusCode': 401,
+            'statusCode': e.status_code,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Invalid token'}),
+            'body': json.dumps({'error': e.message}),
             'isBase64Encoded': False
         }
     
@@ -80,7 +62,7 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection()
     cur = conn.cursor()
     
     card_slug_escaped = card_slug.replace("'", "''")
@@ -92,7 +74,7 @@ def handler(event, context):
     
     if not card_owner:
         cur.close()
-        conn.close()
+        release_connection(conn)
         return {
             'statusCode': 404,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -102,7 +84,7 @@ def handler(event, context):
     
     if card_owner[0] != user_id:
         cur.close()
-        conn.close()
+        release_connection(conn)
         return {
             'statusCode': 403,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -116,7 +98,7 @@ def handler(event, context):
     conn.commit()
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -1,7 +1,6 @@
 import json
-import os
-import psycopg2
-import jwt
+from db_pool import get_connection, release_connection
+from jwt_auth import AuthError, verify_token
 from datetime import datetime
 
 def handler(event, context):
@@ -43,30 +42,13 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    jwt_secret = os.environ.get('JWT_SECRET')
-    if not jwt_secret:
-        return {
-            'statusCode': 500,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Server configuration error'}),
-            'isBase64Encoded': False
-        }
-    
     try:
-        payload = jwt.decode(auth_token, jwt_secret, algorithms=['HS256'])
-        user_id = payload.get('user_id')
-    except jwt.ExpiredSignatureError:
+        user_id = verify_token(auth_token).get('user_id')
+    except AuthError as e:
         return {
-            'statusCode': 401,
-            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Token expired'}),
-            'isBase64Encoded': False
-        }
-    except jwt.InvalidTokenError:
-        return {
-            'statusCode': 401,
+            'statusCode': e.status_code,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Invalid token'}),
+            'body': json.dumps({'error': e.message}),
             'isBase64Encoded': False
         }
     
@@ -81,7 +63,7 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection()
     cur = conn.cursor()
     
     card_slug_escaped = card_slug.replace("'", "''")
@@ -93,7 +75,7 @@ def handler(event, context):
     
     if not card_owner or card_owner[0] != user_id:
         cur.close()
-        conn.close()
+        release_connection(conn)
         return {
             'statusCode': 403,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -132,7 +114,7 @@ def handler(event, context):
     
     if not update_fields:
         cur.close()
-        conn.close()
+        release_connection(conn)
         return {
             'statusCode': 400,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -152,7 +134,7 @@ def handler(event, context):
     updated_card = cur.fetchone()
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
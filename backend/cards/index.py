@@ -1,8 +1,48 @@
 import json
-import os
-import psycopg2
+import hashlib
+from db_pool import get_connection, release_connection
+from jwt_auth import AuthError, verify_token
+from ttl_cache import TTLCache
+from view_buffer import flush_if_due, record_view
 from psycopg2.extras import RealDictCursor
 
+# Публичные визитки: id -> (updated_at, etag, сериализованный ответ)
+# Запись сверяется с updated_at в БД при каждом запросе, поэтому правки видны сразу;
+# view_count в закэшированном ответе (он не меняет updated_at) отстаёт не дольше TTL
+CARD_CACHE_TTL = 30
+card_cache = TTLCache(maxsize=2048, ttl=CARD_CACHE_TTL)
+
+def card_etag(card_id, updated_at) -> str:
+    """Сильный ETag, меняется при каждом обновлении визитки"""
+    digest = hashlib.sha256(f'{card_id}:{updated_at}'.encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def public_card_response(event, etag: str, body: str):
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match') or ''
+    response_headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Content-Type': 'application/json',
+        'Cache-Control': 'no-cache',
+        'ETag': etag
+    }
+    
+    if if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return {
+            'statusCode': 304,
+            'headers': response_headers,
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
 def handler(event, context):
     '''
     Управление визитками пользователя
@@ -12,6 +52,8 @@ def handler(event, context):
     POST /{id}/view - записать просмотр визитки
     PUT / - обновить визитку
     '''
+    # Просмотры, которые ждут в буфере дольше допустимого, уходят в БД до ответа
+    flush_if_due()
     method = event.get('httpMethod', 'GET')
     path_params = event.get('pathParams', {})
     card_id = path_params.get('id')
@@ -22,7 +64,7 @@ def handler(event, context):
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -30,11 +72,43 @@ def handler(event, context):
         }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        # Track view - просмотр попадает в буфер и пишется в БД пачкой
+        if method == 'POST' and card_id and '/view' in event.get('url', ''):
+            request_ctx = event.get('requestContext', {})
+            identity = request_ctx.get('identity', {})
+            headers = event.get('headers') or {}
+            
+            record_view(
+                int(card_id),
+                identity.get('sourceIp', 'unknown'),
+                identity.get('userAgent', 'unknown'),
+                headers.get('Referer') or headers.get('referer')
+            )
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({'success': True}),
+                'isBase64Encoded': False
+            }
+        
+        conn = get_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Public GET card by ID
         if method == 'GET' and card_id:
+            # Популярные визитки отдаются из памяти, если updated_at не изменился:
+            # проверка - чтение одного поля по первичному ключу вместо всей строки
+            cached = card_cache.get(int(card_id))
+            if cached is not None:
+                cur.execute(
+                    "SELECT updated_at FROM t_p18253922_infinite_business_ca.business_cards WHERE id = %s",
+                    (int(card_id),)
+                )
+                current = cur.fetchone()
+                if current and current['updated_at'] == cached[0]:
+                    return public_card_response(event, cached[1], cached[2])
+                card_cache.pop(int(card_id))
+            
             cur.execute(f"SELECT * FROM t_p18253922_infinite_business_ca.business_cards WHERE id = {int(card_id)}")
             card = cur.fetchone()
             
@@ -46,38 +120,11 @@ def handler(event, context):
                     'isBase64Encoded': False
                 }
             
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'card': dict(card)}, default=str),
-                'isBase64Encoded': False
-            }
-        
-        # Track view
-        if method == 'POST' and card_id and '/view' in event.get('url', ''):
-            request_ctx = event.get('requestContext', {})
-            identity = request_ctx.get('identity', {})
-            source_ip = identity.get('sourceIp', 'unknown').replace("'", "''")
-            user_agent = identity.get('userAgent', 'unknown').replace("'", "''")
-            
-            cur.execute(
-                f"""
-                INSERT INTO t_p18253922_infinite_business_ca.card_views (card_id, viewer_ip, viewer_user_agent)
-                VALUES ({int(card_id)}, '{source_ip}', '{user_agent}')
-                """
-            )
-            
-            cur.execute(
-                f"UPDATE t_p18253922_infinite_business_ca.business_cards SET view_count = view_count + 1 WHERE id = {int(card_id)}"
-            )
-            conn.commit()
+            etag = card_etag(card['id'], card['updated_at'])
+            body = json.dumps({'card': dict(card)}, default=str)
+            card_cache.set(int(card_id), (card['updated_at'], etag, body))
             
-            return {
-                'statusCode': 200,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'success': True}),
-                'isBase64Encoded': False
-            }
+            return public_card_response(event, etag, body)
         
         # All other methods require authentication
         headers = event.get('headers', {})
@@ -91,11 +138,18 @@ def handler(event, context):
                 'isBase64Encoded': False
             }
         
-        # Get user_id from token
-        cur.execute(f"SELECT user_id FROM t_p18253922_infinite_business_ca.auth_tokens WHERE token = '{auth_token}' AND expires_at > NOW()")
-        token_row = cur.fetchone()
+        # Get user_id from token - подпись проверяется локально, без запроса в БД
+        try:
+            user_id = verify_token(auth_token).get('user_id')
+        except AuthError as e:
+            return {
+                'statusCode': e.status_code,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({'error': f'Unauthorized - {e.message.lower()}'}),
+                'isBase64Encoded': False
+            }
         
-        if not token_row:
+        if not user_id:
             return {
                 'statusCode': 401,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -103,8 +157,6 @@ def handler(event, context):
                 'isBase64Encoded': False
             }
         
-        user_id = token_row['user_id']
-        
         if method == 'GET':
             cur.execute(
                 f"SELECT * FROM t_p18253922_infinite_business_ca.business_cards WHERE user_id = {int(user_id)} ORDER BY created_at DESC"
@@ -188,6 +240,7 @@ def handler(event, context):
             
             card = dict(card)
             conn.commit()
+            card_cache.pop(int(card_id))
             
             return {
                 'statusCode': 200,
@@ -216,4 +269,4 @@ def handler(event, context):
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_connection(conn)
\ No newline at end of file
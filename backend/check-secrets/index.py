@@ -31,6 +31,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'auth': {
             'JWT_SECRET': bool(os.environ.get('JWT_SECRET'))
         },
+        'short_urls': {
+            'SHORT_CODE_SECRET': bool(os.environ.get('SHORT_CODE_SECRET'))
+        },
         'email': {
             'SMTP_HOST': bool(os.environ.get('SMTP_HOST')),
             'SMTP_PORT': bool(os.environ.get('SMTP_PORT')),
@@ -0,0 +1,128 @@
+"""
+Пул соединений PostgreSQL для всех функций
+Живёт в области модуля, поэтому переживает тёплые вызовы (работает в serverless)
+"""
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+# Сколько простаивающих соединений держим на один инстанс
+POOL_MAX_IDLE = int(os.environ.get('DB_POOL_MAX_IDLE', '4'))
+# После такого простоя соединение проверяется запросом SELECT 1
+HEALTH_CHECK_AFTER_SECONDS = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+# Соединения старше этого возраста закрываются при возврате
+MAX_CONNECTION_AGE_SECONDS = float(os.environ.get('DB_POOL_MAX_AGE', '600'))
+
+_lock = threading.Lock()
+# (соединение, время возврата в пул)
+_idle: List[Tuple[psycopg2.extensions.connection, float]] = []
+_created_at: Dict[int, float] = {}
+
+
+def _connect() -> psycopg2.extensions.connection:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _created_at[id(conn)] = time.time()
+    return conn
+
+
+def _discard(conn: psycopg2.extensions.connection) -> None:
+    _created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _is_healthy(conn: psycopg2.extensions.connection, idle_since: float) -> bool:
+    """Проверяет соединение перед повторным использованием"""
+    if conn.closed:
+        return False
+
+    if time.time() - idle_since < HEALTH_CHECK_AFTER_SECONDS:
+        return True
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def get_connection() -> psycopg2.extensions.connection:
+    """
+    Возвращает соединение к DATABASE_URL из пула или открывает новое
+
+    Returns:
+        соединение psycopg2, которое нужно вернуть через release_connection
+    """
+    while True:
+        with _lock:
+            if not _idle:
+                break
+            conn, idle_since = _idle.pop()
+
+        if _is_healthy(conn, idle_since):
+            return conn
+        _discard(conn)
+
+    return _connect()
+
+
+def release_connection(conn: Optional[psycopg2.extensions.connection]) -> None:
+    """
+    Возвращает соединение в пул, сбрасывая транзакцию и состояние сессии
+
+    Args:
+        conn: соединение, полученное через get_connection
+    """
+    if conn is None:
+        return
+
+    if conn.closed:
+        _created_at.pop(id(conn), None)
+        return
+
+    # Повторный возврат (ранний return + finally) не должен задвоить соединение
+    with _lock:
+        if any(idle_conn is conn for idle_conn, _ in _idle):
+            return
+
+    created_at = _created_at.get(id(conn), 0.0)
+    if time.time() - created_at > MAX_CONNECTION_AGE_SECONDS:
+        _discard(conn)
+        return
+
+    try:
+        # Откатывает незавершённую транзакцию и выполняет RESET ALL
+        conn.reset()
+        if conn.autocommit:
+            conn.autocommit = False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _discard(conn)
+            return
+    except Exception:
+        _discard(conn)
+        return
+
+    with _lock:
+        if len(_idle) < POOL_MAX_IDLE:
+            _idle.append((conn, time.time()))
+            return
+
+    _discard(conn)
+
+
+def close_all() -> None:
+    """Закрывает все простаивающие соединения"""
+    with _lock:
+        idle = list(_idle)
+        _idle.clear()
+
+    for conn, _ in idle:
+        _discard(conn)
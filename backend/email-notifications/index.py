@@ -1,28 +1,14 @@
 import json
-import os
 import smtplib
-import jwt
-import time
-from typing import Dict, Tuple, Optional
+from jwt_auth import AuthError, verify_token
+from smtp_mailer import get_mailer
+from email_templates import build_message as render_template_message
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from rate_limit_utils import check_rate_limit
 
-# In-memory rate limiting
-_rate_limit_store: Dict[str, list] = {}
-
-def check_rate_limit(identifier: str, max_req: int = 10, window: int = 60) -> Tuple[bool, Optional[int]]:
-    current = time.time()
-    if identifier not in _rate_limit_store:
-        _rate_limit_store[identifier] = []
-    
-    _rate_limit_store[identifier] = [t for t in _rate_limit_store[identifier] if current - t < window]
-    
-    if len(_rate_limit_store[identifier]) >= max_req:
-        oldest = _rate_limit_store[identifier][0]
-        return False, int(window - (current - oldest))
-    
-    _rate_limit_store[identifier].append(current)
-    return True, None
+# Максимум писем в одном пакетном запросе
+EMAIL_BULK_MAX_MESSAGES = 50
 
 def handler(event, context):
     '''
@@ -65,48 +51,16 @@ def handler(event, context):
         }
     
     try:
-        jwt_secret = os.environ.get('JWT_SECRET')
-        if not jwt_secret:
-            return {
-                'statusCode': 500,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Server configuration error'}),
-                'isBase64Encoded': False
-            }
-        
-        decoded = jwt.decode(auth_header, jwt_secret, algorithms=['HS256'])
-        user_id = decoded.get('user_id')
-        
-        if not user_id:
-            return {
-                'statusCode': 401,
-                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'Invalid token'}),
-                'isBase64Encoded': False
-            }
-        
-        # Rate limiting - 10 писем в минуту на пользователя
-        allowed, retry_after = check_rate_limit(f'email:{user_id}', max_req=10, window=60)
-        
-        if not allowed:
-            return {
-                'statusCode': 429,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json',
-                    'Retry-After': str(retry_after)
-                },
-                'body': json.dumps({'error': 'Too many emails'}),
-                'isBase64Encoded': False
-            }
-    except jwt.ExpiredSignatureError:
+        user_id = verify_token(auth_header).get('user_id')
+    except AuthError as e:
         return {
-            'statusCode': 401,
+            'statusCode': e.status_code,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Token expired'}),
+            'body': json.dumps({'error': e.message}),
             'isBase64Encoded': False
         }
-    except jwt.InvalidTokenError:
+    
+    if not user_id:
         return {
             'statusCode': 401,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -114,12 +68,24 @@ def handler(event, context):
             'isBase64Encoded': False
         }
     
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '465'))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
+    # Rate limiting - 10 писем в минуту на пользователя
+    allowed, retry_after = check_rate_limit(f'email:{user_id}', max_requests=10, window_seconds=60)
+    
+    if not allowed:
+        return {
+            'statusCode': 429,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json',
+                'Retry-After': str(retry_after)
+            },
+            'body': json.dumps({'error': 'Too many emails'}),
+            'isBase64Encoded': False
+        }
+    
+    mailer = get_mailer()
     
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password]):
+    if mailer is None:
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -129,12 +95,47 @@ def handler(event, context):
     
     try:
         body = json.loads(event.get('body', '{}'))
-        to_email = body.get('to_email')
-        subject = body.get('subject')
-        email_type = body.get('type', 'text')
-        content = body.get('content', '')
         
-        if not to_email or not subject:
+        # Пакетная отправка: все письма идут через одну SMTP-сессию
+        if 'messages' in body:
+            items = body.get('messages')
+            if not isinstance(items, list) or not items or len(items) > EMAIL_BULK_MAX_MESSAGES:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': f'messages must be a list of 1-{EMAIL_BULK_MAX_MESSAGES} emails'}),
+                    'isBase64Encoded': False
+                }
+            
+            results = [None] * len(items)
+            batch = []
+            for i, item in enumerate(items):
+                to_email = item.get('to_email') if isinstance(item, dict) else None
+                if not to_email or not item.get('subject'):
+                    results[i] = {'to_email': to_email, 'success': False, 'error': 'to_email and subject are required'}
+                    continue
+                # Первое письмо оплачено проверкой лимита выше, каждое следующее расходует лимит отдельно
+                if batch and not check_rate_limit(f'email:{user_id}', max_requests=10, window_seconds=60)[0]:
+                    results[i] = {'to_email': to_email, 'success': False, 'error': 'Too many emails'}
+                    continue
+                batch.append((i, build_message(item, mailer.user)))
+            
+            sent = mailer.send_many([msg for _, msg in batch])
+            for (i, msg), (_, error) in zip(batch, sent):
+                results[i] = {'to_email': msg['To'], 'success': error is None, 'error': error}
+            
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({
+                    'success': all(result['success'] for result in results),
+                    'sent': sum(1 for result in results if result['success']),
+                    'results': results
+                }),
+                'isBase64Encoded': False
+            }
+        
+        if not body.get('to_email') or not body.get('subject'):
             return {
                 'statusCode': 400,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -142,97 +143,7 @@ def handler(event, context):
                 'isBase64Encoded': False
             }
         
-        msg = MIMEMultipart('alternative')
-        msg['From'] = smtp_user
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        if email_type == 'welcome':
-            html_content = f"""
-            <html>
-              <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
-                <div style="max-width: 600px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px;">
-                  <h1 style="color: #FFD700; margin-bottom: 20px;">
-                    <span style="font-size: 32px;">∞7</span> visitka.site
-                  </h1>
-                  <h2 style="color: #333;">Добро пожаловать!</h2>
-                  <p style="color: #666; font-size: 16px; line-height: 1.6;">
-                    Спасибо за регистрацию в visitka.site! Ваш аккаунт успешно создан.
-                  </p>
-                  <p style="color: #666; font-size: 16px; line-height: 1.6;">
-                    Теперь вы можете:
-                  </p>
-                  <ul style="color: #666; font-size: 16px; line-height: 1.8;">
-                    <li>Создавать цифровые визитки</li>
-                    <li>Генерировать QR-коды</li>
-                    <li>Делиться визитками в мессенджерах</li>
-                    <li>Использовать AI для создания логотипов</li>
-                  </ul>
-                  <a href="https://visitka.site/dashboard" 
-                     style="display: inline-block; margin-top: 20px; padding: 12px 30px; 
-                            background: #FFD700; color: black; text-decoration: none; 
-                            border-radius: 5px; font-weight: bold;">
-                    Перейти в личный кабинет
-                  </a>
-                  <p style="color: #999; font-size: 14px; margin-top: 30px;">
-                    С уважением,<br>
-                    Команда visitka.site
-                  </p>
-                </div>
-              </body>
-            </html>
-            """
-            msg.attach(MIMEText(html_content, 'html'))
-        
-        elif email_type == 'payment_success':
-            plan_name = body.get('plan_name', 'Премиум')
-            amount = body.get('amount', '0')
-            html_content = f"""
-            <html>
-              <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
-                <div style="max-width: 600px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px;">
-                  <h1 style="color: #FFD700; margin-bottom: 20px;">
-                    <span style="font-size: 32px;">∞7</span> visitka.site
-                  </h1>
-                  <h2 style="color: #333;">Оплата прошла успешно!</h2>
-                  <p style="color: #666; font-size: 16px; line-height: 1.6;">
-                    Спасибо за покупку! Ваш платёж успешно обработан.
-                  </p>
-                  <div style="background: #f9f9f9; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <p style="margin: 5px 0;"><strong>Тариф:</strong> {plan_name}</p>
-                    <p style="margin: 5px 0;"><strong>Сумма:</strong> {amount}₽</p>
-                  </div>
-                  <p style="color: #666; font-size: 16px; line-height: 1.6;">
-                    Все функции тарифа уже доступны в вашем личном кабинете.
-                  </p>
-                  <a href="https://visitka.site/dashboard" 
-                     style="display: inline-block; margin-top: 20px; padding: 12px 30px; 
-                            background: #FFD700; color: black; text-decoration: none; 
-                            border-radius: 5px; font-weight: bold;">
-                    Открыть личный кабинет
-                  </a>
-                  <p style="color: #999; font-size: 14px; margin-top: 30px;">
-                    С уважением,<br>
-                    Команда visitka.site
-                  </p>
-                </div>
-              </body>
-            </html>
-            """
-            msg.attach(MIMEText(html_content, 'html'))
-        
-        else:
-            msg.attach(MIMEText(content, 'plain'))
-        
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_host, smtp_port)
-        else:
-            server = smtplib.SMTP(smtp_host, smtp_port)
-            server.starttls()
-        
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        mailer.send(build_message(body, mailer.user))
         
         return {
             'statusCode': 200,
@@ -257,4 +168,24 @@ def handler(event, context):
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
             'body': json.dumps({'error': 'Failed to send email'}),
             'isBase64Encoded': False
-        }
\ No newline at end of file
+        }
+
+
+def build_message(item, from_email):
+    '''Письмо по полям запроса: to_email, subject, type и content или данные шаблона'''
+    email_type = item.get('type', 'text')
+    
+    if email_type == 'welcome':
+        return render_template_message('welcome', {'name': item.get('name')}, from_email, item['to_email'], item['subject'])
+    
+    if email_type == 'payment_success':
+        context = {'plan_name': item.get('plan_name', 'Премиум'), 'amount': item.get('amount', '0')}
+        return render_template_message('payment_success', context, from_email, item['to_email'], item['subject'])
+    
+    msg = MIMEMultipart('alternative')
+    msg['From'] = from_email
+    msg['To'] = item['to_email']
+    msg['Subject'] = item['subject']
+    msg.attach(MIMEText(item.get('content', ''), 'plain'))
+    
+    return msg
\ No newline at end of file
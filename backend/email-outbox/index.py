@@ -0,0 +1,94 @@
+import json
+import os
+import time
+from db_pool import get_connection, release_connection
+from email_outbox import PURGE_BATCH_SIZE, drain_outbox, purge_sent
+from email_templates import build_message
+from smtp_mailer import get_mailer
+
+# Сколько секунд функция разбирает очередь за один вызов по таймеру
+DISPATCH_TIME_BUDGET = float(os.environ.get('EMAIL_OUTBOX_TIME_BUDGET', '20'))
+
+
+def handler(event, context):
+    '''
+    Диспетчер очереди писем email_outbox, вызывается по таймеру
+    Отправляет пачки писем, пока очередь не опустеет или не выйдет DISPATCH_TIME_BUDGET;
+    неотправленные письма остаются в очереди с задержкой до следующей попытки.
+    В оставшееся время удаляет отправленные письма старше срока хранения
+    '''
+    method = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    mailer = get_mailer()
+    if mailer is None:
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'SMTP credentials not configured'}),
+            'isBase64Encoded': False
+        }
+
+    def send(item):
+        # Тип письма в очереди - имя шаблона в реестре email_templates
+        msg = build_message(item['kind'], item['payload'], mailer.user, item['to_email'], subject=item['subject'])
+        mailer.send(msg)
+
+    sent_total = 0
+    failed_total = 0
+    purged_total = 0
+    deadline = time.monotonic() + DISPATCH_TIME_BUDGET
+    conn = None
+    try:
+        conn = get_connection()
+        while time.monotonic() < deadline:
+            sent, failed = drain_outbox(conn, send)
+            sent_total += sent
+            failed_total += failed
+            if sent == 0 and failed == 0:
+                break
+        while time.monotonic() < deadline:
+            purged = purge_sent(conn)
+            purged_total += purged
+            if purged < PURGE_BATCH_SIZE:
+                break
+    except Exception as e:
+        print(f'Failed to dispatch email outbox: {e}')
+        if conn is not None:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Failed to dispatch emails', 'sent': sent_total}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps({'sent': sent_total, 'failed': failed_total, 'purged': purged_total}),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,151 @@
+"""
+Очередь исходящих писем (transactional outbox)
+Функции не ходят в SMTP во время запроса: enqueue_email пишет письмо в email_outbox
+в той же транзакции, что и само событие, поэтому письмо не теряется при падении
+и не уходит, если транзакция откатилась. Отправляет письма drain_outbox - его вызывает
+функция email-outbox по таймеру.
+
+Несколько диспетчеров могут работать одновременно: строки пачки блокируются
+FOR UPDATE SKIP LOCKED, и каждый берёт свои. Ошибка отправки откладывает письмо
+с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS попыток оно помечается failed.
+Отправленные письма хранятся OUTBOX_RETENTION_DAYS дней, затем purge_sent их удаляет.
+"""
+import json
+import os
+import random
+from typing import Any, Callable, Dict, List, Tuple
+
+from psycopg2.extras import execute_values
+
+SCHEMA = 't_p18253922_infinite_business_ca'
+OUTBOX_TABLE = f'{SCHEMA}.email_outbox'
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '8'))
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 6 * 3600
+# Сколько дней хранить отправленные письма и сколько строк удалять за один DELETE
+OUTBOX_RETENTION_DAYS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', '14'))
+PURGE_BATCH_SIZE = 1000
+
+
+def enqueue_email(cur, kind: str, to_email: str, subject: str, payload: Dict[str, Any]) -> None:
+    """
+    Ставит письмо в очередь; коммит остаётся за вызывающим вместе с остальной транзакцией
+
+    Args:
+        cur: курсор транзакции, в которой происходит событие
+        kind: тип письма (lead, welcome, ...), по нему диспетчер выбирает шаблон
+        to_email: адрес получателя
+        subject: тема письма
+        payload: данные для шаблона
+    """
+    cur.execute(
+        f"INSERT INTO {OUTBOX_TABLE} (kind, to_email, subject, payload) VALUES (%s, %s, %s, %s)",
+        (kind, to_email, subject, json.dumps(payload, default=str))
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """Задержка до следующей попытки после attempts неудачных, с джиттером"""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def drain_outbox(
+    conn,
+    send: Callable[[Dict[str, Any]], None],
+    batch_size: int = OUTBOX_BATCH_SIZE
+) -> Tuple[int, int]:
+    """
+    Отправляет одну пачку писем, у которых подошло время, в одной транзакции
+
+    Args:
+        conn: соединение psycopg2
+        send: отправка одного письма (dict с id, kind, to_email, subject, payload);
+              исключение считается неудачной попыткой
+        batch_size: максимум писем за вызов
+
+    Returns:
+        (отправлено, не отправлено); (0, 0) - очередь пуста или занята другими диспетчерами
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT id, kind, to_email, subject, payload, attempts
+            FROM {OUTBOX_TABLE}
+            WHERE status = 'pending' AND next_attempt_at <= NOW()
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (batch_size,)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0, 0
+
+        sent_ids: List[int] = []
+        failures: List[tuple] = []
+        for outbox_id, kind, to_email, subject, payload, attempts in rows:
+            try:
+                send({'id': outbox_id, 'kind': kind, 'to_email': to_email, 'subject': subject, 'payload': payload})
+                sent_ids.append(outbox_id)
+            except Exception as e:
+                attempts += 1
+                status = 'failed' if attempts >= OUTBOX_MAX_ATTEMPTS else 'pending'
+                failures.append((outbox_id, status, retry_delay(attempts), str(e)[:1000]))
+
+        if sent_ids:
+            cur.execute(
+                f"""
+                UPDATE {OUTBOX_TABLE}
+                SET status = 'sent', attempts = attempts + 1, sent_at = NOW(), last_error = NULL
+                WHERE id = ANY(%s)
+                """,
+                (sent_ids,)
+            )
+        if failures:
+            execute_values(
+                cur,
+                f"""
+                UPDATE {OUTBOX_TABLE} AS o
+                SET status = f.status,
+                    attempts = o.attempts + 1,
+                    next_attempt_at = NOW() + make_interval(secs => f.delay),
+                    last_error = f.error
+                FROM (VALUES %s) AS f (id, status, delay, error)
+                WHERE o.id = f.id
+                """,
+                failures,
+                template='(%s::bigint, %s, %s::float8, %s)'
+            )
+    conn.commit()
+
+    return len(sent_ids), len(failures)
+
+
+def purge_sent(conn, retention_days: int = OUTBOX_RETENTION_DAYS, batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Удаляет пачку отправленных писем старше retention_days, в отдельной короткой транзакции
+
+    Returns:
+        количество удалённых строк (меньше batch_size - старых писем больше нет)
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            DELETE FROM {OUTBOX_TABLE}
+            WHERE id IN (
+                SELECT id FROM {OUTBOX_TABLE}
+                WHERE status = 'sent' AND sent_at < NOW() - make_interval(days => %s)
+                ORDER BY sent_at
+                LIMIT %s
+            )
+            """,
+            (retention_days, batch_size)
+        )
+        purged = cur.rowcount
+    conn.commit()
+    return purged
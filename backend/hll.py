@@ -0,0 +1,108 @@
+"""
+HyperLogLog - компактная оценка числа уникальных посетителей
+Скетч хранится как bytea с массивом регистров (по байту на регистр) и объединяется
+поэлементным максимумом, поэтому скетчи по дням сливаются за любой диапазон дат
+
+Точность: стандартная ошибка 1.04 / sqrt(2^HLL_PRECISION). При HLL_PRECISION = 11
+это ~2.3%; в 99% случаев оценка отличается от точного значения не больше чем на 7%.
+Для малых множеств (до ~5000) используется linear counting, ошибка там заметно ниже.
+"""
+import hashlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+# 2^11 регистров по байту: 2 КБ на скетч
+HLL_PRECISION = 11
+HLL_STANDARD_ERROR = 1.04 / np.sqrt(1 << HLL_PRECISION)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    __slots__ = ('precision', 'm', 'registers')
+
+    def __init__(self, registers: Optional[bytes] = None, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            self.registers = np.zeros(self.m, dtype=np.uint8)
+        else:
+            if len(registers) != self.m:
+                raise ValueError(f'Expected {self.m} registers, got {len(registers)}')
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+
+    def add(self, value: str) -> None:
+        h = _hash(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[str]) -> 'HyperLogLog':
+        """Добавляет сразу много значений; регистры обновляются векторно"""
+        hashes = np.fromiter((_hash(value) for value in values), dtype=np.uint64)
+        if not hashes.size:
+            return self
+
+        shift = np.uint64(64 - self.precision)
+        indexes = (hashes >> shift).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # frexp даёт точную длину в битах: rest < 2^53 представим в float64 без потерь
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        ranks = (64 - self.precision - bit_length + 1).astype(np.uint8)
+
+        np.maximum.at(self.registers, indexes, ranks)
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Объединяет скетч с другим на месте"""
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+
+        # Поправка для малых множеств (linear counting)
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = HLL_PRECISION) -> 'HyperLogLog':
+        return cls(bytes(data) if data else None, precision)
+
+    @classmethod
+    def merge_all(cls, sketches: Iterable[Optional[bytes]], precision: int = HLL_PRECISION) -> 'HyperLogLog':
+        """
+        Объединяет скетчи за произвольный набор дней одной векторной операцией
+
+        Args:
+            sketches: сериализованные скетчи (None пропускаются)
+
+        Returns:
+            скетч объединения, стоимость O(число скетчей), а не O(просмотров)
+        """
+        m = 1 << precision
+        blobs = [bytes(sketch) for sketch in sketches if sketch]
+        result = cls(precision=precision)
+        if not blobs:
+            return result
+
+        stacked = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+        if stacked.size != m * len(blobs):
+            raise ValueError('Sketch size does not match precision')
+        result.registers = stacked.reshape(len(blobs), m).max(axis=0)
+        return result
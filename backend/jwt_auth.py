@@ -0,0 +1,139 @@
+"""
+Локальная проверка JWT (HS256) для функций
+Подпись проверяется без запроса в БД, а раскодированные claims кэшируются в LRU по хэшу
+токена до его exp: несколько вызовов одной страницы дашборда проверяют токен один раз.
+Опционально токен сверяется с набором отозванных, который перечитывается из БД
+не чаще раза в REVOCATION_REFRESH_SECONDS. Пока набор ни разу не загрузился (нет БД
+или psycopg2 в функции), запросы отклоняются с 503, а не пропускаются без проверки.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, FrozenSet
+
+import jwt
+
+from ttl_cache import TTLCache
+
+TOKEN_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', '4096'))
+# Токены без exp кэшируются не дольше этого
+TOKEN_CACHE_MAX_TTL = 3600
+REVOCATION_CHECK = os.environ.get('JWT_REVOCATION_CHECK', 'false').lower() == 'true'
+REVOCATION_REFRESH_SECONDS = int(os.environ.get('JWT_REVOCATION_REFRESH_SECONDS', '60'))
+REVOKED_TOKENS_TABLE = 't_p18253922_infinite_business_ca.revoked_tokens'
+
+# sha256(токен) -> claims
+_claims_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_MAX_TTL)
+
+_revoked: FrozenSet[str] = frozenset()
+_revoked_ready = False
+_revoked_loaded_at = 0.0
+_revoked_lock = threading.Lock()
+
+
+class AuthError(Exception):
+    """Токен не прошёл проверку; status_code и message идут в ответ функции"""
+
+    def __init__(self, message: str, status_code: int = 401):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def _refresh_revoked() -> None:
+    global _revoked, _revoked_ready
+
+    from db_pool import get_connection, release_connection
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT token_hash FROM {REVOKED_TOKENS_TABLE} WHERE expires_at > NOW()")
+            _revoked = frozenset(row[0] for row in cur.fetchall())
+        conn.commit()
+        _revoked_ready = True
+    finally:
+        release_connection(conn)
+
+
+def _try_refresh_revoked(now: float) -> None:
+    """Обновляет набор отозванных; вызывается под _revoked_lock"""
+    global _revoked_loaded_at
+
+    try:
+        _refresh_revoked()
+    except Exception as e:
+        # Без БД продолжаем с последним загруженным набором
+        print(f'Failed to refresh revoked tokens: {e}')
+    finally:
+        _revoked_loaded_at = now
+
+
+def is_revoked(digest: str) -> bool:
+    """
+    Отозван ли токен; набор обновляется из БД в фоне запросов, а не на каждый вызов
+
+    Raises:
+        AuthError: 503, если набор отозванных ещё ни разу не удалось загрузить
+    """
+    now = time.monotonic()
+    if not _revoked_ready:
+        # Первую загрузку ждут все запросы: пустой набор пропустил бы отозванные токены
+        with _revoked_lock:
+            if not _revoked_ready:
+                _try_refresh_revoked(now)
+        if not _revoked_ready:
+            raise AuthError('Token revocation list unavailable', 503)
+    elif now - _revoked_loaded_at >= REVOCATION_REFRESH_SECONDS and _revoked_lock.acquire(blocking=False):
+        try:
+            _try_refresh_revoked(now)
+        finally:
+            _revoked_lock.release()
+    return digest in _revoked
+
+
+def verify_token(token: str, check_revocation: bool = REVOCATION_CHECK) -> Dict[str, Any]:
+    """
+    Проверяет JWT и возвращает его claims
+
+    Args:
+        token: значение X-Auth-Token
+        check_revocation: сверять ли токен с таблицей отозванных
+
+    Raises:
+        AuthError: токен просрочен, подделан или отозван, не настроен JWT_SECRET
+                   или недоступен набор отозванных (503)
+    """
+    digest = token_hash(token)
+    claims = _claims_cache.get(digest)
+
+    if claims is None:
+        jwt_secret = os.environ.get('JWT_SECRET')
+        if not jwt_secret:
+            raise AuthError('Server configuration error', 500)
+
+        try:
+            claims = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise AuthError('Token expired')
+        except jwt.InvalidTokenError:
+            raise AuthError('Invalid token')
+
+        ttl = TOKEN_CACHE_MAX_TTL
+        if 'exp' in claims:
+            ttl = min(ttl, claims['exp'] - time.time())
+        if ttl > 0:
+            _claims_cache.set(digest, claims, ttl=ttl)
+    elif 'exp' in claims and claims['exp'] <= time.time():
+        _claims_cache.pop(digest)
+        raise AuthError('Token expired')
+
+    if check_revocation and is_revoked(digest):
+        raise AuthError('Token revoked')
+
+    return claims
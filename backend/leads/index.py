@@ -1,33 +1,33 @@
+import base64
 import json
-import os
 import re
-import time
-from typing import Dict, Tuple, Optional
-import psycopg2
+from datetime import datetime
+from db_pool import get_connection, release_connection
+from email_outbox import enqueue_email
+from rate_limit_utils import check_rate_limit
 from psycopg2.extras import RealDictCursor
 
-# In-memory rate limiting
-_rate_limit_store: Dict[str, list] = {}
+LEADS_PAGE_SIZE = 50
+LEADS_MAX_PAGE_SIZE = 200
 
-def check_rate_limit(identifier: str, max_req: int = 10, window: int = 60) -> Tuple[bool, Optional[int]]:
-    current = time.time()
-    if identifier not in _rate_limit_store:
-        _rate_limit_store[identifier] = []
-    
-    _rate_limit_store[identifier] = [t for t in _rate_limit_store[identifier] if current - t < window]
-    
-    if len(_rate_limit_store[identifier]) >= max_req:
-        oldest = _rate_limit_store[identifier][0]
-        return False, int(window - (current - oldest))
-    
-    _rate_limit_store[identifier].append(current)
-    return True, None
+def encode_cursor(created_at: str, lead_id: int) -> str:
+    """Непрозрачный курсор на позицию после лида (created_at, id)"""
+    raw = f'{created_at}|{lead_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора или None; ValueError, если курсор испорчен"""
+    if not cursor:
+        return None
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, lead_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(lead_id)
 
 def handler(event, context):
     '''
     Управление лидами с визиток
     POST / - создать новый лид (публичный доступ)
-    GET /?card_id=X - получить лиды для визитки (требует авторизацию)
+    GET /?card_id=X[&limit=50&cursor=...&unread_only=true] - страница лидов визитки (требует авторизацию)
     PUT /{id}/read - отметить лид как прочитанный
     '''
     method = event.get('httpMethod', 'GET')
@@ -50,7 +50,7 @@ def handler(event, context):
     # Rate limiting для публичного создания лидов (10 запросов за 60 секунд)
     if method == 'POST' and not lead_id:
         ip = event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
-        allowed, retry_after = check_rate_limit(f'leads:{ip}', max_req=10, window=60)
+        allowed, retry_after = check_rate_limit(f'leads:{ip}', max_requests=10, window_seconds=60, mode='local')
         
         if not allowed:
             return {
@@ -65,7 +65,7 @@ def handler(event, context):
             }
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         # POST - создание лида (публичный доступ)
@@ -135,8 +135,16 @@ def handler(event, context):
                     'isBase64Encoded': False
                 }
             
-            # Проверка существования карточки
-            cur.execute("SELECT id, user_id FROM business_cards WHERE id = %s", (card_id,))
+            # Проверка существования карточки и email владельца для уведомления
+            cur.execute(
+                """
+                SELECT bc.id, bc.user_id, u.email AS owner_email
+                FROM business_cards bc
+                LEFT JOIN users u ON u.id = bc.user_id
+                WHERE bc.id = %s
+                """,
+                (card_id,)
+            )
             card = cur.fetchone()
             
             if not card:
@@ -157,32 +165,25 @@ def handler(event, context):
                 (card_id, name, email, phone, message, source)
             )
             lead = dict(cur.fetchone())
-            conn.commit()
             
-            # Отправка уведомления владельцу (опционально)
-            try:
-                cur.execute("SELECT email FROM users WHERE id = %s", (card['user_id'],))
-                user = cur.fetchone()
-                
-                if user and user['email']:
-                    import requests
-                    requests.post(
-                        'https://functions.poehali.dev/74c49dcb-78dd-46f7-9f32-46f1dffa39be/send',
-                        json={
-                            'to_email': user['email'],
-                            'subject': f'Новый лид с визитки: {name}',
-                            'type': 'lead',
-                            'lead_data': {
-                                'name': name,
-                                'email': email or 'Не указан',
-                                'phone': phone or 'Не указан',
-                                'message': message or 'Без сообщения'
-                            }
-                        },
-                        timeout=3
-                    )
-            except Exception as e:
-                print(f"Failed to send notification: {e}")
+            # Уведомление владельцу уходит через очередь в той же транзакции,
+            # ответ не ждёт SMTP; отправляет функция email-outbox
+            if card['owner_email']:
+                enqueue_email(
+                    cur,
+                    'lead',
+                    card['owner_email'],
+                    f'Новый лид с визитки: {name}',
+                    {
+                        'lead_id': lead['id'],
+                        'card_id': card_id,
+                        'name': name,
+                        'email': email or 'Не указан',
+                        'phone': phone or 'Не указан',
+                        'message': message or 'Без сообщения'
+                    }
+                )
+            conn.commit()
             
             return {
                 'statusCode': 200,
@@ -216,43 +217,73 @@ def handler(event, context):
                     'isBase64Encoded': False
                 }
             
-            # Проверка владения карточкой
-            cur.execute(
-                "SELECT id FROM business_cards WHERE id = %s AND user_id = %s",
-                (card_id, user_id)
-            )
-            if not cur.fetchone():
+            try:
+                page_size = min(int(query_params.get('limit') or LEADS_PAGE_SIZE), LEADS_MAX_PAGE_SIZE)
+                if page_size < 1:
+                    raise ValueError('limit must be positive')
+                after = decode_cursor(query_params.get('cursor'))
+            except ValueError:
                 return {
-                    'statusCode': 403,
+                    'statusCode': 400,
                     'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                    'body': json.dumps({'error': 'Access denied'}),
+                    'body': json.dumps({'error': 'Invalid limit or cursor'}),
                     'isBase64Encoded': False
                 }
+            unread_only = str(query_params.get('unread_only', '')).lower() in ('1', 'true')
+            after_created_at, after_id = after or (None, None)
             
-            # Получение лидов
+            # Проверка владения, страница лидов и счётчик непрочитанных - одним запросом;
+            # страница читается по индексу (card_id, created_at, id) с места курсора
             cur.execute(
                 """
-                SELECT * FROM card_leads 
-                WHERE card_id = %s 
-                ORDER BY created_at DESC
+                SELECT COALESCE(c.unread_count, 0) AS unread_count,
+                       COALESCE((
+                           SELECT json_agg(l ORDER BY l.created_at DESC, l.id DESC)
+                           FROM (
+                               SELECT * FROM card_leads
+                               WHERE card_id = bc.id
+                                 AND (NOT %(unread_only)s OR is_read = FALSE)
+                                 AND (%(after_created_at)s::timestamp IS NULL
+                                      OR (created_at, id) < (%(after_created_at)s::timestamp, %(after_id)s))
+                               ORDER BY created_at DESC, id DESC
+                               LIMIT %(limit)s
+                           ) l
+                       ), '[]'::json) AS leads
+                FROM business_cards bc
+                LEFT JOIN card_lead_counters c ON c.card_id = bc.id
+                WHERE bc.id = %(card_id)s AND bc.user_id = %(user_id)s
                 """,
-                (card_id,)
+                {
+                    'card_id': card_id,
+                    'user_id': user_id,
+                    'unread_only': unread_only,
+                    'after_created_at': after_created_at,
+                    'after_id': after_id,
+                    'limit': page_size + 1
+                }
             )
-            leads = [dict(row) for row in cur.fetchall()]
+            page = cur.fetchone()
             
-            # Подсчёт непрочитанных
-            cur.execute(
-                "SELECT COUNT(*) as unread_count FROM card_leads WHERE card_id = %s AND is_read = FALSE",
-                (card_id,)
-            )
-            unread_count = cur.fetchone()['unread_count']
+            if not page:
+                return {
+                    'statusCode': 403,
+                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': 'Access denied'}),
+                    'isBase64Encoded': False
+                }
+            
+            leads = page['leads'][:page_size]
+            next_cursor = None
+            if len(page['leads']) > page_size:
+                next_cursor = encode_cursor(leads[-1]['created_at'], leads[-1]['id'])
             
             return {
                 'statusCode': 200,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
                 'body': json.dumps({
                     'leads': leads,
-                    'unread_count': unread_count
+                    'unread_count': page['unread_count'],
+                    'next_cursor': next_cursor
                 }, default=str),
                 'isBase64Encoded': False
             }
@@ -307,4 +338,4 @@ def handler(event, context):
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_connection(conn)
\ No newline at end of file
@@ -3,7 +3,7 @@ import os
 import uuid
 import requests
 import base64
-import psycopg2
+from db_pool import get_connection, release_connection
 from psycopg2.extras import RealDictCursor
 
 def handler(event, context):
@@ -33,7 +33,7 @@ def handler(event, context):
     cur = None
     
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor()
         
         if method == 'POST':
@@ -193,5 +193,4 @@ def handler(event, context):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        release_connection(conn)
\ No newline at end of file
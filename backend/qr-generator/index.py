@@ -1,19 +1,223 @@
 import json
 import os
 import io
-import qrcode
+import re
+import base64
+import hashlib
+import zipfile
 import boto3
-from datetime import datetime
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from qr_render import ERROR_CORRECTION_LEVELS, color_hex, render_variants
+from ttl_cache import TTLCache
+
+BUCKET = 'files'
+# Меняется при изменении способа отрисовки, чтобы старые картинки не отдавались из кэша
+QR_RENDER_VERSION = 2
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+QR_BATCH_MAX_CARDS = 50
+# Дополнительные размеры PNG в одном запросе (например, для сайта и для печати)
+QR_MAX_SIZES = 5
+# Параллельные HEAD/PUT/GET к хранилищу через общий пул соединений клиента
+STORAGE_CONCURRENCY = 8
+# Меньше этого числа QR-коды рисуются в текущем процессе: запуск пула дороже самой отрисовки
+QR_PROCESS_POOL_MIN = 4
+
+# Ключи объектов, которые уже есть в хранилище: повторный запрос обходится без HEAD
+known_keys = TTLCache(maxsize=10000, ttl=86400)
+s3_client = None
+
+def get_s3_client():
+    """boto3-клиент создаётся один раз на тёплый инстанс"""
+    global s3_client
+    if s3_client is None:
+        s3_client = boto3.client(
+            's3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+            config=Config(max_pool_connections=STORAGE_CONCURRENCY)
+        )
+    return s3_client
+
+def is_box_size(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 40
+
+def parse_qr_request(data):
+    """
+    Проверяет карточку из запроса
+
+    Returns:
+        (card_id, параметры матрицы: url, error_correction, fill_color, back_color,
+         варианты файлов: [(формат, размер модуля)], первый - основной PNG)
+    Raises:
+        ValueError: нет card_id/url или параметры недопустимы
+    """
+    card_id = data.get('card_id')
+    url = data.get('url')
+    if not card_id or not url or not isinstance(url, str):
+        raise ValueError('card_id and url are required')
+
+    error_correction = str(data.get('error_correction') or 'H').upper()
+    box_size = data.get('size') or 10
+    sizes = data.get('sizes') or []
+    if (error_correction not in ERROR_CORRECTION_LEVELS or not is_box_size(box_size)
+            or not isinstance(sizes, list) or len(sizes) > QR_MAX_SIZES
+            or not all(is_box_size(size) for size in sizes)):
+        raise ValueError('Invalid QR parameters')
+
+    try:
+        # Цвет приводится к #rrggbb: "black" и "#000000" дают один и тот же файл
+        fill_color = color_hex(str(data.get('fill_color') or 'black')[:32])
+        back_color = color_hex(str(data.get('back_color') or 'white')[:32])
+    except ValueError:
+        raise ValueError('Invalid QR parameters')
+
+    variants = [('png', box_size)]
+    variants += [('png', size) for size in dict.fromkeys(sizes) if size != box_size]
+    if data.get('svg'):
+        variants.append(('svg', 0))
+
+    return card_id, (url, error_correction, fill_color, back_color), variants
+
+def qr_object_key(params, variant) -> str:
+    """Ключ объекта - хэш параметров матрицы и цветов: все размеры и SVG одного кода лежат рядом"""
+    digest = hashlib.sha256(json.dumps([QR_RENDER_VERSION, *params]).encode('utf-8')).hexdigest()[:40]
+    fmt, box_size = variant
+    if fmt == 'svg':
+        return f'qr-codes/{digest}/qr.svg'
+    return f'qr-codes/{digest}/{box_size}.png'
+
+def cdn_url(file_key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
+
+def object_exists(s3, file_key: str) -> bool:
+    try:
+        s3.head_object(Bucket=BUCKET, Key=file_key)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+def render_many(jobs):
+    """
+    Отрисовка пачки: матрица каждого кода считается один раз, из неё - все нужные варианты
+    PNG-кодирование нагружает CPU, поэтому большие пачки - в пуле процессов
+
+    Args:
+        jobs: [(параметры матрицы, [варианты])]
+    Returns:
+        [[содержимое файлов]] в том же порядке
+    """
+    if len(jobs) < QR_PROCESS_POOL_MIN:
+        return [render_variants(*params, variants) for params, variants in jobs]
+    workers = min(len(jobs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_variants, *zip(*[(*params, variants) for params, variants in jobs])))
+
+def upload_file(s3, file_key: str, content: bytes, fmt: str) -> None:
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=file_key,
+        Body=content,
+        ContentType=CONTENT_TYPES[fmt],
+        # Содержимое по ключу никогда не меняется
+        CacheControl='public, max-age=31536000, immutable'
+    )
+
+def ensure_qr_codes(files_by_key):
+    """
+    Гарантирует, что файлы QR-кодов лежат в хранилище: рисует и загружает только отсутствующие
+
+    Args:
+        files_by_key: ключ объекта -> (параметры матрицы, вариант)
+    Returns:
+        (ключи, которые уже были в хранилище, содержимое только что загруженных по ключам)
+    """
+    unknown = [key for key in files_by_key if known_keys.get(key) is None]
+    cached = set(files_by_key) - set(unknown)
+    rendered = {}
+
+    if unknown:
+        s3 = get_s3_client()
+        with ThreadPoolExecutor(max_workers=STORAGE_CONCURRENCY) as pool:
+            exists = list(pool.map(lambda key: object_exists(s3, key), unknown))
+            missing = [key for key, found in zip(unknown, exists) if not found]
+            cached.update(key for key, found in zip(unknown, exists) if found)
+
+            # Недостающие варианты одного кода рисуются вместе, из одной матрицы
+            missing_by_params = {}
+            for key in missing:
+                params, _ = files_by_key[key]
+                missing_by_params.setdefault(params, []).append(key)
+            jobs = [(params, [files_by_key[key][1] for key in keys]) for params, keys in missing_by_params.items()]
+            for keys, contents in zip(missing_by_params.values(), render_many(jobs)):
+                rendered.update(zip(keys, contents))
+
+            # list() дожидается всех загрузок и пробрасывает первую ошибку
+            list(pool.map(lambda key: upload_file(s3, key, rendered[key], files_by_key[key][1][0]), missing))
+
+        for key in unknown:
+            known_keys.set(key, True)
+
+    return cached, rendered
+
+def build_zip(manifest, rendered) -> bytes:
+    """
+    ZIP для типографии: файлы каждой визитки и manifest.json
+    Уже загруженные раньше файлы скачиваются параллельно и пишутся в архив по мере готовности
+    """
+    s3 = get_s3_client()
+    buffer = io.BytesIO()
+    # PNG уже сжат, повторное сжатие только тратит CPU
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        with ThreadPoolExecutor(max_workers=STORAGE_CONCURRENCY) as pool:
+            def fetch(key):
+                if key in rendered:
+                    return rendered[key]
+                return s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+
+            entries = []
+            names = set()
+            for item in manifest:
+                name = f"card_{re.sub(r'[^0-9A-Za-z_-]', '_', str(item['card_id']))}"
+                while name in names:
+                    name += '_'
+                names.add(name)
+                # Основной PNG - card_<id>.png, остальные размеры - card_<id>_<размер>.png
+                for index, file in enumerate(item['files']):
+                    if file['format'] == 'svg':
+                        entries.append((f'{name}.svg', file['key']))
+                    elif index == 0:
+                        entries.append((f'{name}.png', file['key']))
+                    else:
+                        entries.append((f"{name}_{file['size']}.png", file['key']))
+
+            for (filename, _), content in zip(entries, pool.map(fetch, [key for _, key in entries])):
+                archive.writestr(filename, content)
+        archive.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
 
 def handler(event, context):
     '''
     Генерация QR-кодов для визиток
     POST / - создать QR-код для URL визитки
-    Body: { "card_id": 123, "url": "https://visitka.site/card/123" }
-    Returns: { "qr_url": "https://cdn.poehali.dev/..." }
+    Body: { "card_id": 123, "url": "https://visitka.site/card/123",
+            "error_correction": "H", "size": 10, "fill_color": "black", "back_color": "white",
+            "sizes": [4, 30], "svg": true }
+    Returns: { "qr_url": "https://cdn.poehali.dev/...", "card_id": 123, "cached": true,
+               "files": [{ "format": "png", "size": 10, "url", "key", "cached" }, ...] }
+    POST /?action=batch - QR-коды для команды (корпоративный тариф)
+    Body: { "cards": [{ "card_id": 123, "url": "...", ... }], "zip": false }
+    Returns: { "items": [{ "card_id", "url", "qr_url", "key", "cached", "files" }] } или ZIP с файлами и manifest.json
+    Один и тот же набор параметров всегда даёт один и тот же файл: если он уже загружен,
+    QR-код не рисуется заново
     '''
     method = event.get('httpMethod', 'POST')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
@@ -26,7 +230,7 @@ def handler(event, context):
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -34,64 +238,93 @@ def handler(event, context):
             'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
+
     try:
         body = json.loads(event.get('body', '{}'))
-        card_id = body.get('card_id')
-        url = body.get('url')
-        
-        if not card_id or not url:
+        query_params = event.get('queryStringParameters') or {}
+        is_batch = query_params.get('action') == 'batch'
+
+        if is_batch:
+            cards_data = body.get('cards')
+            if not isinstance(cards_data, list) or not cards_data or len(cards_data) > QR_BATCH_MAX_CARDS:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': f'cards must be a list of 1-{QR_BATCH_MAX_CARDS} items'}),
+                    'isBase64Encoded': False
+                }
+        else:
+            cards_data = [body]
+
+        try:
+            cards = [parse_qr_request(data) for data in cards_data]
+        except (AttributeError, ValueError) as e:
             return {
                 'statusCode': 400,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-                'body': json.dumps({'error': 'card_id and url are required'}),
+                'body': json.dumps({'error': str(e) if isinstance(e, ValueError) else 'Invalid card data'}),
                 'isBase64Encoded': False
             }
-        
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        s3 = boto3.client(
-            's3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-        )
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_key = f'qr-codes/card_{card_id}_{timestamp}.png'
-        
-        s3.put_object(
-            Bucket='files',
-            Key=file_key,
-            Body=img_buffer.getvalue(),
-            ContentType='image/png'
-        )
-        
-        qr_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
-        
+
+        files_by_key = {}
+        for _, params, variants in cards:
+            for variant in variants:
+                files_by_key[qr_object_key(params, variant)] = (params, variant)
+        cached, rendered = ensure_qr_codes(files_by_key)
+
+        manifest = []
+        for card_id, params, variants in cards:
+            files = []
+            for fmt, box_size in variants:
+                key = qr_object_key(params, (fmt, box_size))
+                files.append({
+                    'format': fmt,
+                    'size': box_size if fmt == 'png' else None,
+                    'url': cdn_url(key),
+                    'key': key,
+                    'cached': key in cached
+                })
+            manifest.append({
+                'card_id': card_id,
+                'url': params[0],
+                'qr_url': files[0]['url'],
+                'key': files[0]['key'],
+                'cached': files[0]['cached'],
+                'files': files
+            })
+
+        if not is_batch:
+            return {
+                'statusCode': 200,
+                'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+                'body': json.dumps({
+                    'qr_url': manifest[0]['qr_url'],
+                    'card_id': manifest[0]['card_id'],
+                    'cached': manifest[0]['cached'],
+                    'files': manifest[0]['files']
+                }),
+                'isBase64Encoded': False
+            }
+
+        if body.get('zip'):
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Content-Type': 'application/zip',
+                    'Content-Disposition': 'attachment; filename="qr-codes.zip"'
+                },
+                'body': base64.b64encode(build_zip(manifest, rendered)).decode('ascii'),
+                'isBase64Encoded': True
+            }
+
         return {
             'statusCode': 200,
             'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'qr_url': qr_url,
-                'card_id': card_id
-            }),
+            'body': json.dumps({'items': manifest}),
             'isBase64Encoded': False
         }
-    
+
     except Exception as e:
         return {
             'statusCode': 500,
@@ -0,0 +1,102 @@
+"""
+Отрисовка QR-кодов из матрицы модулей
+Матрица считается один раз (qrcode), из неё получаются SVG и PNG любых размеров:
+масштабирование до пикселей - np.kron, PNG кодируется напрямую как 1-битная палитра
+(2 цвета) через zlib, без попиксельного рисования в PIL.
+
+Замеры: python3 backend/benchmarks/qr_render_bench.py
+"""
+import struct
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import qrcode
+from PIL import ImageColor
+
+ERROR_CORRECTION_LEVELS = {
+    'L': qrcode.constants.ERROR_CORRECT_L,
+    'M': qrcode.constants.ERROR_CORRECT_M,
+    'Q': qrcode.constants.ERROR_CORRECT_Q,
+    'H': qrcode.constants.ERROR_CORRECT_H,
+}
+# Поле вокруг кода в модулях (минимум по стандарту - 4)
+QR_BORDER = 4
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def qr_matrix(url: str, error_correction: str = 'H') -> np.ndarray:
+    """Матрица модулей с полем: 1 - тёмный модуль, 0 - светлый"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        border=QR_BORDER,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=np.uint8)
+
+
+def color_hex(color: str) -> str:
+    """'black', '#FFF', 'rgb(...)' -> '#rrggbb'; ValueError для неизвестного цвета"""
+    red, green, blue = ImageColor.getrgb(color)[:3]
+    return f'#{red:02x}{green:02x}{blue:02x}'
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def matrix_to_png(matrix: np.ndarray, box_size: int, fill_color: str = 'black', back_color: str = 'white') -> bytes:
+    """PNG, в котором каждый модуль - квадрат box_size x box_size пикселей"""
+    pixels = np.kron(matrix, np.ones((box_size, box_size), dtype=np.uint8))
+    height, width = pixels.shape
+    # 8 пикселей в байте; перед каждой строкой - байт фильтра 0 (без фильтра)
+    rows = np.packbits(pixels, axis=1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()
+    palette = bytes.fromhex(color_hex(back_color)[1:] + color_hex(fill_color)[1:])
+    return b''.join((
+        PNG_SIGNATURE,
+        # Глубина 1 бит, тип цвета 3 - палитра: индекс 0 - фон, 1 - модули
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 3, 0, 0, 0)),
+        _png_chunk(b'PLTE', palette),
+        _png_chunk(b'IDAT', zlib.compress(raw, 6)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def matrix_to_svg(matrix: np.ndarray, fill_color: str = 'black', back_color: str = 'white') -> bytes:
+    """SVG в единицах модулей: каждая горизонтальная серия тёмных модулей - один прямоугольник пути"""
+    size = matrix.shape[1]
+    edges = np.diff(np.pad(matrix.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    # np.nonzero идёт по строкам слева направо, поэтому начала и концы серий идут парами
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    path = ''.join(
+        f'M{x} {y}h{width}v1h-{width}z'
+        for y, x, width in zip(rows.tolist(), starts.tolist(), (ends - starts).tolist())
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {matrix.shape[0]}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="{color_hex(back_color)}"/>'
+        f'<path fill="{color_hex(fill_color)}" d="{path}"/>'
+        '</svg>'
+    ).encode('utf-8')
+
+
+def render_variants(url: str, error_correction: str, fill_color: str, back_color: str,
+                    variants: Sequence[Tuple[str, int]]) -> List[bytes]:
+    """
+    Все варианты одного QR-кода из одной матрицы
+
+    Args:
+        variants: пары (формат, размер модуля): ('png', 10), ('svg', 0)
+    Returns:
+        содержимое файлов в порядке variants
+    """
+    matrix = qr_matrix(url, error_correction)
+    return [
+        matrix_to_svg(matrix, fill_color, back_color) if fmt == 'svg'
+        else matrix_to_png(matrix, box_size, fill_color, back_color)
+        for fmt, box_size in variants
+    ]
@@ -0,0 +1,49 @@
+"""
+Несколько независимых SELECT за один сетевой запрос к БД
+psycopg2 из строки с несколькими запросами возвращает только последний результат,
+поэтому запросы переписываются в один SELECT, где каждый подзапрос сворачивается
+в JSON-массив своих строк, а ответ раскладывается обратно по запросам.
+
+Значения приходят в JSON-типах: timestamp/date - строки ISO 8601, numeric - числа,
+bytea - строка '\\x...' (для неё есть bytea_from_json).
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+Query = Tuple[str, Sequence[Any]]
+
+
+def batch_sql(queries: Sequence[Query]) -> Tuple[str, List[Any]]:
+    """Собирает запросы в один SELECT; параметры идут в порядке запросов"""
+    columns = []
+    params: List[Any] = []
+    for i, (sql, query_params) in enumerate(queries):
+        # Порядок строк подзапроса с ORDER BY сохраняется в json_agg
+        columns.append(f"(SELECT COALESCE(json_agg(q{i}), '[]'::json) FROM ({sql}) AS q{i}) AS r{i}")
+        params.extend(query_params)
+    return 'SELECT ' + ',\n       '.join(columns), params
+
+
+def fetch_batch(cur, queries: Sequence[Query]) -> List[List[Dict[str, Any]]]:
+    """
+    Выполняет независимые запросы за один round trip
+
+    Args:
+        cur: курсор psycopg2 (обычный или RealDictCursor)
+        queries: пары (SQL без завершающей точки с запятой, параметры)
+
+    Returns:
+        строки каждого запроса в виде списков словарей, в порядке queries
+    """
+    sql, params = batch_sql(queries)
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    if isinstance(row, dict):
+        row = [row[f'r{i}'] for i in range(len(queries))]
+    return list(row)
+
+
+def bytea_from_json(value: Optional[str]) -> Optional[bytes]:
+    """bytea из JSON-представления Postgres ('\\x' + hex)"""
+    if value is None:
+        return None
+    return bytes.fromhex(value[2:])
@@ -1,12 +1,147 @@
+import csv
+import io
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from db_pool import get_connection, release_connection
+from query_batch import fetch_batch
+from quiz_stats import question_stats_upsert, video_stats_upsert
+
+# Максимум сессий в одном запросе импорта
+QUIZ_IMPORT_MAX_SESSIONS = 1000
+# Начиная с такого числа ответов они пишутся через COPY, а не массивами в параметрах запроса
+QUIZ_COPY_THRESHOLD = 5000
+
+# Сессии, ответы и агрегаты - одним запросом: id сессий выделяются заранее из последовательности,
+# поэтому ответы связываются с сессиями по порядковому номеру во входных массивах.
+# Сессия с уже загруженным client_session_id пропускается вместе с ответами и не входит в агрегаты.
+_SAVE_SESSIONS_SQL = """
+    WITH input AS MATERIALIZED (
+        SELECT t.*, nextval(pg_get_serial_sequence('quiz_sessions', 'id')) AS id
+        FROM unnest(
+            %(titles)s::varchar[], %(totals)s::int[], %(corrects)s::int[],
+            %(times)s::int[], %(completed_at)s::timestamp[], %(client_ids)s::varchar[]
+        ) WITH ORDINALITY AS t(
+            video_title, total_questions, correct_answers,
+            completion_time_seconds, created_at, client_session_id, n
+        )
+    ), sessions AS (
+        INSERT INTO quiz_sessions (id, video_title, total_questions, correct_answers,
+                                   completion_time_seconds, created_at, client_session_id)
+        SELECT id, video_title, total_questions, correct_answers,
+               completion_time_seconds, COALESCE(created_at, CURRENT_TIMESTAMP), client_session_id
+        FROM input
+        ON CONFLICT (client_session_id) WHERE client_session_id IS NOT NULL DO NOTHING
+        RETURNING id, created_at, video_title, total_questions, correct_answers, completion_time_seconds
+    ), video_stats AS ({video_stats}){answers_cte}
+    SELECT s.id, s.created_at FROM input i LEFT JOIN sessions s ON s.id = i.id ORDER BY i.n
+"""
+
+_ANSWERS_CTE = """, answers AS (
+        INSERT INTO quiz_answers (session_id, question_text, selected_answer_index,
+                                  correct_answer_index, is_correct, created_at)
+        SELECT s.id, a.question_text, a.selected_answer_index,
+               a.correct_answer_index, a.is_correct, s.created_at
+        FROM unnest(
+            %(answer_n)s::int[], %(answer_texts)s::text[], %(answer_selected)s::int[],
+            %(answer_correct)s::int[], %(answer_is_correct)s::bool[]
+        ) AS a(n, question_text, selected_answer_index, correct_answer_index, is_correct)
+        JOIN input i ON i.n = a.n
+        JOIN sessions s ON s.id = i.id
+        RETURNING question_text, is_correct
+    ), question_stats AS ({question_stats})"""
+
+
+def parse_session(data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Поля сессии из тела запроса; ValueError/TypeError, если значения не того типа'''
+    completed_at = data.get('completedAt')
+    client_session_id = data.get('clientSessionId')
+    if client_session_id is not None and len(str(client_session_id)) > 64:
+        raise ValueError('clientSessionId is too long')
+    return {
+        'video_title': str(data.get('videoTitle', ''))[:255],
+        'total_questions': int(data.get('totalQuestions', 0)),
+        'correct_answers': int(data.get('correctAnswers', 0)),
+        'completion_time': int(data.get('completionTimeSeconds', 0)),
+        'completed_at': datetime.fromisoformat(completed_at) if completed_at else None,
+        'client_session_id': str(client_session_id) if client_session_id is not None else None,
+        'answers': [
+            (
+                str(answer.get('questionText', '')),
+                int(answer.get('selectedAnswerIndex', -1)),
+                int(answer.get('correctAnswerIndex', -1)),
+                bool(answer.get('isCorrect', False))
+            )
+            for answer in data.get('answers', [])
+        ]
+    }
+
+
+def save_sessions(cur, sessions: List[Dict[str, Any]]) -> List[Optional[int]]:
+    '''
+    Записывает сессии и их ответы; коммит остаётся за вызывающим
+    
+    Returns:
+        id сессий в порядке входного списка, None - сессия с этим clientSessionId уже загружена
+    '''
+    params = {
+        'titles': [s['video_title'] for s in sessions],
+        'totals': [s['total_questions'] for s in sessions],
+        'corrects': [s['correct_answers'] for s in sessions],
+        'times': [s['completion_time'] for s in sessions],
+        'completed_at': [s['completed_at'] for s in sessions],
+        'client_ids': [s['client_session_id'] for s in sessions]
+    }
+    answer_count = sum(len(s['answers']) for s in sessions)
+    use_copy = answer_count > QUIZ_COPY_THRESHOLD
+    
+    if not use_copy:
+        # Все ответы уходят массивами в том же запросе, что и сессии - один round trip
+        params.update(
+            answer_n=[n for n, s in enumerate(sessions, 1) for _ in s['answers']],
+            answer_texts=[a[0] for s in sessions for a in s['answers']],
+            answer_selected=[a[1] for s in sessions for a in s['answers']],
+            answer_correct=[a[2] for s in sessions for a in s['answers']],
+            answer_is_correct=[a[3] for s in sessions for a in s['answers']]
+        )
+    
+    answers_cte = '' if use_copy else _ANSWERS_CTE.format(question_stats=question_stats_upsert('answers'))
+    cur.execute(
+        _SAVE_SESSIONS_SQL.format(video_stats=video_stats_upsert('sessions'), answers_cte=answers_cte),
+        params
+    )
+    saved = cur.fetchall()
+    
+    if use_copy:
+        # Большие пачки: ответы потоком через COPY, без раздувания текста запроса
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for session, (session_id, created_at) in zip(sessions, saved):
+            if session_id is None:
+                continue
+            for text, selected, correct, is_correct in session['answers']:
+                writer.writerow((session_id, text, selected, correct, 't' if is_correct else 'f', created_at))
+        buffer.seek(0)
+        cur.copy_expert(
+            "COPY quiz_answers (session_id, question_text, selected_answer_index, "
+            "correct_answer_index, is_correct, created_at) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        copied_ids = [session_id for session_id, _ in saved if session_id is not None]
+        cur.execute(
+            question_stats_upsert('(SELECT question_text, is_correct FROM quiz_answers WHERE session_id = ANY(%s)) AS copied'),
+            (copied_ids,)
+        )
+    
+    return [session_id for session_id, _ in saved]
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Сохраняет результаты прохождения тестов и предоставляет аналитику
+    POST / - сохранить сессию с ответами
+    POST /?action=import - сохранить пачку сессий ({"sessions": [...]}), повторы по clientSessionId пропускаются
+    GET / - аналитика
     Args: event - dict с httpMethod, body (данные теста)
           context - объект с request_id и др.
     Returns: HTTP response dict
@@ -26,8 +161,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    if not dsn:
+    if not os.environ.get('DATABASE_URL'):
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -35,79 +169,95 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
+    conn = get_connection()
     
     try:
         if method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
-            video_title = body_data.get('videoTitle', '')
-            total_questions = body_data.get('totalQuestions', 0)
-            correct_answers = body_data.get('correctAnswers', 0)
-            completion_time = body_data.get('completionTimeSeconds', 0)
-            answers = body_data.get('answers', [])
+            query_params = event.get('queryStringParameters') or {}
             
+            # POST ?action=import - пачка завершённых сессий с офлайн-киосков
+            if query_params.get('action') == 'import':
+                sessions_data = body_data.get('sessions')
+                if not isinstance(sessions_data, list) or not sessions_data or len(sessions_data) > QUIZ_IMPORT_MAX_SESSIONS:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'sessions must be a list of 1-{QUIZ_IMPORT_MAX_SESSIONS} items'}),
+                        'isBase64Encoded': False
+                    }
+            else:
+                sessions_data = [body_data]
+            
+            try:
+                sessions = [parse_session(data) for data in sessions_data]
+            except (AttributeError, TypeError, ValueError):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid session data'}),
+                    'isBase64Encoded': False
+                }
+            
+            # Сессии и ответы - одна транзакция и один коммит
             with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO quiz_sessions (video_title, total_questions, correct_answers, completion_time_seconds) "
-                    "VALUES (%s, %s, %s, %s) RETURNING id",
-                    (video_title, total_questions, correct_answers, completion_time)
-                )
-                session_id = cur.fetchone()[0]
-                
-                for answer in answers:
-                    cur.execute(
-                        "INSERT INTO quiz_answers (session_id, question_text, selected_answer_index, "
-                        "correct_answer_index, is_correct) VALUES (%s, %s, %s, %s, %s)",
-                        (
-                            session_id,
-                            answer.get('questionText', ''),
-                            answer.get('selectedAnswerIndex', -1),
-                            answer.get('correctAnswerIndex', -1),
-                            answer.get('isCorrect', False)
-                        )
-                    )
+                session_ids = save_sessions(cur, sessions)
+            conn.commit()
+            
+            if query_params.get('action') == 'import':
+                imported = sum(1 for session_id in session_ids if session_id is not None)
+                response = {
+                    'success': True,
+                    'imported': imported,
+                    'duplicates': len(session_ids) - imported,
+                    'sessionIds': session_ids
+                }
+            else:
+                response = {'success': True, 'sessionId': session_ids[0]}
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'sessionId': session_id}),
+                'body': json.dumps(response),
                 'isBase64Encoded': False
             }
         
         if method == 'GET':
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT 
-                        video_title,
-                        COUNT(*) as total_sessions,
-                        AVG(correct_answers::float / total_questions * 100) as avg_score,
-                        AVG(completion_time_seconds) as avg_time
-                    FROM quiz_sessions
-                    GROUP BY video_title
-                    ORDER BY total_sessions DESC
-                """)
-                video_stats = cur.fetchall()
-                
-                cur.execute("""
-                    SELECT 
-                        question_text,
-                        COUNT(*) as total_answers,
-                        SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct_count,
-                        ROUND(SUM(CASE WHEN is_correct THEN 1 ELSE 0 END)::numeric / COUNT(*) * 100, 1) as success_rate
-                    FROM quiz_answers
-                    GROUP BY question_text
-                    ORDER BY success_rate ASC
-                    LIMIT 10
-                """)
-                difficult_questions = cur.fetchall()
-                
-                cur.execute("""
-                    SELECT COUNT(*) as total_sessions,
-                           AVG(correct_answers::float / total_questions * 100) as overall_avg_score
-                    FROM quiz_sessions
-                """)
-                overall_stats = cur.fetchone()
+            # Три независимых выборки из агрегатов quiz_stats за один запрос к БД
+            with conn.cursor() as cur:
+                video_stats, difficult_questions, overall_rows = fetch_batch(cur, [
+                    ("""
+                        SELECT 
+                            video_title,
+                            sessions_count as total_sessions,
+                            score_sum / NULLIF(scored_count, 0) as avg_score,
+                            SQRT(GREATEST(score_sq_sum / NULLIF(scored_count, 0)
+                                          - (score_sum / NULLIF(scored_count, 0)) ^ 2, 0)) as score_stddev,
+                            time_sum / NULLIF(time_count, 0) as avg_time,
+                            SQRT(GREATEST(time_sq_sum / NULLIF(time_count, 0)
+                                          - (time_sum / NULLIF(time_count, 0)) ^ 2, 0)) as time_stddev
+                        FROM quiz_video_stats
+                        ORDER BY total_sessions DESC
+                    """, ()),
+                    ("""
+                        SELECT 
+                            question_id::text as question_id,
+                            question_text,
+                            answers_count as total_answers,
+                            correct_count,
+                            ROUND(correct_count::numeric / answers_count * 100, 1) as success_rate
+                        FROM quiz_question_stats
+                        WHERE answers_count > 0
+                        ORDER BY success_rate ASC
+                        LIMIT 10
+                    """, ()),
+                    ("""
+                        SELECT COALESCE(SUM(sessions_count), 0) as total_sessions,
+                               SUM(score_sum) / NULLIF(SUM(scored_count), 0) as overall_avg_score
+                        FROM quiz_video_stats
+                    """, ())
+                ])
+                overall_stats = overall_rows[0]
             
             return {
                 'statusCode': 200,
@@ -128,4 +278,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         
     finally:
-        conn.close()
+        release_connection(conn)
@@ -0,0 +1,110 @@
+"""
+Агрегаты аналитики тестов: суммы по видео и по вопросам
+quiz-analytics обновляет их в той же транзакции, что и запись сессий, а GET читает
+только их. Для видео хранятся count, sum и sum of squares процента правильных ответов
+и времени прохождения - из них считаются среднее и стандартное отклонение.
+Вопросы адресуются quiz_question_id(question_text) - 64-битным хэшем текста.
+
+Пересборка по всей истории (после выкладки или при расхождении):
+    DATABASE_URL=postgresql://... python3 backend/quiz_stats.py --rebuild
+"""
+import sys
+from typing import Tuple
+
+SCHEMA = 't_p18253922_infinite_business_ca'
+SESSIONS_TABLE = f'{SCHEMA}.quiz_sessions'
+ANSWERS_TABLE = f'{SCHEMA}.quiz_answers'
+VIDEO_STATS_TABLE = f'{SCHEMA}.quiz_video_stats'
+QUESTION_STATS_TABLE = f'{SCHEMA}.quiz_question_stats'
+
+
+def video_stats_upsert(source: str) -> str:
+    """
+    INSERT ... ON CONFLICT, добавляющий сессии из source к суммам по видео
+
+    Args:
+        source: таблица или CTE с колонками video_title, total_questions,
+                correct_answers, completion_time_seconds
+    """
+    # Строки упорядочены по ключу, чтобы параллельные транзакции блокировали их в одном порядке
+    return f"""
+        INSERT INTO {VIDEO_STATS_TABLE} AS v (video_title, sessions_count, scored_count, score_sum,
+                                              score_sq_sum, time_count, time_sum, time_sq_sum)
+        SELECT video_title, COUNT(*), COUNT(score), COALESCE(SUM(score), 0), COALESCE(SUM(score * score), 0),
+               COUNT(completion_time_seconds), COALESCE(SUM(completion_time_seconds), 0),
+               COALESCE(SUM(completion_time_seconds::float8 * completion_time_seconds), 0)
+        FROM (
+            SELECT video_title, completion_time_seconds,
+                   CASE WHEN total_questions > 0
+                        THEN correct_answers::float8 / total_questions * 100 END AS score
+            FROM {source}
+        ) s
+        GROUP BY video_title
+        ORDER BY video_title
+        ON CONFLICT (video_title) DO UPDATE
+        SET sessions_count = v.sessions_count + EXCLUDED.sessions_count,
+            scored_count = v.scored_count + EXCLUDED.scored_count,
+            score_sum = v.score_sum + EXCLUDED.score_sum,
+            score_sq_sum = v.score_sq_sum + EXCLUDED.score_sq_sum,
+            time_count = v.time_count + EXCLUDED.time_count,
+            time_sum = v.time_sum + EXCLUDED.time_sum,
+            time_sq_sum = v.time_sq_sum + EXCLUDED.time_sq_sum,
+            updated_at = CURRENT_TIMESTAMP
+    """
+
+
+def question_stats_upsert(source: str) -> str:
+    """
+    INSERT ... ON CONFLICT, добавляющий ответы из source к счётчикам вопросов
+
+    Args:
+        source: таблица или CTE с колонками question_text, is_correct
+    """
+    return f"""
+        INSERT INTO {QUESTION_STATS_TABLE} AS q (question_id, question_text, answers_count, correct_count)
+        SELECT {SCHEMA}.quiz_question_id(question_text), MIN(question_text),
+               COUNT(*), COUNT(*) FILTER (WHERE is_correct)
+        FROM {source}
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (question_id) DO UPDATE
+        SET answers_count = q.answers_count + EXCLUDED.answers_count,
+            correct_count = q.correct_count + EXCLUDED.correct_count,
+            updated_at = CURRENT_TIMESTAMP
+    """
+
+
+def rebuild_quiz_stats(conn) -> Tuple[int, int]:
+    """
+    Пересчитывает агрегаты по всей истории в одной транзакции
+
+    Запись новых сессий ждёт окончания пересборки (SHARE-блокировка исходных таблиц),
+    поэтому их вклад не теряется и не учитывается дважды.
+
+    Returns:
+        (число видео, число вопросов)
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {SESSIONS_TABLE}, {ANSWERS_TABLE} IN SHARE MODE")
+        cur.execute(f"DELETE FROM {VIDEO_STATS_TABLE}")
+        cur.execute(f"DELETE FROM {QUESTION_STATS_TABLE}")
+        cur.execute(video_stats_upsert(SESSIONS_TABLE))
+        videos = cur.rowcount
+        cur.execute(question_stats_upsert(ANSWERS_TABLE))
+        questions = cur.rowcount
+    conn.commit()
+    return videos, questions
+
+
+if __name__ == '__main__':
+    if '--rebuild' not in sys.argv:
+        sys.exit('Usage: python3 backend/quiz_stats.py --rebuild')
+
+    from db_pool import get_connection, release_connection
+
+    connection = get_connection()
+    try:
+        video_count, question_count = rebuild_quiz_stats(connection)
+        print(f'Done: {video_count} videos, {question_count} questions')
+    finally:
+        release_connection(connection)
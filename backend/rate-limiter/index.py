@@ -1,36 +1,40 @@
 import json
-import time
 from typing import Dict, Any, Optional
-from dataclasses import dataclass, field
+from rate_limit_utils import RateLimiter, RateLimitCheck, RateLimitResult
 
-@dataclass
-class RateLimitStore:
-    requests: Dict[str, list] = field(default_factory=dict)
+MAX_BATCH_SIZE = 20
 
-store = RateLimitStore()
+limiter = RateLimiter()
 
-def rate_limit(
-    identifier: str,
-    max_requests: int = 10,
-    window_seconds: int = 60
-) -> tuple[bool, Optional[int]]:
-    current_time = time.time()
+def parse_check(raw: Any) -> Optional[RateLimitCheck]:
+    """Проверяет и приводит одну запись {identifier, max_requests, window_seconds, cost}"""
+    if not isinstance(raw, dict):
+        return None
     
-    if identifier not in store.requests:
-        store.requests[identifier] = []
+    identifier = raw.get('identifier', '')
+    max_requests = raw.get('max_requests', 10)
+    window_seconds = raw.get('window_seconds', 60)
+    cost = raw.get('cost', 1)
     
-    store.requests[identifier] = [
-        req_time for req_time in store.requests[identifier]
-        if current_time - req_time < window_seconds
-    ]
+    if not identifier or not isinstance(identifier, str) or len(identifier) > 255:
+        return None
+    if not isinstance(max_requests, int) or max_requests <= 0:
+        return None
+    if not isinstance(window_seconds, (int, float)) or window_seconds <= 0:
+        return None
+    if not isinstance(cost, int) or cost <= 0:
+        return None
     
-    if len(store.requests[identifier]) >= max_requests:
-        oldest_request = store.requests[identifier][0]
-        retry_after = int(window_seconds - (current_time - oldest_request))
-        return False, retry_after
-    
-    store.requests[identifier].append(current_time)
-    return True, None
+    return RateLimitCheck(identifier, max_requests, window_seconds, cost)
+
+def format_result(check: RateLimitCheck, result: RateLimitResult) -> Dict[str, Any]:
+    return {
+        'identifier': check.identifier,
+        'allowed': result.allowed,
+        'remaining': result.remaining,
+        'reset_after': round(result.reset_after, 3),
+        'retry_after': result.retry_after
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -57,11 +61,59 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     body_data = json.loads(event.get('body', '{}'))
-    identifier = body_data.get('identifier', '')
-    max_requests = body_data.get('max_requests', 10)
-    window_seconds = body_data.get('window_seconds', 60)
+    peek = bool(body_data.get('peek', False))
     
-    if not identifier:
+    # Пакетная проверка: все лимиты расходуются только если разрешены все
+    if 'checks' in body_data:
+        raw_checks = body_data.get('checks')
+        
+        if not isinstance(raw_checks, list) or not raw_checks or len(raw_checks) > MAX_BATCH_SIZE:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': f'checks must be a list of 1-{MAX_BATCH_SIZE} entries'}),
+                'isBase64Encoded': False
+            }
+        
+        checks = []
+        for index, raw in enumerate(raw_checks):
+            check = parse_check(raw)
+            if not check:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json'},
+                    'body': json.dumps({'error': f'Invalid check at index {index}'}),
+                    'isBase64Encoded': False
+                }
+            checks.append(check)
+        
+        allowed, results = limiter.hit_many(checks, peek=peek)
+        retry_after = max((r.retry_after for r in results if r.retry_after), default=None)
+        
+        response_headers = {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }
+        if not allowed:
+            response_headers['Retry-After'] = str(retry_after)
+        
+        return {
+            'statusCode': 200 if allowed else 429,
+            'headers': response_headers,
+            'body': json.dumps({
+                'allowed': allowed,
+                'peek': peek,
+                'retry_after': retry_after,
+                'results': [
+                    format_result(check, result) for check, result in zip(checks, results)
+                ]
+            }),
+            'isBase64Encoded': False
+        }
+    
+    check = parse_check(body_data)
+    
+    if not check:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json'},
@@ -69,19 +121,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    allowed, retry_after = rate_limit(identifier, max_requests, window_seconds)
+    result = limiter.hit(check.identifier, check.max_requests, check.window_seconds, check.cost, peek=peek)
     
-    if not allowed:
+    if not result.allowed:
         return {
             'statusCode': 429,
             'headers': {
                 'Content-Type': 'application/json',
-                'Retry-After': str(retry_after),
+                'Retry-After': str(result.retry_after),
                 'Access-Control-Allow-Origin': '*'
             },
             'body': json.dumps({
                 'error': 'Too many requests',
-                'retry_after': retry_after
+                'retry_after': result.retry_after,
+                'remaining': result.remaining,
+                'reset_after': round(result.reset_after, 3)
             }),
             'isBase64Encoded': False
         }
@@ -94,7 +148,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         },
         'body': json.dumps({
             'allowed': True,
-            'remaining': max_requests - len(store.requests[identifier])
+            'peek': peek,
+            'remaining': result.remaining,
+            'reset_after': round(result.reset_after, 3)
         }),
         'isBase64Encoded': False
-    }
+    }
\ No newline at end of file
@@ -1,51 +1,369 @@
 """
 Утилита для rate limiting внутри функций
 Используется in-memory хранилище (работает в serverless)
+
+Алгоритм GCRA (Generic Cell Rate Algorithm): на каждый идентификатор хранится
+одно число - теоретическое время прибытия (TAT) следующего запроса.
+Память на ключ постоянна, проверка выполняется за O(1), а простаивающие ключи
+вытесняются ограниченным LRU.
+
+Режимы (параметр mode):
+    local  - только память инстанса (сбрасывается при холодном старте)
+    strict - общий для всех инстансов счётчик в UNLOGGED-таблице PostgreSQL
+    hybrid - локально, пока лимит явно не близок, и PostgreSQL у порога
 """
+import math
+import os
+import threading
 import time
-from typing import Dict, Tuple, Optional
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Максимум отслеживаемых идентификаторов на один инстанс
+DEFAULT_MAX_KEYS = 100_000
+# Доля лимита, до которой hybrid-режим отвечает без обращения к БД
+HYBRID_LOCAL_FRACTION = float(os.environ.get('RATE_LIMIT_HYBRID_FRACTION', '0.5'))
+# Как часто инстанс удаляет истёкшие строки счётчиков
+SWEEP_INTERVAL_SECONDS = 300
+
+COUNTERS_TABLE = 't_p18253922_infinite_business_ca.rate_limit_counters'
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    retry_after: Optional[int]
+    remaining: int
+    reset_after: float
+
+
+class RateLimitCheck(NamedTuple):
+    identifier: str
+    max_requests: int = 10
+    window_seconds: float = 60
+    cost: int = 1
+
+
+class _Entry:
+    __slots__ = ('tat',)
+
+    def __init__(self, tat: float):
+        self.tat = tat
+
+
+class RateLimiter:
+    """
+    Ограничитель запросов с фиксированным размером записи на ключ
+
+    Эквивалентен скользящему окну "max_requests запросов за window_seconds",
+    но вместо списка временных меток хранит одно значение TAT.
+    """
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _evaluate(
+        stored_tat: Optional[float],
+        now: float,
+        max_requests: int,
+        window_seconds: float,
+        cost: int
+    ) -> Tuple[RateLimitResult, Optional[float]]:
+        """Решение GCRA и новое значение TAT (None, если запрос отклонён)"""
+        if max_requests <= 0:
+            return RateLimitResult(False, max(1, math.ceil(window_seconds)), 0, window_seconds), None
+
+        interval = window_seconds / max_requests
+        tat = stored_tat if stored_tat is not None and stored_tat > now else now
+        new_tat = tat + interval * cost
+        allow_at = new_tat - window_seconds
+
+        if now < allow_at:
+            retry_after = max(1, math.ceil(allow_at - now))
+            remaining = int((now + window_seconds - tat) / interval)
+            return RateLimitResult(False, retry_after, max(0, remaining), tat - now), None
+
+        remaining = int((now + window_seconds - new_tat) / interval)
+        return RateLimitResult(True, None, max(0, remaining), new_tat - now), new_tat
+
+    def _store(self, identifier: str, new_tat: float, now: float) -> None:
+        entry = self._entries.get(identifier)
+        if entry is not None:
+            entry.tat = new_tat
+            self._entries.move_to_end(identifier)
+            return
+
+        self._entries[identifier] = _Entry(new_tat)
+        # Самый давний ключ вытесняется, если он уже простаивает или превышен размер
+        oldest = next(iter(self._entries.values()))
+        if oldest.tat <= now or len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def hit(
+        self,
+        identifier: str,
+        max_requests: int = 10,
+        window_seconds: float = 60,
+        cost: int = 1,
+        now: Optional[float] = None,
+        peek: bool = False
+    ) -> RateLimitResult:
+        """
+        Списывает cost единиц из лимита идентификатора
+
+        Args:
+            identifier: уникальный ID (IP, user_id, email)
+            max_requests: макс запросов в окне
+            window_seconds: размер окна в секундах
+            cost: вес запроса
+            now: текущее время (для тестов)
+            peek: только проверить, не расходуя лимит
+
+        Returns:
+            RateLimitResult с решением, временем повтора и остатком лимита
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(identifier)
+            result, new_tat = self._evaluate(
+                entry.tat if entry is not None else None,
+                now, max_requests, window_seconds, cost
+            )
+            if new_tat is not None and not peek:
+                self._store(identifier, new_tat, now)
+
+        return result
+
+    def hit_many(
+        self,
+        checks: List[RateLimitCheck],
+        now: Optional[float] = None,
+        peek: bool = False
+    ) -> Tuple[bool, List[RateLimitResult]]:
+        """
+        Проверяет несколько лимитов по принципу "всё или ничего"
+
+        Лимиты расходуются, только если разрешены все проверки. Повторяющиеся
+        идентификаторы учитываются последовательно, как отдельные запросы.
+
+        Args:
+            checks: список RateLimitCheck
+            now: текущее время (для тестов)
+            peek: только проверить, не расходуя лимит
+
+        Returns:
+            (allowed, results): общее решение и результат по каждой проверке
+        """
+        if now is None:
+            now = time.time()
+
+        results: List[RateLimitResult] = []
+        pending: Dict[str, float] = {}
+
+        with self._lock:
+            for check in checks:
+                if check.identifier in pending:
+                    stored_tat = pending[check.identifier]
+                else:
+                    entry = self._entries.get(check.identifier)
+                    stored_tat = entry.tat if entry is not None else None
+
+                result, new_tat = self._evaluate(
+                    stored_tat, now, check.max_requests, check.window_seconds, check.cost
+                )
+                results.append(result)
+                if new_tat is not None:
+                    pending[check.identifier] = new_tat
+
+            allowed = all(result.allowed for result in results)
+            if allowed and not peek:
+                for identifier, new_tat in pending.items():
+                    self._store(identifier, new_tat, now)
+
+        return allowed, results
+
+    def reset(self, identifier: str) -> None:
+        """Сбрасывает лимит идентификатора"""
+        with self._lock:
+            self._entries.pop(identifier, None)
 
-@dataclass
-class RateLimitStore:
-    requests: Dict[str, list] = field(default_factory=dict)
 
 # Глобальное хранилище для всех функций
-_store = RateLimitStore()
+_limiter = RateLimiter()
+
+# Локальный учёт hybrid-режима и ещё не отправленные в БД запросы:
+# identifier -> (стоимость, max_requests, window_seconds)
+_hybrid_limiter = RateLimiter()
+_hybrid_pending: 'OrderedDict[str, Tuple[int, int, float]]' = OrderedDict()
+_last_sweep = 0.0
+
+# Атомарный upsert-and-check за один round trip (тот же GCRA, время берётся из БД)
+_POSTGRES_HIT_SQL = f"""
+    WITH clock AS (
+        SELECT EXTRACT(EPOCH FROM clock_timestamp())::double precision AS now
+    ), upsert AS (
+        INSERT INTO {COUNTERS_TABLE} AS c (key, tat)
+        SELECT %(key)s, clock.now + %(increment)s FROM clock
+        ON CONFLICT (key) DO UPDATE
+            SET tat = GREATEST(c.tat + %(increment)s, EXCLUDED.tat)
+            WHERE GREATEST(c.tat + %(increment)s, EXCLUDED.tat) - %(window)s
+                  <= EXCLUDED.tat - %(increment)s
+        RETURNING c.tat
+    )
+    SELECT TRUE, upsert.tat, clock.now FROM upsert, clock
+    UNION ALL
+    SELECT FALSE, c.tat, clock.now FROM {COUNTERS_TABLE} c, clock
+    WHERE c.key = %(key)s AND NOT EXISTS (SELECT 1 FROM upsert)
+"""
+
+# Безусловное списание уже пропущенных запросов (без проверки лимита)
+_POSTGRES_CHARGE_SQL = f"""
+    INSERT INTO {COUNTERS_TABLE} AS c (key, tat)
+    VALUES (%(key)s, EXTRACT(EPOCH FROM clock_timestamp())::double precision + %(increment)s)
+    ON CONFLICT (key) DO UPDATE
+        SET tat = GREATEST(c.tat, EXCLUDED.tat - %(increment)s) + %(increment)s
+"""
+
+_POSTGRES_SWEEP_SQL = f"""
+    DELETE FROM {COUNTERS_TABLE}
+    WHERE tat < EXTRACT(EPOCH FROM clock_timestamp())::double precision
+"""
+
+
+def _hit_postgres(
+    identifier: str,
+    max_requests: int,
+    window_seconds: float,
+    cost: int = 1
+) -> RateLimitResult:
+    """Списывает cost единиц из общего для всех инстансов счётчика"""
+    global _last_sweep
+
+    if max_requests <= 0:
+        return RateLimitResult(False, max(1, math.ceil(window_seconds)), 0, window_seconds)
+    interval = window_seconds / max_requests
+    increment = interval * cost
+    if increment > window_seconds:
+        return RateLimitResult(False, max(1, math.ceil(window_seconds)), 0, window_seconds)
+
+    from db_pool import get_connection, release_connection
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_POSTGRES_HIT_SQL, {
+                'key': identifier,
+                'increment': increment,
+                'window': window_seconds
+            })
+            allowed, tat, now = cur.fetchone()
+
+            if time.time() - _last_sweep > SWEEP_INTERVAL_SECONDS:
+                _last_sweep = time.time()
+                cur.execute(_POSTGRES_SWEEP_SQL)
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+    if allowed:
+        remaining = int((now + window_seconds - tat) / interval)
+        return RateLimitResult(True, None, max(0, remaining), tat - now)
+
+    retry_after = max(1, math.ceil(tat + increment - window_seconds - now))
+    remaining = int((now + window_seconds - tat) / interval)
+    return RateLimitResult(False, retry_after, max(0, remaining), tat - now)
+
+
+def _charge_postgres(identifier: str, max_requests: int, window_seconds: float, cost: int) -> None:
+    """Записывает в общий счётчик запросы, которые уже были пропущены локально"""
+    if max_requests <= 0 or cost <= 0:
+        return
+
+    from db_pool import get_connection, release_connection
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_POSTGRES_CHARGE_SQL, {
+                'key': identifier,
+                'increment': window_seconds / max_requests * cost
+            })
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+
+def _hit_hybrid(
+    identifier: str,
+    max_requests: int,
+    window_seconds: float,
+    cost: int = 1
+) -> RateLimitResult:
+    """Отвечает локально вдали от лимита и сверяется с БД у порога"""
+    local = _hybrid_limiter.hit(identifier, max_requests, window_seconds, cost)
+    used = max_requests - local.remaining
+
+    if local.allowed and used <= max_requests * HYBRID_LOCAL_FRACTION:
+        queued = _hybrid_pending.pop(identifier, (0, max_requests, window_seconds))[0]
+        _hybrid_pending[identifier] = (queued + cost, max_requests, window_seconds)
+        if len(_hybrid_pending) > DEFAULT_MAX_KEYS:
+            # Вытесняемые запросы уже пропущены - они списываются в БД, а не теряются
+            evicted, (evicted_cost, evicted_max, evicted_window) = _hybrid_pending.popitem(last=False)
+            _charge_postgres(evicted, evicted_max, evicted_window, evicted_cost)
+        return local
+
+    # Накопленные локально запросы списываются в БД вместе с текущим
+    pending = _hybrid_pending.pop(identifier, (0,))[0]
+    result = _hit_postgres(identifier, max_requests, window_seconds, pending + cost)
+    if not result.allowed and pending:
+        # Отклонён весь пакет: накопленные запросы уже обслужены и списываются
+        # без проверки, а текущий проверяется отдельно
+        _charge_postgres(identifier, max_requests, window_seconds, pending)
+        result = _hit_postgres(identifier, max_requests, window_seconds, cost)
+    return result
+
 
 def check_rate_limit(
     identifier: str,
     max_requests: int = 10,
-    window_seconds: int = 60
+    window_seconds: int = 60,
+    mode: str = 'local'
 ) -> Tuple[bool, Optional[int]]:
     """
     Проверяет rate limit для идентификатора
-    
+
     Args:
         identifier: уникальный ID (IP, user_id, email)
         max_requests: макс запросов в окне
         window_seconds: размер окна в секундах
-    
+        mode: 'local', 'strict' (PostgreSQL) или 'hybrid'
+
     Returns:
         (allowed, retry_after): разрешен ли запрос и через сколько повторить
     """
-    current_time = time.time()
-    
-    if identifier not in _store.requests:
-        _store.requests[identifier] = []
-    
-    # Удаляем старые запросы
-    _store.requests[identifier] = [
-        req_time for req_time in _store.requests[identifier]
-        if current_time - req_time < window_seconds
-    ]
-    
-    # Проверяем лимит
-    if len(_store.requests[identifier]) >= max_requests:
-        oldest_request = _store.requests[identifier][0]
-        retry_after = int(window_seconds - (current_time - oldest_request))
-        return False, retry_after
-    
-    # Добавляем текущий запрос
-    _store.requests[identifier].append(current_time)
-    return True, None
+    if mode == 'local':
+        result = _limiter.hit(identifier, max_requests, window_seconds)
+        return result.allowed, result.retry_after
+
+    try:
+        if mode == 'strict':
+            result = _hit_postgres(identifier, max_requests, window_seconds)
+        elif mode == 'hybrid':
+            result = _hit_hybrid(identifier, max_requests, window_seconds)
+        else:
+            raise ValueError(f'Unknown rate limit mode: {mode}')
+    except ValueError:
+        raise
+    except Exception as e:
+        # БД недоступна - не блокируем пользователей, считаем локально
+        print(f'Rate limit storage error, falling back to local: {e}')
+        result = _limiter.hit(identifier, max_requests, window_seconds)
+
+    return result.allowed, result.retry_after
@@ -1,7 +1,6 @@
 import json
-import os
-import psycopg2
-import jwt
+from db_pool import get_connection, release_connection
+from jwt_auth import AuthError, verify_token
 from typing import Dict, Any
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -46,9 +45,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        payload = jwt.decode(auth_token, os.environ['JWT_SECRET'], algorithms=['HS256'])
-        user_id = payload['user_id']
-    except:
+        user_id = verify_token(auth_token)['user_id']
+    except AuthError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': e.message}),
+            'isBase64Encoded': False
+        }
+    except KeyError:
         return {
             'statusCode': 401,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -56,7 +61,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection()
     cur = conn.cursor()
     
     cur.execute("""
@@ -84,7 +89,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         })
     
     cur.close()
-    conn.close()
+    release_connection(conn)
     
     return {
         'statusCode': 200,
@@ -4,11 +4,11 @@ Backend функция для реферальной программы.
 """
 
 import json
-import os
 import random
 import string
 from typing import Dict, Any
-import psycopg2
+from db_pool import get_connection, release_connection
+from query_batch import fetch_batch
 
 def generate_referral_code(user_id: int) -> str:
     """Генерирует уникальный реферальный код"""
@@ -38,7 +38,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_connection()
     cur = conn.cursor()
     
     try:
@@ -54,11 +54,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Получаем или создаем реферальный код
-            cur.execute('SELECT referral_code FROM referrals WHERE user_id = %s LIMIT 1', (user_id,))
-            result = cur.fetchone()
+            # Код, статистика и последние приглашённые - за один запрос к БД
+            codes, stats_rows, referred_users = fetch_batch(cur, [
+                ('SELECT referral_code FROM referrals WHERE user_id = %s LIMIT 1', (user_id,)),
+                ("""
+                    SELECT COUNT(*) as total_referrals, 
+                           COUNT(CASE WHEN reward_granted = true THEN 1 END) as rewarded
+                    FROM referrals 
+                    WHERE user_id = %s AND referred_user_id IS NOT NULL
+                """, (user_id,)),
+                ("""
+                    SELECT u.full_name, r.created_at, r.reward_granted
+                    FROM referrals r
+                    JOIN users u ON r.referred_user_id = u.id
+                    WHERE r.user_id = %s
+                    ORDER BY r.created_at DESC
+                    LIMIT 10
+                """, (user_id,))
+            ])
+            stats = stats_rows[0]
             
-            if not result:
+            if not codes:
                 # Создаем новый реферальный код
                 referral_code = generate_referral_code(int(user_id))
                 cur.execute(
@@ -67,40 +83,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 conn.commit()
             else:
-                referral_code = result[0]
-            
-            # Получаем статистику рефералов
-            cur.execute("""
-                SELECT COUNT(*) as total_referrals, 
-                       COUNT(CASE WHEN reward_granted = true THEN 1 END) as rewarded
-                FROM referrals 
-                WHERE user_id = %s AND referred_user_id IS NOT NULL
-            """, (user_id,))
-            stats = cur.fetchone()
-            
-            # Получаем список приглашенных пользователей
-            cur.execute("""
-                SELECT u.full_name, r.created_at, r.reward_granted
-                FROM referrals r
-                JOIN users u ON r.referred_user_id = u.id
-                WHERE r.user_id = %s
-                ORDER BY r.created_at DESC
-                LIMIT 10
-            """, (user_id,))
-            referred_users = cur.fetchall()
+                referral_code = codes[0]['referral_code']
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'body': json.dumps({
                     'referral_code': referral_code,
-                    'total_referrals': stats[0] or 0,
-                    'rewards_earned': stats[1] or 0,
+                    'total_referrals': stats['total_referrals'] or 0,
+                    'rewards_earned': stats['rewarded'] or 0,
                     'referred_users': [
                         {
-                            'name': u[0],
-                            'joined_at': u[1].isoformat() if u[1] else None,
-                            'reward_granted': u[2]
+                            'name': u['full_name'],
+                            'joined_at': u['created_at'],
+                            'reward_granted': u['reward_granted']
                         } for u in referred_users
                     ]
                 }),
@@ -179,4 +175,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
@@ -2,11 +2,10 @@ import json
 import os
 import time
 import requests
-import smtplib
 from datetime import datetime
 from typing import Dict, List, Any
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email_templates import build_message
+from smtp_mailer import get_mailer
 
 def handler(event, context):
     '''
@@ -514,14 +513,11 @@ def check_leads_security(url: str) -> Dict[str, Any]:
 def send_alert_email(results: Dict[str, Any]) -> None:
     '''Отправка email уведомления при проблемах безопасности'''
     
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_port = int(os.environ.get('SMTP_PORT', '465'))
-    smtp_user = os.environ.get('SMTP_USER')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
+    mailer = get_mailer()
     admin_email = os.environ.get('ADMIN_EMAIL')
     
     # Если SMTP не настроен - пропускаем
-    if not all([smtp_host, smtp_user, smtp_password, admin_email]):
+    if mailer is None or not admin_email:
         return
     
     try:
@@ -549,57 +545,23 @@ def send_alert_email(results: Dict[str, Any]) -> None:
                     icon = '❌' if check['status'] == 'failed' else '⚠️'
                     problems.append(f"{icon} {func_name}: {check['name']} - {check['message']}")
         
-        # Формируем HTML письмо
-        html_content = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
-            <div style="max-width: 600px; margin: 0 auto; background: white; padding: 40px; border-radius: 10px;">
-              <h1 style="color: {status_color}; margin-bottom: 20px;">
-                {status_emoji} Security Monitor Alert
-              </h1>
-              
-              <div style="background: #f9f9f9; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                <h2 style="margin: 0 0 10px 0; color: #333;">Уровень безопасности: {results['security_score']}%</h2>
-                <p style="margin: 5px 0; color: #666;"><strong>Статус:</strong> {status}</p>
-                <p style="margin: 5px 0; color: #666;"><strong>Проверок пройдено:</strong> {results['passed']}/{results['total_checks']}</p>
-                <p style="margin: 5px 0; color: #666;"><strong>Предупреждений:</strong> {results['warnings']}</p>
-                <p style="margin: 5px 0; color: #666;"><strong>Ошибок:</strong> {results['failed']}</p>
-                <p style="margin: 5px 0; color: #999; font-size: 14px;"><strong>Время проверки:</strong> {results['timestamp']}</p>
-              </div>
-              
-              <h3 style="color: #333; margin-top: 30px;">Обнаруженные проблемы:</h3>
-              <ul style="color: #666; line-height: 1.8;">
-                {''.join([f'<li>{problem}</li>' for problem in problems]) if problems else '<li>Нет критичных проблем</li>'}
-              </ul>
-              
-              <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
-                <p style="color: #999; font-size: 14px;">
-                  Это автоматическое уведомление от системы мониторинга безопасности.<br>
-                  Проверка выполняется автоматически при каждом запросе к security-monitor функции.
-                </p>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-        
-        # Создаем письмо
-        msg = MIMEMultipart('alternative')
-        msg['From'] = smtp_user
-        msg['To'] = admin_email
-        msg['Subject'] = f'{status_emoji} Security Alert: {results["security_score"]}% | {results["failed"]} Failed'
-        msg.attach(MIMEText(html_content, 'html'))
-        
-        # Отправляем
-        if smtp_port == 465:
-            server = smtplib.SMTP_SSL(smtp_host, smtp_port)
-        else:
-            server = smtplib.SMTP(smtp_host, smtp_port)
-            server.starttls()
+        # Письмо из шаблона security_alert: HTML и текстовая часть
+        context = {
+            'status': status,
+            'status_emoji': status_emoji,
+            'status_color': status_color,
+            'security_score': results['security_score'],
+            'passed': results['passed'],
+            'total_checks': results['total_checks'],
+            'warnings': results['warnings'],
+            'failed': results['failed'],
+            'timestamp': results['timestamp'],
+            'problems': problems
+        }
+        msg = build_message('security_alert', context, mailer.user, admin_email)
         
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        # Отправляем через общее SMTP-соединение
+        mailer.send(msg)
         
     except Exception:
         pass
\ No newline at end of file
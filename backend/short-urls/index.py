@@ -4,16 +4,51 @@ Backend функция для генерации и редиректа коро
 """
 
 import json
-import os
-import random
-import string
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import psycopg2
+from db_pool import get_connection, release_connection
+from short_code import encode_short_code, is_generated_code
+from ttl_cache import NegativeCache, TTLCache
 
-def generate_short_code(length: int = 6) -> str:
-    """Генерирует случайный короткий код"""
-    chars = string.ascii_lowercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+# Код -> сериализованная публичная визитка
+SHORT_URL_CACHE_TTL = 30
+short_url_cache = TTLCache(maxsize=4096, ttl=SHORT_URL_CACHE_TTL)
+# Несуществующие коды: перебор случайных кодов не доходит до БД, память фиксирована
+missing_codes = NegativeCache(capacity=100_000, error_rate=0.0001, ttl=30)
+
+def short_url_response(status_code: int, body: str, cache_status: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'X-Cache': cache_status
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def assign_short_code(cur, card_id: int, short_code: str) -> Optional[str]:
+    """
+    Назначает код визитке, у которой его ещё нет, одним UPDATE
+    updated_at тоже меняется - по нему сверяется кэш публичных визиток в cards
+    
+    Returns:
+        код визитки (новый или уже существующий) или None, если визитки нет
+    """
+    cur.execute(
+        'UPDATE business_cards SET short_url = %s, updated_at = CURRENT_TIMESTAMP '
+        'WHERE id = %s AND short_url IS NULL RETURNING short_url',
+        (short_code, card_id)
+    )
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    
+    cur.execute('SELECT short_url FROM business_cards WHERE id = %s', (card_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
@@ -21,6 +56,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     POST /short-urls - создать короткую ссылку для визитки
     GET /short-urls/{code} - получить данные визитки по короткому коду
+    GET /short-urls?stats=1 - счётчики попаданий кэша кодов
     """
     method: str = event.get('httpMethod', 'GET')
     
@@ -37,7 +73,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        short_code = params.get('code')
+        
+        if params.get('stats'):
+            return short_url_response(200, json.dumps({
+                'cards': short_url_cache.stats(),
+                'missing': missing_codes.stats()
+            }), 'BYPASS')
+        
+        if short_code:
+            cached = short_url_cache.get(short_code)
+            if cached is not None:
+                return short_url_response(200, cached, 'HIT')
+            if missing_codes.contains(short_code):
+                return short_url_response(404, json.dumps({'error': 'Card not found'}), 'HIT')
+    
+    conn = get_connection()
     cur = conn.cursor()
     
     try:
@@ -54,54 +107,57 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            # Проверяем, есть ли уже короткая ссылка
-            cur.execute('SELECT short_url FROM business_cards WHERE id = %s', (card_id,))
-            existing = cur.fetchone()
+            try:
+                card_id = int(card_id)
+                generated_code = encode_short_code(card_id)
+            except (TypeError, ValueError):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid card_id'}),
+                    'isBase64Encoded': False
+                }
             
-            if existing and existing[0]:
+            # Коды в формате сгенерированных зарезервированы, иначе они могли бы совпасть
+            if custom_code and is_generated_code(custom_code):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'short_url': existing[0]}),
+                    'body': json.dumps({'error': 'custom_code is reserved, choose a different length or characters'}),
                     'isBase64Encoded': False
                 }
             
-            # Генерируем уникальный код
-            attempts = 0
-            while attempts < 10:
-                short_code = custom_code if custom_code else generate_short_code()
-                
-                # Проверяем уникальность
-                cur.execute('SELECT id FROM business_cards WHERE short_url = %s', (short_code,))
-                if not cur.fetchone():
-                    # Сохраняем короткую ссылку
-                    cur.execute(
-                        'UPDATE business_cards SET short_url = %s WHERE id = %s',
-                        (short_code, card_id)
-                    )
-                    conn.commit()
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'short_url': short_code}),
-                        'isBase64Encoded': False
-                    }
-                
-                attempts += 1
-                custom_code = None
+            short_code = None
+            if custom_code:
+                try:
+                    short_code = assign_short_code(cur, card_id, custom_code)
+                except psycopg2.IntegrityError:
+                    # Код занят другой визиткой - как и раньше, выдаём сгенерированный
+                    conn.rollback()
+            
+            # Сгенерированный код уникален по построению, проверять его в БД не нужно
+            if short_code is None:
+                short_code = assign_short_code(cur, card_id, generated_code)
+            
+            if short_code is None:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Card not found'}),
+                    'isBase64Encoded': False
+                }
             
+            conn.commit()
+            # Новый код мог быть закэширован как отсутствующий
+            missing_codes.clear()
             return {
-                'statusCode': 500,
+                'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Failed to generate unique short URL'}),
+                'body': json.dumps({'short_url': short_code}),
                 'isBase64Encoded': False
             }
         
         elif method == 'GET':
-            params = event.get('queryStringParameters', {})
-            short_code = params.get('code')
-            
             if not short_code:
                 return {
                     'statusCode': 400,
@@ -120,29 +176,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             card = cur.fetchone()
             
             if not card:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Card not found'}),
-                    'isBase64Encoded': False
-                }
+                missing_codes.add(short_code)
+                return short_url_response(404, json.dumps({'error': 'Card not found'}), 'MISS')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'id': card[0],
-                    'name': card[1],
-                    'position': card[2],
-                    'company': card[3],
-                    'phone': card[4],
-                    'email': card[5],
-                    'website': card[6],
-                    'description': card[7],
-                    'logo_url': card[8]
-                }),
-                'isBase64Encoded': False
-            }
+            body = json.dumps({
+                'id': card[0],
+                'name': card[1],
+                'position': card[2],
+                'company': card[3],
+                'phone': card[4],
+                'email': card[5],
+                'website': card[6],
+                'description': card[7],
+                'logo_url': card[8]
+            })
+            short_url_cache.set(short_code, body)
+            
+            return short_url_response(200, body, 'MISS')
         
         return {
             'statusCode': 405,
@@ -161,4 +211,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
@@ -0,0 +1,90 @@
+"""
+Короткие коды визиток без коллизий
+Код - это id визитки, пропущенный через ключевую перестановку (сеть Фейстеля на keyed BLAKE2b)
+и записанный в base36. Перестановка взаимно однозначна: разные id всегда дают разные коды,
+поэтому уникальность не нужно проверять запросами в БД, а без ключа соседние коды не угадать.
+
+Сгенерированные коды всегда длины SHORT_CODE_LENGTH, а прежние случайные коды короче,
+поэтому старые ссылки продолжают работать и с новыми не пересекаются.
+SHORT_CODE_SECRET нельзя менять после выдачи кодов: новые коды могут совпасть с выданными.
+"""
+import hashlib
+import os
+from typing import Optional
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+SHORT_CODE_LENGTH = 7
+SHORT_CODE_SECRET = os.environ.get('SHORT_CODE_SECRET', 'default_secret_change_me')
+
+FEISTEL_ROUNDS = 8
+# Перестановка работает на 2^(2*half) значениях, лишние отбрасываются cycle walking
+_DOMAIN = len(ALPHABET) ** SHORT_CODE_LENGTH
+_HALF_BITS = (_DOMAIN.bit_length() + 1) // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+# Ключ BLAKE2b не длиннее 64 байт
+_KEY = hashlib.sha256(SHORT_CODE_SECRET.encode('utf-8')).digest()
+_INDEX = {char: i for i, char in enumerate(ALPHABET)}
+
+
+def _round(round_index: int, value: int) -> int:
+    digest = hashlib.blake2b(value.to_bytes(8, 'big'), digest_size=8, key=_KEY, person=bytes([round_index])).digest()
+    return int.from_bytes(digest, 'big') & _HALF_MASK
+
+
+def _permute(value: int) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_index in range(FEISTEL_ROUNDS):
+        left, right = right, left ^ _round(round_index, right)
+    return (left << _HALF_BITS) | right
+
+
+def _unpermute(value: int) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_index in reversed(range(FEISTEL_ROUNDS)):
+        left, right = right ^ _round(round_index, left), left
+    return (left << _HALF_BITS) | right
+
+
+def is_generated_code(code: str) -> bool:
+    """Похож ли код на сгенерированный (такие нельзя занимать как пользовательские)"""
+    return len(code) == SHORT_CODE_LENGTH and all(char in _INDEX for char in code)
+
+
+def encode_short_code(card_id: int) -> str:
+    """
+    Короткий код визитки
+
+    Args:
+        card_id: id визитки, от 0 до 36^SHORT_CODE_LENGTH - 1
+
+    Returns:
+        код из SHORT_CODE_LENGTH символов base36, уникальный для каждого id
+    """
+    if not 0 <= card_id < _DOMAIN:
+        raise ValueError(f'card_id {card_id} is out of short code range')
+
+    # Cycle walking: повторяем перестановку, пока значение не попадёт в диапазон кодов
+    value = _permute(card_id)
+    while value >= _DOMAIN:
+        value = _permute(value)
+
+    chars = []
+    for _ in range(SHORT_CODE_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode_short_code(code: str) -> Optional[int]:
+    """id визитки по сгенерированному коду или None, если код не сгенерированный"""
+    if not is_generated_code(code):
+        return None
+
+    value = 0
+    for char in code:
+        value = value * len(ALPHABET) + _INDEX[char]
+
+    value = _unpermute(value)
+    while value >= _DOMAIN:
+        value = _unpermute(value)
+    return value
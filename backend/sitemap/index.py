@@ -1,28 +1,105 @@
+import base64
+import hashlib
 import os
-import psycopg2
-from datetime import datetime
-from typing import Dict, Any
+import zlib
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import timezone
+from db_pool import get_connection, release_connection
+from ttl_cache import TTLCache
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+BASE_URL = 'https://infinite7.cards'
+# Публичный адрес этой функции: на него ссылается индекс для отдельных файлов sitemap
+SITEMAP_URL = os.environ.get('SITEMAP_URL', 'https://functions.poehali.dev/04529237-fe25-4b58-9773-8ac02ad2cd2d')
+# Лимит протокола sitemaps - 50 000 URL в одном файле; файлы делятся по диапазонам id,
+# одно место оставлено под главную страницу в первом файле
+SITEMAP_MAX_URLS = 50000
+SITEMAP_SHARD_SIZE = SITEMAP_MAX_URLS - 1
+CURSOR_ITERSIZE = 5000
+
+# (номер файла или None для корня, gzip) -> (etag, тело ответа)
+sitemap_cache = TTLCache(maxsize=64, ttl=3600)
+
+def sitemap_etag(max_id, max_updated_at, shard, gzipped: bool) -> str:
+    """ETag меняется при добавлении визитки и при любом её обновлении"""
+    digest = hashlib.sha256(f'{max_id}:{max_updated_at}:{shard}:{gzipped}'.encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def iter_urlset(rows: Iterable, include_home: bool, home_lastmod: str) -> Iterator[str]:
+    """XML файла sitemap по строкам (id, updated_at), без сборки всего документа в памяти"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    if include_home:
+        yield f'''  <url>
+    <loc>{BASE_URL}</loc>
+    <lastmod>{home_lastmod}</lastmod>
+    <changefreq>daily</changefreq>
+    <priority>1.0</priority>
+  </url>\n'''
+    for card_id, updated_at in rows:
+        lastmod = updated_at.strftime('%Y-%m-%d') if updated_at else home_lastmod
+        yield f'''  <url>
+    <loc>{BASE_URL}/card/{card_id}</loc>
+    <lastmod>{lastmod}</lastmod>
+    <changefreq>weekly</changefreq>
+    <priority>0.8</priority>
+  </url>\n'''
+    yield '</urlset>'
+
+def iter_sitemap_index(shard_count: int, lastmod: str) -> Iterator[str]:
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for shard in range(shard_count):
+        yield f'''  <sitemap>
+    <loc>{SITEMAP_URL}?shard={shard}</loc>
+    <lastmod>{lastmod}</lastmod>
+  </sitemap>\n'''
+    yield '</sitemapindex>'
+
+def encode_chunks(chunks: Iterable[str], gzipped: bool) -> bytes:
+    """Склеивает куски XML, при gzipped - сжимая их по мере поступления"""
+    if not gzipped:
+        return ''.join(chunks).encode('utf-8')
+    # wbits=31 - поток в формате gzip (заголовок и CRC), а не голый deflate
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    parts = [compressor.compress(chunk.encode('utf-8')) for chunk in chunks]
+    parts.append(compressor.flush())
+    return b''.join(parts)
+
+def not_modified(headers: Dict[str, str], etag: str, last_modified) -> bool:
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = headers.get('If-Modified-Since') or headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Генерирует sitemap.xml для поисковых систем
-    GET / - возвращает sitemap со всеми публичными визитками
+    GET / - sitemap со всеми визитками или, если их больше SITEMAP_SHARD_SIZE, индекс файлов
+    GET /?shard=N - N-й файл sitemap (визитки с id из N-го диапазона)
+    Ответ сжимается gzip, если клиент его принимает, и проверяется по ETag/Last-Modified
     '''
     method: str = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, If-Modified-Since',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -30,56 +107,114 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': '{"error": "Method not allowed"}',
             'isBase64Encoded': False
         }
-    
+
+    headers = event.get('headers') or {}
+    query_params = event.get('queryStringParameters') or {}
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    gzipped = 'gzip' in accept_encoding.lower()
+
+    shard: Optional[int] = None
+    if query_params.get('shard') not in (None, ''):
+        try:
+            shard = int(query_params['shard'])
+        except ValueError:
+            shard = -1
+        if shard < 0:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': '{"error": "Invalid shard"}',
+                'isBase64Encoded': False
+            }
+
     conn = None
     cur = None
-    
+
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor()
-        
+
+        # Единственный запрос для проверки кэша: оба максимума берутся из индексов
         cur.execute("""
-            SELECT id, updated_at 
-            FROM t_p18253922_infinite_business_ca.business_cards 
+            SELECT MAX(id), MAX(updated_at)
+            FROM t_p18253922_infinite_business_ca.business_cards
             WHERE created_at IS NOT NULL
-            ORDER BY updated_at DESC
-            LIMIT 1000
         """)
-        cards = cur.fetchall()
-        
-        base_url = 'https://infinite7.cards'
-        sitemap_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        sitemap_xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-        
-        sitemap_xml += f'''  <url>
-    <loc>{base_url}</loc>
-    <lastmod>{datetime.now().strftime('%Y-%m-%d')}</lastmod>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>\n'''
-        
-        for card_id, updated_at in cards:
-            lastmod = updated_at.strftime('%Y-%m-%d') if updated_at else datetime.now().strftime('%Y-%m-%d')
-            sitemap_xml += f'''  <url>
-    <loc>{base_url}/card/{card_id}</loc>
-    <lastmod>{lastmod}</lastmod>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>\n'''
-        
-        sitemap_xml += '</urlset>'
-        
+        max_id, max_updated_at = cur.fetchone()
+        shard_count = max(1, -(-(max_id or 0) // SITEMAP_SHARD_SIZE))
+
+        if shard is not None and shard >= shard_count:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': '{"error": "Shard not found"}',
+                'isBase64Encoded': False
+            }
+        # Пока визитки помещаются в один файл, корень отдаёт сам sitemap
+        if shard is None and shard_count == 1:
+            shard = 0
+            cache_key = (None, gzipped)
+        else:
+            cache_key = (shard, gzipped)
+
+        etag = sitemap_etag(max_id, max_updated_at, cache_key[0], gzipped)
+        last_modified = max_updated_at.replace(tzinfo=timezone.utc) if max_updated_at else None
+        response_headers = {
+            'Content-Type': 'application/xml',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'ETag, Last-Modified',
+            'Cache-Control': 'public, max-age=3600',
+            'Vary': 'Accept-Encoding',
+            'ETag': etag
+        }
+        if last_modified:
+            response_headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+
+        if not_modified(headers, etag, last_modified):
+            return {
+                'statusCode': 304,
+                'headers': response_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+
+        cached = sitemap_cache.get(cache_key)
+        if cached and cached[0] == etag:
+            body = cached[1]
+        else:
+            lastmod = max_updated_at.strftime('%Y-%m-%d') if max_updated_at else '1970-01-01'
+            if shard is None:
+                chunks = iter_sitemap_index(shard_count, lastmod)
+                body = encode_chunks(chunks, gzipped)
+            else:
+                # Серверный курсор: строки приходят пачками по CURSOR_ITERSIZE, а не все сразу
+                with conn.cursor(name='sitemap_cards') as rows:
+                    rows.itersize = CURSOR_ITERSIZE
+                    rows.execute("""
+                        SELECT id, updated_at
+                        FROM t_p18253922_infinite_business_ca.business_cards
+                        WHERE created_at IS NOT NULL AND id > %s AND id <= %s
+                        ORDER BY id
+                    """, (shard * SITEMAP_SHARD_SIZE, (shard + 1) * SITEMAP_SHARD_SIZE))
+                    body = encode_chunks(iter_urlset(rows, shard == 0, lastmod), gzipped)
+            sitemap_cache.set(cache_key, (etag, body))
+
+        if gzipped:
+            response_headers['Content-Encoding'] = 'gzip'
+            return {
+                'statusCode': 200,
+                'headers': response_headers,
+                'body': base64.b64encode(body).decode('ascii'),
+                'isBase64Encoded': True
+            }
+
         return {
             'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/xml',
-                'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'public, max-age=3600'
-            },
-            'body': sitemap_xml,
+            'headers': response_headers,
+            'body': body.decode('utf-8'),
             'isBase64Encoded': False
         }
-    
+
     except Exception as e:
         return {
             'statusCode': 500,
@@ -87,9 +222,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': f'{{"error": "{str(e)}"}}',
             'isBase64Encoded': False
         }
-    
+
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
+        release_connection(conn)
@@ -0,0 +1,163 @@
+"""
+Общее SMTP-соединение для функций, отправляющих письма
+Авторизованная сессия живёт в области модуля и переживает тёплые вызовы, поэтому
+всплеск писем не открывает по TLS-сессии и логину на каждое письмо и не упирается
+в лимит соединений релея. Перед отправкой после простоя соединение проверяется NOOP,
+а разорванное сервером - переоткрывается прозрачно для вызывающего.
+"""
+import os
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SMTP_TIMEOUT_SECONDS = float(os.environ.get('SMTP_TIMEOUT', '10'))
+# После такого простоя соединение проверяется командой NOOP
+NOOP_CHECK_AFTER_SECONDS = float(os.environ.get('SMTP_NOOP_CHECK_AFTER', '30'))
+# Релеи часто ограничивают число писем на сессию; после лимита сессия переоткрывается
+MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+
+# Ошибки, после которых соединение считается потерянным и письмо отправляется заново
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+# (письмо, None) при успехе или (письмо, текст ошибки)
+SendResult = Tuple[Message, Optional[str]]
+
+
+class SmtpMailer:
+    """Одна переиспользуемая SMTP-сессия; методы потокобезопасны"""
+
+    def __init__(self, host: str, port: int, user: str, password: str):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._sent_on_connection = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+            server.starttls()
+        server.login(self.user, self.password)
+        self._sent_on_connection = 0
+        return server
+
+    def _drop(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                try:
+                    self._server.close()
+                except OSError:
+                    pass
+            self._server = None
+
+    def _is_healthy(self) -> bool:
+        if self._sent_on_connection >= MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if time.monotonic() - self._last_used < NOOP_CHECK_AFTER_SECONDS:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _session(self) -> smtplib.SMTP:
+        if self._server is not None and not self._is_healthy():
+            self._drop()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def _send(self, msg: Message) -> Dict[str, Tuple[int, bytes]]:
+        try:
+            refused = self._session().send_message(msg)
+        except _CONNECTION_ERRORS:
+            # Сервер закрыл сессию без NOOP-проверки - переподключаемся один раз
+            self._drop()
+            refused = self._session().send_message(msg)
+        self._sent_on_connection += 1
+        self._last_used = time.monotonic()
+        return refused
+
+    def send(self, msg: Message) -> None:
+        """
+        Отправляет письмо через общую сессию
+
+        Raises:
+            smtplib.SMTPException, OSError: письмо не принято сервером
+        """
+        with self._lock:
+            try:
+                refused = self._send(msg)
+            except smtplib.SMTPRecipientsRefused:
+                raise
+            except (smtplib.SMTPException, OSError):
+                # Состояние сессии после ошибки неизвестно, следующее письмо откроет новую
+                self._drop()
+                raise
+        if refused:
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+    def send_many(self, messages: Sequence[Message]) -> List[SendResult]:
+        """
+        Отправляет пачку писем через одну сессию; ошибка одного письма не прерывает остальные
+
+        Returns:
+            для каждого письма (письмо, None) или (письмо, ошибка); для частично отклонённых
+            получателей ошибка перечисляет отклонённые адреса
+        """
+        results: List[SendResult] = []
+        with self._lock:
+            for msg in messages:
+                try:
+                    refused = self._send(msg)
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused = e.recipients
+                except (smtplib.SMTPException, OSError) as e:
+                    self._drop()
+                    results.append((msg, str(e) or e.__class__.__name__))
+                    continue
+
+                if refused:
+                    results.append((msg, 'Recipients refused: ' + ', '.join(sorted(refused))))
+                else:
+                    results.append((msg, None))
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            self._drop()
+
+
+_mailers: Dict[Tuple[str, int, str], SmtpMailer] = {}
+_mailers_lock = threading.Lock()
+
+
+def get_mailer(default_port: int = 465) -> Optional[SmtpMailer]:
+    """
+    Общий mailer по переменным SMTP_HOST/SMTP_PORT/SMTP_USER/SMTP_PASSWORD
+
+    Returns:
+        None, если SMTP не настроен
+    """
+    host = os.environ.get('SMTP_HOST')
+    port = int(os.environ.get('SMTP_PORT', str(default_port)))
+    user = os.environ.get('SMTP_USER')
+    password = os.environ.get('SMTP_PASSWORD')
+    if not all([host, user, password]):
+        return None
+
+    key = (host, port, user)
+    with _mailers_lock:
+        mailer = _mailers.get(key)
+        if mailer is None or mailer.password != password:
+            mailer = _mailers[key] = SmtpMailer(host, port, user, password)
+        return mailer
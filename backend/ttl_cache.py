@@ -0,0 +1,163 @@
+"""
+In-memory кэш с TTL и вытеснением LRU
+Живёт в области модуля и переживает тёплые вызовы (работает в serverless)
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру кэш, записи которого истекают через ttl секунд
+
+    Args:
+        maxsize: максимум записей, самые давно использованные вытесняются
+        ttl: время жизни записи в секундах
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий для подбора размера кэша"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class NegativeCache:
+    """
+    Кэш отсутствующих ключей (404) на Bloom-фильтре
+    Память фиксирована и не растёт от числа перебираемых ключей. Два поколения фильтра
+    сменяются каждые ttl секунд или при заполнении, поэтому ключ помнится от ttl до 2*ttl.
+
+    Args:
+        capacity: сколько ключей поколение держит с заданной долей ошибок
+        error_rate: доля ложных срабатываний (существующий ключ сочтён отсутствующим)
+        ttl: время жизни поколения в секундах
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.0001, ttl: float = 30):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ttl = ttl
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.bits / capacity * math.log(2)))
+        self.hits = 0
+        self.misses = 0
+        self._current = bytearray((self.bits + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hash_count)]
+
+    def _rotate(self, now: float) -> None:
+        if now - self._rotated_at >= 2 * self.ttl:
+            self._previous = bytearray(len(self._current))
+        else:
+            self._previous = self._current
+        self._current = bytearray(len(self._previous))
+        self._count = 0
+        self._rotated_at = now
+
+    def add(self, key: str) -> None:
+        positions = self._positions(key)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._rotated_at >= self.ttl or self._count >= self.capacity:
+                self._rotate(now)
+            for position in positions:
+                self._current[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+
+    def contains(self, key: str) -> bool:
+        positions = self._positions(key)
+        now = time.monotonic()
+        with self._lock:
+            if now - self._rotated_at >= self.ttl:
+                self._rotate(now)
+            found = any(
+                all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+                for bits in (self._current, self._previous)
+            )
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._current = bytearray(len(self._current))
+            self._previous = bytearray(len(self._current))
+            self._count = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики попаданий и заполненность текущего поколения"""
+        total = self.hits + self.misses
+        return {
+            'size': self._count,
+            'capacity': self.capacity,
+            'memory_bytes': 2 * len(self._current),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
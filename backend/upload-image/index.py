@@ -1,22 +1,282 @@
 import json
 import base64
+import binascii
+import re
 import boto3
 import os
 import uuid
-from typing import Dict, Any
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from db_pool import get_connection, release_connection
+from jwt_auth import AuthError, verify_token
+from typing import Dict, Any, Optional, Tuple
 
+# S3_ENDPOINT_URL позволяет направить функцию в локальное S3-совместимое хранилище (MinIO)
 s3 = boto3.client('s3',
-    endpoint_url='https://bucket.poehali.dev',
+    endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
     aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
     aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+    config=Config(signature_version='s3v4', s3={'addressing_style': 'path'}),
 )
 
+BUCKET = 'files'
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+# Запас на остальные поля JSON сверх base64 максимального изображения
+UPLOAD_MAX_BODY_CHARS = (UPLOAD_MAX_BYTES + 2) // 3 * 4 + 4096
+# Крупнее - multipart: в памяти одновременно только одна часть, а не всё изображение
+# Размер части кратен 3, чтобы часть декодировалась из целого числа групп base64
+MULTIPART_THRESHOLD = 5 * 1024 * 1024
+MULTIPART_PART_SIZE = 5 * 1024 * 1024 + 1
+# base64 декодируется кусками: временные копии ограничены размером куска
+DECODE_CHUNK_CHARS = 64 * 1024
+
+# Сигнатура в начале файла -> (Content-Type, расширение)
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'GIF87a', 'image/gif', 'gif'),
+    (b'GIF89a', 'image/gif', 'gif'),
+)
+
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+# Префикс ключа для прямой загрузки в хранилище по типу файла
+UPLOAD_KINDS = {'avatar': 'avatars', 'logo': 'logos'}
+PRESIGN_EXPIRES_SECONDS = 300
+# Ключ прямой загрузки: <префикс>/<user_id>/<uuid>.<расширение>
+DIRECT_UPLOAD_KEY = re.compile(r'^(avatars|logos)/(\d+)/[0-9a-f-]{36}\.(jpg|png|gif|webp)$')
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Тип изображения по первым байтам; content_type из запроса не учитывается"""
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type, extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', 'webp'
+    return None
+
+def parse_upload_body(raw_body: str) -> Tuple[Dict[str, Any], str, int, int]:
+    """
+    Разбирает тело запроса, не копируя base64 изображения
+
+    Значение "image" находится прямо в строке запроса, остальные поля разбирает json.loads
+    без него. Если тело устроено иначе (экранирование, повтор ключа), работает обычный json.loads.
+
+    Returns:
+        (поля запроса, строка с base64, начало и конец base64 в этой строке)
+    """
+    key = raw_body.find('"image"')
+    if key != -1:
+        pos = key + len('"image"')
+        while pos < len(raw_body) and raw_body[pos] in ' \t\r\n':
+            pos += 1
+        if raw_body.startswith(':', pos):
+            pos += 1
+            while pos < len(raw_body) and raw_body[pos] in ' \t\r\n':
+                pos += 1
+            if raw_body.startswith('"', pos):
+                begin = pos + 1
+                end = raw_body.find('"', begin)
+                if end != -1 and raw_body.find('\\', begin, end) == -1:
+                    # Без значения image тело маленькое; пустое image подтверждает, что ключ найден верно
+                    body_data = json.loads(raw_body[:begin] + raw_body[end:])
+                    if isinstance(body_data, dict) and body_data.get('image') == '':
+                        return body_data, raw_body, begin, end
+
+    body_data = json.loads(raw_body)
+    image = body_data.get('image') if isinstance(body_data, dict) else None
+    if not isinstance(image, str):
+        return body_data, '', 0, 0
+    return body_data, image, 0, len(image)
+
+def decoded_length(encoded: str, begin: int, end: int) -> int:
+    """Размер данных base64 encoded[begin:end] без декодирования; ValueError, если длина не кратна 4"""
+    if (end - begin) % 4:
+        raise ValueError('Invalid base64 length')
+    return (end - begin) // 4 * 3 - encoded.count('=', max(begin, end - 2), end)
+
+def decode_base64_into(target: memoryview, encoded: str, start: int, stop: int) -> int:
+    """
+    Декодирует base64 из encoded[start:stop] прямо в target, пока он не заполнится
+
+    Returns:
+        число записанных байт
+    Raises:
+        binascii.Error: недопустимые символы base64
+    """
+    written = 0
+    end = min(stop, start + (len(target) + 2) // 3 * 4)
+    for offset in range(start, end, DECODE_CHUNK_CHARS):
+        chunk = base64.b64decode(encoded[offset:min(offset + DECODE_CHUNK_CHARS, end)], validate=True)
+        target[written:written + len(chunk)] = chunk
+        written += len(chunk)
+    return written
+
+def upload_multipart(file_key: str, content_type: str, encoded: str, begin: int, end: int, size: int) -> None:
+    """Потоковая multipart-загрузка: каждая часть декодируется в один и тот же буфер и сразу отправляется"""
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key=file_key, ContentType=content_type)['UploadId']
+    try:
+        buffer = bytearray(MULTIPART_PART_SIZE)
+        parts = []
+        uploaded = 0
+        part_chars = MULTIPART_PART_SIZE // 3 * 4
+        while uploaded < size:
+            if size - uploaded < MULTIPART_PART_SIZE:
+                # Последняя часть декодируется в буфер своего размера: boto3 не принимает memoryview
+                buffer = None
+                buffer = bytearray(size - uploaded)
+            with memoryview(buffer) as view:
+                part_size = decode_base64_into(view, encoded, begin + len(parts) * part_chars, end)
+            response = s3.upload_part(
+                Bucket=BUCKET,
+                Key=file_key,
+                UploadId=upload_id,
+                PartNumber=len(parts) + 1,
+                Body=buffer
+            )
+            parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+            uploaded += part_size
+        s3.complete_multipart_upload(
+            Bucket=BUCKET,
+            Key=file_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=BUCKET, Key=file_key, UploadId=upload_id)
+        raise
+
+def json_response(status_code: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def cdn_url(file_key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
+
+def presign_upload(user_id: int, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Короткоживущие подписанные URL для загрузки файла браузером прямо в хранилище
+
+    Политика POST ограничивает размер (content-length-range) и Content-Type,
+    в подписи PUT - точный Content-Length и Content-Type
+    """
+    prefix = UPLOAD_KINDS.get(body_data.get('kind', 'avatar'))
+    content_type = body_data.get('content_type')
+    size = body_data.get('size')
+    if prefix is None or content_type not in CONTENT_TYPE_EXTENSIONS:
+        return json_response(400, {'error': 'kind must be avatar or logo, content_type - JPEG, PNG, GIF or WebP'})
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return json_response(400, {'error': 'size is required'})
+    if size > UPLOAD_MAX_BYTES:
+        return json_response(413, {'error': f'Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB'})
+
+    file_key = f'{prefix}/{user_id}/{uuid.uuid4()}.{CONTENT_TYPE_EXTENSIONS[content_type]}'
+    post = s3.generate_presigned_post(
+        Bucket=BUCKET,
+        Key=file_key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, UPLOAD_MAX_BYTES]
+        ],
+        ExpiresIn=PRESIGN_EXPIRES_SECONDS
+    )
+    put_url = s3.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': BUCKET, 'Key': file_key, 'ContentType': content_type, 'ContentLength': size},
+        ExpiresIn=PRESIGN_EXPIRES_SECONDS
+    )
+    return json_response(200, {
+        'key': file_key,
+        'url': cdn_url(file_key),
+        'expires_in': PRESIGN_EXPIRES_SECONDS,
+        'post': post,
+        'put': {'url': put_url, 'headers': {'Content-Type': content_type}}
+    })
+
+def complete_upload(user_id: int, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Подтверждение прямой загрузки: проверяет объект в хранилище и записывает его в media_assets
+
+    Размер и тип берутся из хранилища и сигнатуры первых байт, а не из запроса;
+    файл, не прошедший проверку, удаляется. Повторный вызов для того же файла не создаёт дубль.
+    """
+    file_key = body_data.get('key')
+    card_id = body_data.get('card_id')
+    match = DIRECT_UPLOAD_KEY.match(file_key) if isinstance(file_key, str) else None
+    if not match or int(match.group(2)) != user_id:
+        return json_response(400, {'error': 'Invalid upload key'})
+    if card_id is not None and (not isinstance(card_id, int) or isinstance(card_id, bool)):
+        return json_response(400, {'error': 'Invalid card_id'})
+
+    try:
+        file_size = s3.head_object(Bucket=BUCKET, Key=file_key)['ContentLength']
+        head = s3.get_object(Bucket=BUCKET, Key=file_key, Range='bytes=0-15')['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return json_response(404, {'error': 'Upload not found'})
+        raise
+
+    image_type = sniff_image_type(head)
+    if image_type is None or image_type[1] != match.group(3) or file_size > UPLOAD_MAX_BYTES:
+        s3.delete_object(Bucket=BUCKET, Key=file_key)
+        if image_type is None or image_type[1] != match.group(3):
+            return json_response(415, {'error': 'Unsupported image format, expected JPEG, PNG, GIF or WebP'})
+        return json_response(413, {'error': f'Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB'})
+
+    file_url = cdn_url(file_key)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            if card_id is not None:
+                cur.execute(
+                    "SELECT 1 FROM t_p18253922_infinite_business_ca.business_cards WHERE id = %s AND user_id = %s",
+                    (card_id, user_id)
+                )
+                if cur.fetchone() is None:
+                    conn.rollback()
+                    return json_response(403, {'error': 'Card not found or access denied'})
+            cur.execute("""
+                INSERT INTO t_p18253922_infinite_business_ca.media_assets
+                    (card_id, user_id, file_url, file_type, file_size)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (file_url) DO UPDATE
+                SET card_id = COALESCE(EXCLUDED.card_id, media_assets.card_id)
+                RETURNING id
+            """, (card_id, user_id, file_url, image_type[0], file_size))
+            asset_id = cur.fetchone()[0]
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+    return json_response(200, {
+        'id': asset_id,
+        'url': file_url,
+        'file_type': image_type[0],
+        'file_size': file_size
+    })
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Загружает изображение в S3 и возвращает CDN URL
-    Args: event - dict с httpMethod, body (base64 изображение и content_type)
+    Args: event - dict с httpMethod, body (base64 изображение; тип определяется по содержимому)
           context - объект с request_id, function_name и др.
     Returns: HTTP response с url изображения
+    POST /?action=presign - подписанные URL для прямой загрузки (X-Auth-Token)
+          Body: { "kind": "avatar" | "logo", "content_type": "image/png", "size": 12345 }
+    POST /?action=complete - подтвердить прямую загрузку и записать её в media_assets (X-Auth-Token)
+          Body: { "key": "avatars/1/....png", "card_id": 123 }
     '''
     method: str = event.get('httpMethod', 'POST')
     
@@ -44,12 +304,42 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    body_data = json.loads(event.get('body', '{}'))
+    query_params = event.get('queryStringParameters') or {}
+    action = query_params.get('action')
+    
+    if action in ('presign', 'complete'):
+        headers = event.get('headers') or {}
+        auth_token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        if not auth_token:
+            return json_response(401, {'error': 'Authorization required'})
+        try:
+            user_id = verify_token(auth_token).get('user_id')
+        except AuthError as e:
+            return json_response(e.status_code, {'error': e.message})
+        
+        body_data = json.loads(event.get('body') or '{}')
+        if action == 'presign':
+            return presign_upload(user_id, body_data)
+        return complete_upload(user_id, body_data)
     
-    image_base64: str = body_data.get('image', '')
-    content_type: str = body_data.get('content_type', 'image/jpeg')
+    raw_body: str = event.get('body') or '{}'
     
-    if not image_base64:
+    # Слишком большой запрос отклоняется до разбора JSON и декодирования
+    if len(raw_body) > UPLOAD_MAX_BODY_CHARS:
+        return {
+            'statusCode': 413,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': f'Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB'}),
+            'isBase64Encoded': False
+        }
+    
+    # base64 остаётся в строке запроса, дальше работа идёт по смещениям в ней
+    _, image_source, image_begin, image_end = parse_upload_body(raw_body)
+    
+    if image_begin == image_end:
         return {
             'statusCode': 400,
             'headers': {
@@ -60,20 +350,64 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    image_data = base64.b64decode(image_base64)
+    try:
+        image_size = decoded_length(image_source, image_begin, image_end)
+        # Тип определяется по сигнатуре первых байт, а не по content_type из запроса
+        head = base64.b64decode(image_source[image_begin:min(image_begin + 16, image_end)], validate=True)
+    except (ValueError, binascii.Error):
+        image_size = 0
+        head = b''
+    
+    image_type = sniff_image_type(head) if image_size else None
+    if image_type is None:
+        return {
+            'statusCode': 415,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Unsupported image format, expected JPEG, PNG, GIF or WebP'}),
+            'isBase64Encoded': False
+        }
     
-    extension = content_type.split('/')[-1]
-    if extension not in ['jpeg', 'jpg', 'png', 'gif', 'webp']:
-        extension = 'jpg'
+    if image_size > UPLOAD_MAX_BYTES:
+        return {
+            'statusCode': 413,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': f'Image is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB'}),
+            'isBase64Encoded': False
+        }
     
+    content_type, extension = image_type
     file_key = f"avatars/{uuid.uuid4()}.{extension}"
     
-    s3.put_object(
-        Bucket='files',
-        Key=file_key,
-        Body=image_data,
-        ContentType=content_type
-    )
+    try:
+        if image_size > MULTIPART_THRESHOLD:
+            upload_multipart(file_key, content_type, image_source, image_begin, image_end, image_size)
+        else:
+            # Один буфер нужного размера вместо промежуточных копий b64decode
+            image_data = bytearray(image_size)
+            with memoryview(image_data) as view:
+                decode_base64_into(view, image_source, image_begin, image_end)
+            s3.put_object(
+                Bucket=BUCKET,
+                Key=file_key,
+                Body=image_data,
+                ContentType=content_type
+            )
+    except binascii.Error:
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({'error': 'Invalid base64 image data'}),
+            'isBase64Encoded': False
+        }
     
     cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{file_key}"
     
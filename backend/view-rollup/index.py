@@ -0,0 +1,61 @@
+import json
+import os
+import time
+from db_pool import get_connection, release_connection
+from view_rollup import roll_up_views
+
+# Сколько секунд функция сворачивает просмотры за один вызов по таймеру
+ROLLUP_TIME_BUDGET = float(os.environ.get('VIEW_ROLLUP_TIME_BUDGET', '20'))
+
+
+def handler(event, context):
+    '''
+    Свёртка card_views в дневные агрегаты, вызывается по таймеру
+    Сворачивает пачки просмотров, пока не дойдёт до горизонта видимости
+    или не выйдет ROLLUP_TIME_BUDGET; остаток подхватит следующий вызов
+    '''
+    method = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    rolled_total = 0
+    deadline = time.monotonic() + ROLLUP_TIME_BUDGET
+    conn = None
+    try:
+        conn = get_connection()
+        while time.monotonic() < deadline:
+            rolled = roll_up_views(conn)
+            rolled_total += rolled
+            if rolled == 0:
+                break
+    except Exception as e:
+        print(f'Failed to roll up card views: {e}')
+        if conn is not None:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Failed to roll up views', 'rolled_up': rolled_total}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+    return {
+        'statusCode': 200,
+        'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
+        'body': json.dumps({'rolled_up': rolled_total}),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,213 @@
+"""
+Буферизованная запись просмотров визиток (write-behind)
+Просмотры копятся в памяти инстанса и сбрасываются в card_views пачками через COPY,
+а счётчики view_count обновляются одним агрегированным UPDATE на пачку
+
+Сброс по возрасту не ждёт следующего просмотра: его запускает таймер, а если инстанс
+был заморожен между вызовами - flush_if_due() в начале обработчика
+"""
+import atexit
+import io
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db_pool import get_connection, release_connection
+from view_rollup import lock_view_writes
+
+# Сброс по размеру буфера или по возрасту самого старого просмотра
+VIEW_BUFFER_MAX_SIZE = int(os.environ.get('VIEW_BUFFER_MAX_SIZE', '200'))
+VIEW_BUFFER_MAX_AGE_SECONDS = float(os.environ.get('VIEW_BUFFER_MAX_AGE', '5'))
+# Если БД недоступна, в памяти держим не больше стольких просмотров
+VIEW_BUFFER_HARD_LIMIT = VIEW_BUFFER_MAX_SIZE * 20
+
+VIEWS_TABLE = 't_p18253922_infinite_business_ca.card_views'
+CARDS_TABLE = 't_p18253922_infinite_business_ca.business_cards'
+VIEW_COLUMNS = ('card_id', 'viewer_ip', 'viewer_user_agent', 'referer', 'viewed_at')
+
+# (card_id, viewer_ip, viewer_user_agent, referer, viewed_at)
+ViewRow = Tuple[int, Optional[str], Optional[str], Optional[str], datetime]
+
+_lock = threading.Lock()
+_buffer: List[ViewRow] = []
+_oldest_at = 0.0
+_flush_timer: Optional[threading.Timer] = None
+
+
+def _copy_value(value) -> str:
+    """Экранирование значения для текстового формата COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _write_views(conn, rows: List[ViewRow]) -> None:
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(_copy_value(value) for value in row))
+        data.write('\n')
+    data.seek(0)
+
+    views_per_card = sorted(Counter(row[0] for row in rows).items())
+
+    with conn.cursor() as cur:
+        lock_view_writes(cur)
+        cur.copy_expert(
+            f"COPY {VIEWS_TABLE} ({', '.join(VIEW_COLUMNS)}) FROM STDIN",
+            data
+        )
+        # Один UPDATE на пачку; карточки в порядке id, чтобы не ловить дедлоки
+        execute_values(
+            cur,
+            f"""
+            UPDATE {CARDS_TABLE} AS bc
+            SET view_count = COALESCE(bc.view_count, 0) + v.views
+            FROM (VALUES %s) AS v(id, views)
+            WHERE bc.id = v.id
+            """,
+            views_per_card,
+            page_size=len(views_per_card)
+        )
+    conn.commit()
+
+
+def _existing_card_rows(conn, rows: List[ViewRow]) -> List[ViewRow]:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT id FROM {CARDS_TABLE} WHERE id = ANY(%s)",
+            (list({row[0] for row in rows}),)
+        )
+        existing = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    return [row for row in rows if row[0] in existing]
+
+
+def _schedule_flush() -> None:
+    """Запускает таймер сброса по возрасту, если он ещё не запущен (вызывается под _lock)"""
+    global _flush_timer
+
+    if _flush_timer is not None and _flush_timer.is_alive():
+        return
+    _flush_timer = threading.Timer(VIEW_BUFFER_MAX_AGE_SECONDS, _flush_on_timer)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+def _flush_on_timer() -> None:
+    global _flush_timer
+
+    with _lock:
+        _flush_timer = None
+    flush_views()
+
+
+def flush_views() -> int:
+    """
+    Сбрасывает накопленные просмотры в БД
+
+    Returns:
+        количество записанных просмотров
+    """
+    global _buffer, _oldest_at
+
+    with _lock:
+        rows, _buffer = _buffer, []
+        _oldest_at = 0.0
+
+    if not rows:
+        return 0
+
+    conn = None
+    try:
+        conn = get_connection()
+        try:
+            _write_views(conn, rows)
+        except psycopg2.IntegrityError:
+            # Просмотр удалённой визитки не должен блокировать всю пачку
+            conn.rollback()
+            rows = _existing_card_rows(conn, rows)
+            if rows:
+                _write_views(conn, rows)
+    except Exception as e:
+        print(f'Failed to flush {len(rows)} card views: {e}')
+        # Возвращаем просмотры в буфер, чтобы записать их при следующем сбросе
+        with _lock:
+            _buffer = (rows + _buffer)[-VIEW_BUFFER_HARD_LIMIT:]
+            _oldest_at = _oldest_at or time.time()
+            _schedule_flush()
+        return 0
+    finally:
+        release_connection(conn)
+
+    return len(rows)
+
+
+def record_view(
+    card_id: int,
+    viewer_ip: Optional[str],
+    user_agent: Optional[str],
+    referer: Optional[str] = None,
+    viewed_at: Optional[datetime] = None
+) -> None:
+    """Добавляет просмотр в буфер и сбрасывает его, если пора"""
+    global _oldest_at
+
+    now = time.time()
+    with _lock:
+        _buffer.append((int(card_id), viewer_ip, user_agent, referer, viewed_at or datetime.now()))
+        if not _oldest_at:
+            _oldest_at = now
+            _schedule_flush()
+        should_flush = (
+            len(_buffer) >= VIEW_BUFFER_MAX_SIZE
+            or now - _oldest_at >= VIEW_BUFFER_MAX_AGE_SECONDS
+        )
+
+    if should_flush:
+        flush_views()
+
+
+def flush_if_due() -> int:
+    """
+    Сбрасывает буфер, если самый старый просмотр старше VIEW_BUFFER_MAX_AGE_SECONDS
+    Таймер не срабатывает, пока инстанс заморожен между вызовами, поэтому обработчики
+    вызывают эту функцию в начале каждого запроса
+    """
+    with _lock:
+        due = bool(_buffer) and time.time() - _oldest_at >= VIEW_BUFFER_MAX_AGE_SECONDS
+    return flush_views() if due else 0
+
+
+def pending_views() -> int:
+    return len(_buffer)
+
+
+def _flush_on_sigterm(signum, frame) -> None:
+    flush_views()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+# Финальный сброс при остановке инстанса
+atexit.register(flush_views)
+try:
+    if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _flush_on_sigterm)
+except ValueError:
+    # Обработчик сигнала можно поставить только из главного потока
+    pass
@@ -0,0 +1,237 @@
+"""
+Инкрементальная свёртка card_views в дневные агрегаты card_views_daily
+Обрабатывает новые просмотры после границы last_view_id пачками, поэтому аналитика
+читает агрегаты и небольшой хвост ещё не свёрнутых строк вместо всей истории
+
+Граница двигается только до горизонта видимости: id, ниже которых все транзакции
+записи просмотров уже завершены. Иначе строка с меньшим id, закоммиченная другим
+инстансом позже, оказалась бы за границей и не попала бы ни в агрегаты, ни в хвост.
+Запускается по таймеру функцией backend/view-rollup, а не в запросах пользователей.
+
+Бэкфилл существующих данных:
+    DATABASE_URL=postgresql://... python3 backend/view_rollup.py --backfill
+"""
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from psycopg2.extras import execute_values
+
+SCHEMA = 't_p18253922_infinite_business_ca'
+VIEWS_TABLE = f'{SCHEMA}.card_views'
+DAILY_TABLE = f'{SCHEMA}.card_views_daily'
+TOTALS_TABLE = f'{SCHEMA}.card_view_totals'
+STATE_TABLE = f'{SCHEMA}.card_views_rollup_state'
+
+ROLLUP_BATCH_SIZE = int(os.environ.get('VIEW_ROLLUP_BATCH_SIZE', '5000'))
+TOP_REFERERS = 10
+# Ключ advisory-блокировки записи в card_views: писатели (view_buffer) берут её
+# разделяемой, свёртка - исключительной на время чтения горизонта
+VIEW_WRITE_LOCK = 0x76696577
+
+
+class _DayAggregate:
+    __slots__ = ('views', 'visitors', 'referers')
+
+    def __init__(self):
+        self.views = 0
+        self.visitors: List[str] = []
+        self.referers: Counter = Counter()
+
+
+def merge_referers(current: Dict[str, int], added: Dict[str, int]) -> Dict[str, int]:
+    """Складывает счётчики referer и оставляет TOP_REFERERS самых частых"""
+    merged = Counter(current)
+    merged.update(added)
+    return dict(merged.most_common(TOP_REFERERS))
+
+
+def lock_view_writes(cur) -> None:
+    """Первый оператор транзакции записи в card_views: держит горизонт свёртки до коммита"""
+    cur.execute('SELECT pg_advisory_xact_lock_shared(%s)', (VIEW_WRITE_LOCK,))
+
+
+def visible_view_horizon(conn) -> int:
+    """
+    Наибольший id card_views, до которого все транзакции записи уже завершены
+
+    Исключительная блокировка дожидается коммита начатых записей, а новые записи
+    получат id из последовательности уже после прочитанного значения. Последовательность
+    должна выдавать id без кэша на сессию (CACHE 1, как у SERIAL по умолчанию).
+    """
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_xact_lock(%s)', (VIEW_WRITE_LOCK,))
+        cur.execute(
+            "SELECT pg_sequence_last_value(pg_get_serial_sequence(%s, 'id'))",
+            (VIEWS_TABLE,)
+        )
+        horizon = cur.fetchone()[0]
+    # Коммит снимает блокировку: писатели ждут её только на время чтения значения
+    conn.commit()
+    return horizon or 0
+
+
+def roll_up_views(conn, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """
+    Сворачивает следующую пачку просмотров в агрегаты в одной транзакции
+
+    Args:
+        conn: соединение psycopg2
+        batch_size: максимум просмотров за вызов
+
+    Returns:
+        количество свёрнутых просмотров (0 - нечего сворачивать или свёртку уже ведёт другой инстанс)
+    """
+    # numpy нужен только для свёртки, не замедляем холодный старт функций
+    from hll import HyperLogLog
+
+    horizon = visible_view_horizon(conn)
+
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT last_view_id FROM {STATE_TABLE} WHERE id = 1 FOR UPDATE SKIP LOCKED")
+        state = cur.fetchone()
+        if state is None:
+            conn.rollback()
+            return 0
+
+        last_view_id = state[0]
+        cur.execute(
+            f"""
+            SELECT id, card_id, viewed_at, viewer_ip, referer
+            FROM {VIEWS_TABLE}
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_view_id, horizon, batch_size)
+        )
+        ready = cur.fetchall()
+
+        if not ready:
+            conn.rollback()
+            return 0
+
+        days: Dict[Tuple[int, object], _DayAggregate] = defaultdict(_DayAggregate)
+        # Просмотры без viewed_at входят в итоги визитки, но ни в один день
+        undated: Dict[int, _DayAggregate] = defaultdict(_DayAggregate)
+        for _, card_id, viewed_at, viewer_ip, referer in ready:
+            aggregate = days[(card_id, viewed_at.date())] if viewed_at else undated[card_id]
+            aggregate.views += 1
+            if viewer_ip:
+                aggregate.visitors.append(viewer_ip)
+            if referer:
+                aggregate.referers[referer[:500]] += 1
+
+        card_ids = sorted({card_id for card_id, _ in days} | set(undated))
+        cur.execute(
+            f"""
+            SELECT card_id, day, visitor_sketch, top_referers
+            FROM {DAILY_TABLE}
+            WHERE card_id = ANY(%s) AND day = ANY(%s)
+            FOR UPDATE
+            """,
+            (card_ids, sorted({day for _, day in days}))
+        )
+        existing = {(row[0], row[1]): row for row in cur.fetchall()}
+
+        cur.execute(
+            f"SELECT card_id, visitor_sketch FROM {TOTALS_TABLE} WHERE card_id = ANY(%s) FOR UPDATE",
+            (card_ids,)
+        )
+        totals_sketches = {row[0]: HyperLogLog.from_bytes(row[1]) for row in cur.fetchall()}
+
+        daily_rows: List[tuple] = []
+        totals: Dict[int, List] = {}
+        for key in sorted(days):
+            card_id, day = key
+            aggregate = days[key]
+            day_sketch = HyperLogLog().update(aggregate.visitors)
+            sketch = day_sketch
+            referers = dict(aggregate.referers)
+            is_new_day = key not in existing
+
+            if not is_new_day:
+                sketch = HyperLogLog.from_bytes(existing[key][2]).merge(sketch)
+                referers = merge_referers(existing[key][3] or {}, referers)
+            else:
+                referers = merge_referers({}, referers)
+
+            daily_rows.append((card_id, day, aggregate.views, sketch.to_bytes(), json.dumps(referers)))
+
+            card_totals = totals.setdefault(card_id, [0, 0, totals_sketches.get(card_id) or HyperLogLog()])
+            card_totals[0] += aggregate.views
+            card_totals[1] += 1 if is_new_day else 0
+            card_totals[2].merge(day_sketch)
+
+        for card_id, aggregate in undated.items():
+            card_totals = totals.setdefault(card_id, [0, 0, totals_sketches.get(card_id) or HyperLogLog()])
+            card_totals[0] += aggregate.views
+            card_totals[2].update(aggregate.visitors)
+
+        if daily_rows:
+            execute_values(
+                cur,
+                f"""
+                INSERT INTO {DAILY_TABLE} AS d (card_id, day, views, visitor_sketch, top_referers)
+                VALUES %s
+                ON CONFLICT (card_id, day) DO UPDATE
+                SET views = d.views + EXCLUDED.views,
+                    visitor_sketch = EXCLUDED.visitor_sketch,
+                    top_referers = EXCLUDED.top_referers
+                """,
+                daily_rows,
+                template='(%s, %s, %s, %s, %s::jsonb)',
+                page_size=len(daily_rows)
+            )
+
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO {TOTALS_TABLE} AS t (card_id, views, days_active, visitor_sketch)
+            VALUES %s
+            ON CONFLICT (card_id) DO UPDATE
+            SET views = t.views + EXCLUDED.views,
+                days_active = t.days_active + EXCLUDED.days_active,
+                visitor_sketch = EXCLUDED.visitor_sketch,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            [
+                (card_id, views, new_days, sketch.to_bytes())
+                for card_id, (views, new_days, sketch) in sorted(totals.items())
+            ],
+            page_size=len(totals)
+        )
+
+        cur.execute(
+            f"UPDATE {STATE_TABLE} SET last_view_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = 1",
+            (ready[-1][0],)
+        )
+
+    conn.commit()
+    return len(ready)
+
+
+def backfill(conn, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Сворачивает всю накопленную историю пачками, каждая в своей транзакции"""
+    total = 0
+    while True:
+        rolled = roll_up_views(conn, batch_size)
+        if not rolled:
+            return total
+        total += rolled
+        print(f'Rolled up {total} views')
+
+
+if __name__ == '__main__':
+    if '--backfill' not in sys.argv:
+        sys.exit('Usage: python3 backend/view_rollup.py --backfill')
+
+    from db_pool import get_connection, release_connection
+
+    connection = get_connection()
+    try:
+        print(f'Done: {backfill(connection)} views rolled up')
+    finally:
+        release_connection(connection)
@@ -2,7 +2,7 @@ import json
 import os
 import urllib.request
 import urllib.parse
-import psycopg2
+from db_pool import get_connection, release_connection
 from datetime import datetime, timedelta
 import jwt
 
@@ -96,7 +96,7 @@ def handler(event, context):
         vk_user = user_info['response'][0]
         full_name = f"{vk_user.get('first_name', '')} {vk_user.get('last_name', '')}".strip()
         
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_connection()
         cur = conn.cursor()
         
         # Экранируем данные для Simple Query Protocol
@@ -140,7 +140,7 @@ def handler(event, context):
         jwt_secret = os.environ.get('JWT_SECRET')
         if not jwt_secret:
             cur.close()
-            conn.close()
+            release_connection(conn)
             return {
                 'statusCode': 500,
                 'headers': {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'},
@@ -163,7 +163,7 @@ def handler(event, context):
         
         conn.commit()
         cur.close()
-        conn.close()
+        release_connection(conn)
         
         return {
             'statusCode': 200,
@@ -0,0 +1,13 @@
+-- Общие для всех инстансов счётчики rate limiting (GCRA)
+-- UNLOGGED: не пишутся в WAL, после сбоя БД таблица очищается - для лимитов это допустимо
+CREATE UNLOGGED TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.rate_limit_counters (
+    key VARCHAR(255) PRIMARY KEY,
+    tat DOUBLE PRECISION NOT NULL
+);
+
+-- Индекс для периодической очистки истёкших счётчиков
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_tat
+ON t_p18253922_infinite_business_ca.rate_limit_counters(tat);
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.rate_limit_counters IS 'Счётчики rate limiting, общие для всех инстансов функций';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.rate_limit_counters.tat IS 'Теоретическое время следующего запроса (unix epoch, секунды)';
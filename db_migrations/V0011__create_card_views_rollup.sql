@@ -0,0 +1,34 @@
+-- Дневные агрегаты просмотров визиток, поддерживаются инкрементально
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.card_views_daily (
+    card_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    visitor_sketch BYTEA,
+    top_referers JSONB NOT NULL DEFAULT '{}'::jsonb,
+    PRIMARY KEY (card_id, day)
+);
+
+-- Итоги за всё время, чтобы дашборд не суммировал всю историю
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.card_view_totals (
+    card_id INTEGER PRIMARY KEY,
+    views BIGINT NOT NULL DEFAULT 0,
+    days_active INTEGER NOT NULL DEFAULT 0,
+    visitor_sketch BYTEA,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Граница: просмотры с id не больше last_view_id уже учтены в агрегатах
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.card_views_rollup_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    last_view_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p18253922_infinite_business_ca.card_views_rollup_state (id, last_view_id)
+VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.card_views_daily IS 'Просмотры визиток по дням (card_views, свёрнутые инкрементально)';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.card_views_daily.visitor_sketch IS 'HyperLogLog-скетч уникальных IP за день';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.card_views_daily.top_referers IS 'Самые частые referer за день: {referer: count}';
+COMMENT ON TABLE t_p18253922_infinite_business_ca.card_view_totals IS 'Итоги просмотров визитки за всё время';
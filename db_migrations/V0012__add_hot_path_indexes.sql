@@ -0,0 +1,28 @@
+-- Индексы для горячих запросов функций
+-- short-urls читает визитку по UNIQUE-индексу short_url (V0003), лиды - по индексам из V0014
+-- Проверка планов на синтетических данных: python3 backend/benchmarks/explain_indexes.py
+
+-- analytics: последние просмотры визитки (card_id + ORDER BY viewed_at DESC LIMIT)
+CREATE INDEX IF NOT EXISTS idx_card_views_card_id_viewed_at
+ON t_p18253922_infinite_business_ca.card_views(card_id, viewed_at DESC);
+
+-- analytics: хвост просмотров визитки после границы свёртки (card_id + id > last_view_id)
+CREATE INDEX IF NOT EXISTS idx_card_views_card_id_id
+ON t_p18253922_infinite_business_ca.card_views(card_id, id);
+
+-- referral-stats: приглашённые пользователи, новые сверху
+CREATE INDEX IF NOT EXISTS idx_users_referred_by_created_at
+ON t_p18253922_infinite_business_ca.users(referred_by, created_at DESC)
+WHERE referred_by IS NOT NULL;
+
+-- referrals: владелец кода и рефералы пользователя, новые сверху
+CREATE INDEX IF NOT EXISTS idx_referrals_referral_code
+ON t_p18253922_infinite_business_ca.referrals(referral_code);
+
+CREATE INDEX IF NOT EXISTS idx_referrals_user_id_created_at
+ON t_p18253922_infinite_business_ca.referrals(user_id, created_at DESC);
+
+-- payments: поиск платежа по id у провайдера (вебхуки, сверка статусов)
+CREATE INDEX IF NOT EXISTS idx_payments_provider_payment_id
+ON t_p18253922_infinite_business_ca.payments(provider_payment_id)
+WHERE provider_payment_id IS NOT NULL;
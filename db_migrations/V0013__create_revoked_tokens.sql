@@ -0,0 +1,14 @@
+-- Отозванные JWT (выход со всех устройств, блокировка пользователя)
+-- Функции держат набор в памяти и перечитывают его раз в JWT_REVOCATION_REFRESH_SECONDS
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.revoked_tokens (
+    token_hash CHAR(64) PRIMARY KEY,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Для выборки ещё действующих токенов и очистки истёкших
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at
+ON t_p18253922_infinite_business_ca.revoked_tokens(expires_at);
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.revoked_tokens IS 'Отозванные JWT до истечения их срока';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.revoked_tokens.token_hash IS 'sha256 токена в hex';
@@ -0,0 +1,54 @@
+-- Счётчик непрочитанных лидов визитки, поддерживается триггером на card_leads
+-- Отдельная таблица, а не колонка business_cards: публичная визитка отдаётся через SELECT *
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.card_lead_counters (
+    card_id INTEGER PRIMARY KEY,
+    unread_count INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p18253922_infinite_business_ca.card_lead_counters (card_id, unread_count)
+SELECT card_id, COUNT(*)
+FROM t_p18253922_infinite_business_ca.card_leads
+WHERE is_read = FALSE
+GROUP BY card_id
+ON CONFLICT (card_id) DO UPDATE SET unread_count = EXCLUDED.unread_count;
+
+CREATE OR REPLACE FUNCTION t_p18253922_infinite_business_ca.card_leads_unread_counter()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_read IS FALSE THEN
+        UPDATE t_p18253922_infinite_business_ca.card_lead_counters
+        SET unread_count = unread_count - 1
+        WHERE card_id = OLD.card_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_read IS FALSE THEN
+        INSERT INTO t_p18253922_infinite_business_ca.card_lead_counters AS c (card_id, unread_count)
+        VALUES (NEW.card_id, 1)
+        ON CONFLICT (card_id) DO UPDATE SET unread_count = c.unread_count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_card_leads_unread_counter ON t_p18253922_infinite_business_ca.card_leads;
+CREATE TRIGGER trg_card_leads_unread_counter
+AFTER INSERT OR DELETE OR UPDATE OF is_read, card_id ON t_p18253922_infinite_business_ca.card_leads
+FOR EACH ROW EXECUTE FUNCTION t_p18253922_infinite_business_ca.card_leads_unread_counter();
+
+-- Постраничная выдача лидов по курсору (created_at, id), новые сверху
+-- Итоговый набор индексов card_leads: все лиды визитки и только непрочитанные
+CREATE INDEX IF NOT EXISTS idx_card_leads_card_id_created_at_id
+ON t_p18253922_infinite_business_ca.card_leads(card_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_card_leads_unread_created_at_id
+ON t_p18253922_infinite_business_ca.card_leads(card_id, created_at DESC, id DESC)
+WHERE is_read = FALSE;
+
+-- Индексы из V0004: по card_id покрывает префикс нового индекса, по is_read заменён
+-- частичным индексом и счётчиком, а по одному created_at не использует ни один запрос
+DROP INDEX IF EXISTS t_p18253922_infinite_business_ca.idx_card_leads_card_id;
+DROP INDEX IF EXISTS t_p18253922_infinite_business_ca.idx_card_leads_is_read;
+DROP INDEX IF EXISTS t_p18253922_infinite_business_ca.idx_card_leads_created_at;
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.card_lead_counters IS 'Число непрочитанных лидов визитки (триггер trg_card_leads_unread_counter)';
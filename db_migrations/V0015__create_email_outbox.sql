@@ -0,0 +1,25 @@
+-- Очередь исходящих писем (transactional outbox)
+-- Письмо записывается в той же транзакции, что и событие (например, новый лид),
+-- а отправляет его функция email-outbox пачками с повторами
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    to_email VARCHAR(255) NOT NULL,
+    subject VARCHAR(500) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Диспетчер выбирает только ожидающие письма, у которых подошло время попытки
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending_next_attempt
+ON t_p18253922_infinite_business_ca.email_outbox(next_attempt_at)
+WHERE status = 'pending';
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.email_outbox IS 'Исходящие письма, отправляются функцией email-outbox';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.email_outbox.status IS 'pending - ждёт отправки, sent - отправлено, failed - исчерпаны попытки';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.email_outbox.next_attempt_at IS 'Не раньше этого времени письмо берётся в отправку (экспоненциальная задержка после ошибок)';
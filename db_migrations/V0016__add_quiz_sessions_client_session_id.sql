@@ -0,0 +1,10 @@
+-- Идентификатор сессии на устройстве: киоски без сети копят сессии и присылают их пачкой
+-- при синхронизации, повторная отправка той же пачки не должна задваивать статистику
+ALTER TABLE t_p18253922_infinite_business_ca.quiz_sessions
+ADD COLUMN IF NOT EXISTS client_session_id VARCHAR(64);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_sessions_client_session_id
+ON t_p18253922_infinite_business_ca.quiz_sessions(client_session_id)
+WHERE client_session_id IS NOT NULL;
+
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.quiz_sessions.client_session_id IS 'Идентификатор сессии, присвоенный устройством (для идемпотентного импорта)';
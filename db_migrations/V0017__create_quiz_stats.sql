@@ -0,0 +1,35 @@
+-- Агрегаты аналитики тестов, обновляются в той же транзакции, что и запись сессии,
+-- поэтому GET /quiz-analytics не группирует всю историю quiz_sessions и quiz_answers.
+-- Заполнение по истории после выкладки: python3 backend/quiz_stats.py --rebuild
+
+-- Стабильный id вопроса по его тексту: первые 8 байт md5
+CREATE OR REPLACE FUNCTION t_p18253922_infinite_business_ca.quiz_question_id(question_text TEXT)
+RETURNS BIGINT AS $$
+    SELECT ('x' || left(md5(question_text), 16))::bit(64)::bigint
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.quiz_video_stats (
+    video_title VARCHAR(255) PRIMARY KEY,
+    sessions_count BIGINT NOT NULL DEFAULT 0,
+    -- Сессии с total_questions > 0, по ним считается процент правильных ответов
+    scored_count BIGINT NOT NULL DEFAULT 0,
+    score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    -- Сессии с известным временем прохождения
+    time_count BIGINT NOT NULL DEFAULT 0,
+    time_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    time_sq_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS t_p18253922_infinite_business_ca.quiz_question_stats (
+    question_id BIGINT PRIMARY KEY,
+    question_text TEXT NOT NULL,
+    answers_count BIGINT NOT NULL DEFAULT 0,
+    correct_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE t_p18253922_infinite_business_ca.quiz_video_stats IS 'Суммы по сессиям тестов одного видео: среднее и разброс считаются из count/sum/sum of squares';
+COMMENT ON TABLE t_p18253922_infinite_business_ca.quiz_question_stats IS 'Число ответов и правильных ответов на вопрос';
+COMMENT ON COLUMN t_p18253922_infinite_business_ca.quiz_question_stats.question_id IS 'quiz_question_id(question_text)';
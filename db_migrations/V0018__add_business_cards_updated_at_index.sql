@@ -0,0 +1,4 @@
+-- sitemap: MAX(updated_at) для ETag/Last-Modified читается с конца индекса, без обхода таблицы
+CREATE INDEX IF NOT EXISTS idx_business_cards_updated_at
+ON t_p18253922_infinite_business_ca.business_cards(updated_at)
+WHERE created_at IS NOT NULL;
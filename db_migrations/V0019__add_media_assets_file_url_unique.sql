@@ -0,0 +1,4 @@
+-- Прямые загрузки в хранилище: подтверждение загрузки (upload-image ?action=complete)
+-- может прийти повторно, один файл - одна запись
+CREATE UNIQUE INDEX IF NOT EXISTS idx_media_assets_file_url
+ON t_p18253922_infinite_business_ca.media_assets(file_url);
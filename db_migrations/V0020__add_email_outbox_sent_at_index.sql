@@ -0,0 +1,4 @@
+-- Очистка отправленных писем: purge_sent удаляет самые старые по sent_at пачками
+CREATE INDEX IF NOT EXISTS idx_email_outbox_sent_at
+ON t_p18253922_infinite_business_ca.email_outbox(sent_at)
+WHERE status = 'sent';